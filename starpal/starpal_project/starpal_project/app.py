@@ -3,15 +3,19 @@ StarPal AI聊天应用主文件
 重构后的模块化版本
 """
 import os
+import sys
 import pymysql
-from flask import Flask
+from flask import Flask, Response, g, request
 from flask_cors import CORS
 
-from backend.config.config import config
+from backend.config.config import DEFAULT_SECRET_KEY, config, print_config_summary
 from backend.models import init_db
+from backend.services.history_store import history_store
 from backend.routes.auth import auth_bp
 from backend.routes.chat import chat_bp
 from backend.routes.memory import memory_bp
+from backend.services import metrics
+from backend.services.tracing import normalize_request_id
 
 # 加载 PyMySQL 驱动
 pymysql.install_as_MySQLdb()
@@ -27,6 +31,8 @@ def create_app(config_name=None):
         Flask: 配置好的Flask应用实例
     """
     
+    print_config_summary()
+    
     # 创建Flask应用
     app = Flask(__name__, static_folder='static')
     
@@ -36,12 +42,21 @@ def create_app(config_name=None):
     
     app.config.from_object(config[config_name])
     
+    # 令牌使用SECRET_KEY签名，默认密钥是公开的，非调试模式下使用会让任何人都能伪造令牌
+    if app.config['SECRET_KEY'] == DEFAULT_SECRET_KEY:
+        if not app.config['DEBUG']:
+            raise RuntimeError("未配置SECRET_KEY，非调试模式下不能使用默认密钥签发令牌，请在.env文件中配置SECRET_KEY")
+        print("警告: 正在使用默认的SECRET_KEY签发令牌，请在.env文件中配置SECRET_KEY")
+    
     # 启用CORS支持
     CORS(app)
     
     # 初始化数据库
     init_db(app)
     
+    # 初始化对话历史持久化
+    history_store.init_app(app)
+    
     # 注册蓝图（路由模块）
     app.register_blueprint(auth_bp)
     app.register_blueprint(chat_bp)
@@ -50,12 +65,36 @@ def create_app(config_name=None):
     # 注册错误处理器
     register_error_handlers(app)
     
+    # 请求ID：沿用客户端传入的 X-Request-ID 或生成新的ID，并在响应头中返回
+    @app.before_request
+    def assign_request_id():
+        g.request_id = normalize_request_id(request.headers.get('X-Request-ID'))
+    
+    @app.after_request
+    def add_request_id_header(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        return response
+    
+    # 后台预热到通义千问/Mem0的出站连接
+    app_config = config[config_name]
+    if app_config.HTTP_POOL_WARMUP_CONNECTIONS:
+        from backend.services.http_pool import http_pool, warmup_targets
+        http_pool.start_warmup(warmup_targets(app_config), app_config.HTTP_POOL_WARMUP_CONNECTIONS)
+    
     # 健康检查路由
     @app.route('/health')
     def health_check():
         """健康检查接口"""
         return {'status': 'healthy', 'service': 'StarPal AI Chat'}, 200
     
+    # 监控指标（Prometheus文本格式）
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """监控指标接口"""
+        return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+    
     return app
 
 def register_error_handlers(app):
@@ -82,6 +121,12 @@ def register_error_handlers(app):
         return {'message': '请求参数错误'}, 400
 
 if __name__ == '__main__':
+    # 分析启动耗时：python app.py --profile-startup
+    if '--profile-startup' in sys.argv:
+        from backend.services.startup_profile import profile_startup
+        project_dir = os.path.dirname(os.path.abspath(__file__))
+        sys.exit(profile_startup(project_dir, config['default'].STARTUP_TARGET_MS))
+    
     # 创建应用实例
     app = create_app()
     
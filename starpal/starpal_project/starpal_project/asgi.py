@@ -0,0 +1,51 @@
+"""
+ASGI入口
+/api/chat 由异步路由处理，单个worker可同时保持大量SSE连接；
+其余接口通过WSGI适配器交给Flask应用处理。
+
+启动方式: uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Mount, Route
+
+from app import create_app
+from backend.config.config import Config
+from backend.routes.chat_async import chat_async
+from backend.services.ai_service import ai_service
+
+flask_app = create_app()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    启动时在后台预热异步出站连接（流式聊天使用异步客户端，与Flask接口的同步连接分开），
+    并在线程中创建长期记忆后端与Mem0异步客户端（两者的构造都会同步请求Mem0）
+    """
+    await asyncio.to_thread(ai_service.prepare_async_memory)
+    warmup = None
+    if Config.HTTP_POOL_WARMUP_CONNECTIONS:
+        from backend.services.http_pool import http_pool, warmup_targets
+        warmup = asyncio.create_task(
+            http_pool.awarmup(warmup_targets(Config), Config.HTTP_POOL_WARMUP_CONNECTIONS)
+        )
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+
+app = Starlette(
+    routes=[
+        # Flask应用已由Flask-CORS处理跨域，这里只为异步路由单独启用CORS（OPTIONS用于预检请求）
+        Route('/api/chat', chat_async, methods=['POST', 'OPTIONS'], middleware=[
+            Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        ]),
+        Mount('/', app=WsgiToAsgi(flask_app)),
+    ],
+    lifespan=lifespan,
+)
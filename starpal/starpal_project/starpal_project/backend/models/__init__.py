@@ -2,6 +2,7 @@
 数据库初始化模块
 """
 from flask_sqlalchemy import SQLAlchemy
+from backend.services.metrics import instrument_engine
 
 # 创建数据库实例
 db = SQLAlchemy()
@@ -16,6 +17,9 @@ def init_db(app):
     db.init_app(app)
     
     with app.app_context():
+        # 记录每条SQL语句的执行耗时
+        instrument_engine(db.engine)
+        
         # 创建所有表
         db.create_all()
         print("数据库初始化完成")
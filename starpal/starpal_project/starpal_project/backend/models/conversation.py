@@ -0,0 +1,114 @@
+"""
+对话历史数据模型
+"""
+from backend.models import db
+from datetime import datetime
+
+class Conversation(db.Model):
+    """
+    对话模型
+
+    Attributes:
+        id: 对话唯一标识
+        user_id: 用户名（与Mem0的user_id保持一致）
+        chat_id: 前端生成的对话ID
+        message_count: 已持久化的消息数量，同时作为下一条消息的序号
+        created_at: 创建时间
+        updated_at: 更新时间
+    """
+
+    __tablename__ = 'conversations'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'chat_id', name='uq_conversations_user_chat'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, comment='对话ID')
+    user_id = db.Column(db.String(80), nullable=False, comment='用户名')
+    chat_id = db.Column(db.String(64), nullable=False, comment='前端对话ID')
+    message_count = db.Column(db.Integer, nullable=False, default=0, comment='消息数量')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, comment='创建时间')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment='更新时间')
+
+    def __repr__(self):
+        """字符串表示"""
+        return f'<Conversation {self.user_id}/{self.chat_id}>'
+
+    @staticmethod
+    def find(user_id, chat_id):
+        """
+        查找对话
+
+        Args:
+            user_id: 用户名
+            chat_id: 对话ID
+
+        Returns:
+            Conversation: 对话对象或None
+        """
+        return Conversation.query.filter_by(user_id=user_id, chat_id=chat_id).first()
+
+
+class Message(db.Model):
+    """
+    对话消息模型
+
+    Attributes:
+        id: 消息唯一标识
+        user_id: 用户名
+        chat_id: 对话ID
+        seq: 消息在对话中的序号（从0开始递增，同一对话内唯一）
+        role: 消息角色 'user' 或 'assistant'
+        content: 消息内容
+        created_at: 创建时间
+    """
+
+    __tablename__ = 'messages'
+    __table_args__ = (
+        db.Index('ix_messages_user_chat_seq', 'user_id', 'chat_id', 'seq', unique=True),
+    )
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, comment='消息ID')
+    user_id = db.Column(db.String(80), nullable=False, comment='用户名')
+    chat_id = db.Column(db.String(64), nullable=False, comment='对话ID')
+    seq = db.Column(db.Integer, nullable=False, comment='消息序号')
+    role = db.Column(db.String(16), nullable=False, comment='消息角色')
+    content = db.Column(db.Text(length=16777215), nullable=False, comment='消息内容')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, comment='创建时间')
+
+    def __repr__(self):
+        """字符串表示"""
+        return f'<Message {self.user_id}/{self.chat_id}#{self.seq}>'
+
+    @staticmethod
+    def load_recent(user_id, chat_id, limit):
+        """
+        按序号顺序加载对话最近的消息
+
+        Args:
+            user_id: 用户名
+            chat_id: 对话ID
+            limit: 最多加载的消息数量
+
+        Returns:
+            list: Message对象列表（按序号升序）
+        """
+        rows = (Message.query
+                .filter_by(user_id=user_id, chat_id=chat_id)
+                .order_by(Message.seq.desc())
+                .limit(limit)
+                .all())
+        rows.reverse()
+        return rows
+
+    @staticmethod
+    def delete_history(user_id, chat_id):
+        """
+        删除对话的全部消息及对话记录
+
+        Args:
+            user_id: 用户名
+            chat_id: 对话ID
+        """
+        Message.query.filter_by(user_id=user_id, chat_id=chat_id).delete(synchronize_session=False)
+        Conversation.query.filter_by(user_id=user_id, chat_id=chat_id).delete(synchronize_session=False)
+        db.session.commit()
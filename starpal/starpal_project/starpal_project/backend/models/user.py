@@ -2,8 +2,15 @@
 用户数据模型
 """
 from backend.models import db
+from backend.services.password_hasher import password_hasher
 from datetime import datetime
 
+
+def _utcnow_seconds():
+    """当前UTC时间，截断到秒（MySQL的DATETIME只保存到秒，写入时会四舍五入，令牌撤销检查按秒比较）"""
+    return datetime.utcnow().replace(microsecond=0)
+
+
 class User(db.Model):
     """
     用户模型
@@ -11,7 +18,7 @@ class User(db.Model):
     Attributes:
         id: 用户唯一标识
         username: 用户名（邮箱）
-        password: 密码（实际项目中应加密存储）
+        password: 密码哈希（scrypt，旧数据可能为明文，登录成功时自动升级）
         name: 用户显示名称
         created_at: 创建时间
         updated_at: 更新时间
@@ -24,7 +31,7 @@ class User(db.Model):
     password = db.Column(db.String(120), nullable=False, comment='密码')
     name = db.Column(db.String(80), nullable=False, comment='显示名称')
     created_at = db.Column(db.DateTime, default=datetime.utcnow, comment='创建时间')
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment='更新时间')
+    updated_at = db.Column(db.DateTime, default=_utcnow_seconds, onupdate=_utcnow_seconds, comment='更新时间')
 
     def __repr__(self):
         """字符串表示"""
@@ -60,13 +67,13 @@ class User(db.Model):
         
         Args:
             username: 用户名
-            password: 密码
+            password: 明文密码
             name: 显示名称
             
         Returns:
             User: 新创建的用户对象
         """
-        user = User(username=username, password=password, name=name)
+        user = User(username=username, password=password_hasher.hash(password), name=name)
         db.session.add(user)
         db.session.commit()
         return user
@@ -78,8 +85,8 @@ class User(db.Model):
         Args:
             new_password: 新密码
         """
-        self.password = new_password
-        self.updated_at = datetime.utcnow()
+        self.password = password_hasher.hash(new_password)
+        self.updated_at = _utcnow_seconds()
         db.session.commit()
     
     def verify_password(self, password):
@@ -92,4 +99,29 @@ class User(db.Model):
         Returns:
             bool: 密码是否正确
         """
-        return self.password == password
+        ok, needs_rehash = password_hasher.verify(password, self.password)
+        if needs_rehash:
+            self._rehash_password(password)
+        return ok
+    
+    def _rehash_password(self, password):
+        """
+        按当前参数重新哈希密码（明文旧数据或哈希参数已调整）
+        
+        不修改 updated_at，避免已签发的身份令牌被视为密码已修改而失效；失败时不影响登录。
+        
+        Args:
+            password: 已验证通过的明文密码
+        """
+        try:
+            new_hash = password_hasher.hash(password)
+            User.query.filter_by(id=self.id).update(
+                {User.password: new_hash, User.updated_at: User.updated_at},
+                synchronize_session=False
+            )
+            db.session.commit()
+            self.password = new_hash
+            password_hasher.record_rehash()
+        except Exception as e:
+            db.session.rollback()
+            print(f"密码重新哈希失败: {e}")
@@ -5,9 +5,13 @@
 from flask import Blueprint, request, jsonify
 from backend.models.user import User
 from backend.services.validation import validate_request_data, validate_email, validate_password_strength
+from backend.services.token_service import token_service
+from backend.services.password_hasher import HasherBusy
+from backend.services.metrics import instrument_blueprint
 
 # 创建蓝图
 auth_bp = Blueprint('auth', __name__, url_prefix='/api')
+instrument_blueprint(auth_bp)
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -56,6 +60,9 @@ def register():
         
         return jsonify({'message': '注册成功，请登录！'}), 201
 
+    except HasherBusy:
+        return jsonify({'message': '当前请求人数较多，请稍后重试'}), 503
+
     except Exception as e:
         print(f"注册错误: {e}")
         return jsonify({'message': '注册失败，请稍后重试'}), 500
@@ -92,13 +99,17 @@ def login():
         if not user.verify_password(password):
             return jsonify({'message': '密码错误！'}), 401
 
-        # 登录成功，返回用户信息
+        # 登录成功，返回用户信息及身份令牌
         return jsonify({
             'message': '登录成功',
             'username': user.username,
-            'name': user.name
+            'name': user.name,
+            'token': token_service.issue(user.username, user.name)
         }), 200
 
+    except HasherBusy:
+        return jsonify({'message': '当前请求人数较多，请稍后重试'}), 503
+
     except Exception as e:
         print(f"登录错误: {e}")
         return jsonify({'message': '登录失败，请稍后重试'}), 500
@@ -142,11 +153,15 @@ def change_password():
         if not user.verify_password(old_password):
             return jsonify({'message': '原密码错误！'}), 401
 
-        # 更新密码
+        # 更新密码，之前签发的令牌随之失效
         user.update_password(new_password)
+        token_service.forget(username)
         
         return jsonify({'message': '密码修改成功，请使用新密码登录！'}), 200
 
+    except HasherBusy:
+        return jsonify({'message': '当前请求人数较多，请稍后重试'}), 503
+
     except Exception as e:
         print(f"修改密码错误: {e}")
         return jsonify({'message': '修改密码失败，请稍后重试'}), 500
@@ -2,12 +2,21 @@
 聊天相关路由
 包括AI对话功能
 """
-from flask import Blueprint, request, Response
+from flask import Blueprint, request, Response, g
 from backend.services.ai_service import ai_service
-from backend.services.validation import validate_request_data
+from backend.services.admission import chat_admission, AdmissionRejected
+from backend.services.history_store import history_store
+from backend.services.token_service import token_service
+from backend.services.password_hasher import password_hasher
+from backend.services.validation import validate_request_data, validate_chat_identity
+from backend.services.metrics import instrument_blueprint
+from backend.services.request_capture import capture_blueprint, request_capture
+from backend.services.tracing import tracer
 
 # 创建蓝图
 chat_bp = Blueprint('chat', __name__, url_prefix='/api')
+instrument_blueprint(chat_bp)
+capture_blueprint(chat_bp)
 
 @chat_bp.route('/chat', methods=['POST'])
 def chat():
@@ -54,17 +63,37 @@ def chat():
                 mimetype='text/event-stream'
             ), 400
 
+        is_valid, error_msg = validate_chat_identity(username, chat_id)
+        if not is_valid:
+            return Response(
+                f"data: {{'error': '{error_msg}'}}\n\n",
+                mimetype='text/event-stream'
+            ), 400
+
+        # 获取准入许可，并发已满时排队等待
+        try:
+            permit = chat_admission.acquire(username)
+        except AdmissionRejected as e:
+            return busy_response(e)
+
         # 调用通义千问AI服务进行流式聊天
+        request_id = g.request_id
+        
         def generate():
             """生成器函数，用于流式响应"""
             try:
-                for chunk in ai_service.chat_stream(message, username, chat_id, system_prompt):
+                for chunk in ai_service.chat_stream(message, username, chat_id, system_prompt, request_id):
                     yield chunk
             except Exception as e:
                 print(f"通义千问聊天流式响应错误: {e}")
                 yield f"data: {{'error': '通义千问AI服务暂时不可用，请检查API配置或稍后重试'}}\n\n"
+            finally:
+                permit.release()
 
-        return Response(generate(), mimetype='text/event-stream')
+        response = Response(generate(), mimetype='text/event-stream')
+        # 客户端在响应开始前断开时生成器不会执行，由关闭回调归还许可
+        response.call_on_close(permit.release)
+        return response
 
     except Exception as e:
         print(f"通义千问聊天错误: {e}")
@@ -73,6 +102,36 @@ def chat():
             mimetype='text/event-stream'
         ), 500
 
+def busy_message(rejection):
+    """
+    生成未获准入时返回给客户端的SSE错误帧
+    
+    Args:
+        rejection: AdmissionRejected异常
+        
+    Returns:
+        str: SSE格式的错误信息
+    """
+    message = '您的对话请求过多，请等待当前回复完成' if rejection.reason == 'user_limit' else '当前请求人数较多，请稍后重试'
+    return f"data: {{'error': '{message}'}}\n\n"
+
+def busy_response(rejection):
+    """
+    构建服务繁忙时的429响应
+    
+    Args:
+        rejection: AdmissionRejected异常
+        
+    Returns:
+        Response: 带 Retry-After 头的SSE格式错误响应
+    """
+    return Response(
+        busy_message(rejection),
+        status=429,
+        headers={'Retry-After': str(rejection.retry_after)},
+        mimetype='text/event-stream'
+    )
+
 @chat_bp.route('/clear_memory', methods=['POST'])
 def clear_memory():
     """
@@ -114,8 +173,26 @@ def memory_stats():
         JSON响应包含记忆统计信息
     """
     try:
+        from backend.services.http_pool import http_pool
+        
         stats = {
             'active_conversations': ai_service.get_memory_count(),
+            'session_store': ai_service.get_session_stats(),
+            'context': ai_service.get_context_stats(),
+            'memory_ranker': ai_service.get_memory_ranker_stats(),
+            'memory_batch': ai_service.get_memory_batch_stats(),
+            'mem0_write_queue': ai_service.get_write_queue_stats(),
+            'timing': ai_service.get_stage_stats(),
+            'sse': ai_service.get_stream_stats(),
+            'response_cache': ai_service.get_response_cache_stats(),
+            'admission': chat_admission.stats(),
+            'conversation_locks': ai_service.get_lock_stats(),
+            'auth_tokens': token_service.stats(),
+            'password_hasher': password_hasher.stats(),
+            'http_pool': http_pool.stats(),
+            'tracing': tracer.stats(),
+            'request_capture': request_capture.stats(),
+            'history_store': history_store.stats(),
             'status': 'healthy'
         }
         return stats, 200
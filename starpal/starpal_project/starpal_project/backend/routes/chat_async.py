@@ -0,0 +1,183 @@
+"""
+异步聊天路由
+供ASGI服务器使用的流式聊天接口，请求参数与SSE输出格式与 chat.py 中的 /api/chat 完全一致
+"""
+import time
+
+from starlette.responses import StreamingResponse
+
+from backend.routes.chat import busy_message
+from backend.services import metrics
+from backend.services.ai_service import ai_service
+from backend.services.admission import chat_admission, AdmissionRejected, acquire_in_thread
+from backend.services.request_capture import request_capture
+from backend.services.tracing import normalize_request_id
+from backend.services.validation import validate_request_data, validate_chat_identity
+
+
+def sse_response(content, status_code=200, headers=None):
+    """
+    构建Server-Sent Events响应
+
+    Args:
+        content: 字符串或异步生成器
+        status_code: HTTP状态码
+        headers: 额外的响应头
+
+    Returns:
+        StreamingResponse: 流式响应
+    """
+    if isinstance(content, str):
+        body = content
+
+        async def content():
+            yield body
+
+        content = content()
+    return StreamingResponse(content, status_code=status_code, headers=headers, media_type='text/event-stream')
+
+
+class PermitStreamingResponse(StreamingResponse):
+    """
+    持有准入许可的流式响应
+
+    响应体生成器中的 finally 只在生成器开始迭代后才会执行：客户端在开始输出前断开、
+    或发送失败（Starlette 直接抛出 ClientDisconnect，后台任务也不会执行）时，
+    需要在这里归还许可并关闭生成器。许可的 release() 可重复调用。
+    """
+
+    def __init__(self, content, permit, **kwargs):
+        super().__init__(content, **kwargs)
+        self.permit = permit
+        self._on_close = []
+
+    def call_on_close(self, func):
+        """注册在响应结束（包括客户端断开）时调用的函数"""
+        self._on_close.append(func)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.permit.release()
+            for func in self._on_close:
+                try:
+                    func()
+                except Exception as e:
+                    print(f"流式响应关闭回调执行失败: {e}")
+            aclose = getattr(self.body_iterator, 'aclose', None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception as e:
+                    print(f"关闭流式响应失败: {e}")
+
+
+async def chat_async(request):
+    """
+    AI聊天接口（异步流式响应）
+
+    请求参数:
+        message: 用户消息
+        username: 用户名
+        chat_id: 对话ID
+        system_prompt: (可选) 系统提示词
+
+    返回:
+        流式响应，Server-Sent Events格式
+    """
+    start = time.perf_counter()
+    capture_time = request_capture.timestamp() if request_capture.enabled else None
+    response = await _chat_response(request)
+    # 与Flask蓝图的接口耗时统计使用相同的指标与标签（流式接口不含流式输出时间）
+    metrics.HTTP_REQUESTS.labels('chat', 'chat.chat', response.status_code).observe(time.perf_counter() - start)
+    if capture_time is not None:
+        await _capture_request(request, response, start, capture_time)
+    return response
+
+
+async def _capture_request(request, response, start, capture_time):
+    """按与Flask蓝图相同的格式录制请求，流式响应在输出结束时记录总耗时"""
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    username = body.get('username') if isinstance(body, dict) else None
+    entry = request_capture.make_entry(
+        capture_time, username, request.method, '/api/chat', request.url.path,
+        request.headers.get('Authorization', '').startswith('Bearer '),
+        body, dict(request.query_params), response.status_code
+    )
+    if entry is None:
+        return
+
+    def finish():
+        entry['d'] = round((time.perf_counter() - start) * 1000, 2)
+        request_capture.record(entry)
+
+    if isinstance(response, PermitStreamingResponse):
+        response.call_on_close(finish)
+    else:
+        finish()
+
+
+async def _chat_response(request):
+    """校验请求、获取准入许可并构建流式响应"""
+    # 请求ID：沿用客户端传入的 X-Request-ID 或生成新的ID，并在响应头中返回
+    request_id = normalize_request_id(request.headers.get('X-Request-ID'))
+    headers = {'X-Request-ID': request_id}
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+
+        # 验证请求数据
+        is_valid, error_msg = validate_request_data(data, ['message', 'username', 'chat_id'])
+        if not is_valid:
+            return sse_response(f"data: {{'error': '{error_msg}'}}\n\n", 400, headers)
+
+        message = data['message'].strip()
+        username = data['username'].strip()
+        chat_id = data['chat_id'].strip()
+
+        # 获取可选的系统提示词
+        system_prompt = data.get('system_prompt')
+
+        # 验证消息长度
+        if not message:
+            return sse_response(f"data: {{'error': '消息不能为空'}}\n\n", 400, headers)
+
+        if len(message) > 1000:
+            return sse_response(f"data: {{'error': '消息长度不能超过1000个字符'}}\n\n", 400, headers)
+
+        is_valid, error_msg = validate_chat_identity(username, chat_id)
+        if not is_valid:
+            return sse_response(f"data: {{'error': '{error_msg}'}}\n\n", 400, headers)
+
+        # 获取准入许可，排队等待在线程中进行，不阻塞事件循环
+        try:
+            permit = await acquire_in_thread(chat_admission.acquire, username)
+        except AdmissionRejected as e:
+            return sse_response(busy_message(e), 429, {**headers, 'Retry-After': str(e.retry_after)})
+
+        async def generate():
+            """异步生成器函数，用于流式响应"""
+            try:
+                async for chunk in ai_service.achat_stream(message, username, chat_id, system_prompt, request_id):
+                    yield chunk
+            except Exception as e:
+                print(f"通义千问聊天流式响应错误: {e}")
+                yield f"data: {{'error': '通义千问AI服务暂时不可用，请检查API配置或稍后重试'}}\n\n"
+            finally:
+                permit.release()
+
+        return PermitStreamingResponse(generate(), permit, headers=headers, media_type='text/event-stream')
+
+    except Exception as e:
+        print(f"通义千问聊天错误: {e}")
+        return sse_response(
+            f"data: {{'error': '通义千问AI服务暂时不可用，请检查API配置或稍后重试'}}\n\n",
+            500,
+            headers
+        )
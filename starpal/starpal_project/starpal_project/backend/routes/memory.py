@@ -3,11 +3,16 @@
 提供长期记忆管理的API接口
 """
 from flask import Blueprint, request, jsonify, current_app
+from backend.config.config import Config
 from backend.services.ai_service import ai_service
 from backend.services.validation import validate_token
+from backend.services.metrics import instrument_blueprint
+from backend.services.request_capture import capture_blueprint
 
 # 创建蓝图
 memory_bp = Blueprint('memory', __name__, url_prefix='/api/memory')
+instrument_blueprint(memory_bp)
+capture_blueprint(memory_bp)
 
 @memory_bp.route('/status', methods=['GET'])
 @validate_token
@@ -22,12 +27,32 @@ def get_memory_status(current_user):
 @memory_bp.route('/long-term', methods=['GET'])
 @validate_token
 def get_long_term_memories(current_user):
-    """获取用户的长期记忆"""
+    """获取用户的长期记忆（游标分页，支持 If-None-Match 条件请求）"""
     username = current_user['username']
     limit = request.args.get('limit', default=10, type=int)
+    cursor = request.args.get('cursor') or None
     
-    result = ai_service.get_long_term_memories(username, limit)
-    return jsonify(result)
+    try:
+        etag = ai_service.get_long_term_memories_etag(username, limit, cursor)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    # 记忆版本未变化时直接返回304，不访问Mem0
+    if etag and request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        result = ai_service.get_long_term_memories(username, limit, cursor)
+        response = jsonify(result)
+        if not result.get('success'):
+            return response
+    if etag:
+        response.set_etag(etag, weak=True)
+        # 允许浏览器缓存，但每次使用前必须携带 If-None-Match 重新验证
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @memory_bp.route('/long-term', methods=['DELETE'])
 @validate_token
@@ -54,7 +79,9 @@ def update_memory(current_user, memory_id):
         }), 400
     
     metadata = data.get('metadata')
-    success, message = ai_service.update_long_term_memory(memory_id, data['text'], metadata)
+    success, message = ai_service.update_long_term_memory(
+        memory_id, data['text'], metadata, username=current_user['username']
+    )
     
     return jsonify({
         'success': success,
@@ -65,9 +92,30 @@ def update_memory(current_user, memory_id):
 @validate_token
 def delete_memory(current_user, memory_id):
     """删除特定的长期记忆"""
-    success, message = ai_service.delete_long_term_memory(memory_id)
+    success, message = ai_service.delete_long_term_memory(memory_id, username=current_user['username'])
     
     return jsonify({
         'success': success,
         'message': message
     })
+
+@memory_bp.route('/long-term/batch', methods=['POST'])
+@validate_token
+def batch_memories(current_user):
+    """批量更新/删除长期记忆，返回每项操作的结果"""
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    
+    if not isinstance(operations, list) or not operations:
+        return jsonify({
+            'success': False,
+            'message': '缺少要执行的操作'
+        }), 400
+    if len(operations) > Config.MEMORY_BATCH_MAX_OPERATIONS:
+        return jsonify({
+            'success': False,
+            'message': f'单次最多执行 {Config.MEMORY_BATCH_MAX_OPERATIONS} 个操作'
+        }), 400
+    
+    result = ai_service.batch_long_term_memories(operations, username=current_user['username'])
+    return jsonify(result)
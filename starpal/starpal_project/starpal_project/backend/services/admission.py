@@ -0,0 +1,226 @@
+"""
+准入控制模块
+限制同时进行的模型流式请求数量（全局与每个用户），超出时排队等待，队列满或等待超时则拒绝
+"""
+import asyncio
+import functools
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.config.config import Config
+
+
+class AdmissionRejected(Exception):
+    """
+    请求未获准入
+
+    Attributes:
+        reason: 拒绝原因 'user_limit'（用户并发超限）、'queue_full'（等待队列已满）或 'timeout'（等待超时）
+        retry_after: 建议客户端重试前等待的秒数
+    """
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionPermit:
+    """准入许可，请求结束时调用 release() 归还，重复调用无副作用"""
+
+    def __init__(self, controller, user_id):
+        self.controller = controller
+        self.user_id = user_id
+        self.acquired_at = controller.clock()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.controller._release(self)
+
+
+class AdmissionController:
+    """
+    并发准入控制器
+
+    全局并发数达到上限时请求按到达顺序排队，队列长度和等待时间都有上限；
+    单个用户的并发数达到上限时直接拒绝，避免一个用户占满全局名额。
+    上限为0表示不限制。控制器只在当前进程内生效，多worker部署时每个worker各自计数。
+    """
+
+    def __init__(self, max_concurrent=0, max_per_user=0, max_queue=0, queue_timeout=10.0,
+                 clock=time.monotonic):
+        """
+        初始化准入控制器
+
+        Args:
+            max_concurrent: 全局最大并发数
+            max_per_user: 每个用户的最大并发数
+            max_queue: 等待队列的最大长度，0表示不排队（全局并发满时直接拒绝）
+            queue_timeout: 排队等待的最长秒数
+            clock: 时钟函数（便于测试替换）
+        """
+        self.max_concurrent = max_concurrent or None
+        self.max_per_user = max_per_user or None
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.clock = clock
+
+        self._cond = threading.Condition()
+        self._waiters = deque()
+        self._active = 0
+        self._active_by_user = {}
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {'user_limit': 0, 'queue_full': 0, 'timeout': 0}
+        self.peak_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        # 请求占用名额时长的指数移动平均，用于估算 Retry-After
+        self.avg_hold = 5.0
+
+    def acquire(self, user_id):
+        """
+        获取准入许可，必要时排队等待
+
+        Args:
+            user_id: 用户名
+
+        Returns:
+            AdmissionPermit: 准入许可
+
+        Raises:
+            AdmissionRejected: 用户并发超限、等待队列已满或等待超时
+        """
+        start = self.clock()
+        with self._cond:
+            if self.max_per_user is not None and self._active_by_user.get(user_id, 0) >= self.max_per_user:
+                self.rejected['user_limit'] += 1
+                raise AdmissionRejected('user_limit', self._retry_after(1))
+
+            if not self._has_capacity() or self._waiters:
+                if len(self._waiters) >= self.max_queue:
+                    self.rejected['queue_full'] += 1
+                    raise AdmissionRejected('queue_full', self._retry_after(len(self._waiters) + 1))
+
+                waiter = object()
+                self._waiters.append(waiter)
+                self.queued += 1
+                self.peak_queue_depth = max(self.peak_queue_depth, len(self._waiters))
+                deadline = start + self.queue_timeout
+                try:
+                    while self._waiters[0] is not waiter or not self._has_capacity():
+                        remaining = deadline - self.clock()
+                        if remaining <= 0:
+                            self.rejected['timeout'] += 1
+                            raise AdmissionRejected('timeout', self._retry_after(len(self._waiters)))
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiters.remove(waiter)
+                    # 队首变化后唤醒其余等待者重新检查
+                    self._cond.notify_all()
+
+                # 排队期间同一用户的其他请求可能已占满名额
+                if self.max_per_user is not None and self._active_by_user.get(user_id, 0) >= self.max_per_user:
+                    self.rejected['user_limit'] += 1
+                    raise AdmissionRejected('user_limit', self._retry_after(1))
+
+            self._active += 1
+            self._active_by_user[user_id] = self._active_by_user.get(user_id, 0) + 1
+            self.admitted += 1
+            waited = self.clock() - start
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            return AdmissionPermit(self, user_id)
+
+    def stats(self):
+        """
+        获取准入统计信息
+
+        Returns:
+            dict: 当前并发数、队列深度、累计准入/拒绝次数及等待时间
+        """
+        with self._cond:
+            return {
+                'active': self._active,
+                'active_users': len(self._active_by_user),
+                'queue_depth': len(self._waiters),
+                'peak_queue_depth': self.peak_queue_depth,
+                'max_concurrent': self.max_concurrent,
+                'max_per_user': self.max_per_user,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected': dict(self.rejected),
+                'avg_wait_ms': round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+                'avg_hold_seconds': round(self.avg_hold, 2)
+            }
+
+    def _has_capacity(self):
+        return self.max_concurrent is None or self._active < self.max_concurrent
+
+    def _retry_after(self, position):
+        """按平均占用时长估算排在第position位的请求需要等待的秒数"""
+        slots = self.max_concurrent or 1
+        return min(60, max(1, math.ceil(self.avg_hold * position / slots)))
+
+    def _release(self, permit):
+        with self._cond:
+            self._active -= 1
+            remaining = self._active_by_user.get(permit.user_id, 0) - 1
+            if remaining > 0:
+                self._active_by_user[permit.user_id] = remaining
+            else:
+                self._active_by_user.pop(permit.user_id, None)
+            held = self.clock() - permit.acquired_at
+            self.avg_hold = 0.9 * self.avg_hold + 0.1 * held
+            self._cond.notify_all()
+
+
+async def acquire_in_thread(acquire, *args):
+    """
+    在线程中执行阻塞的许可获取，供异步代码使用
+
+    等待在专用线程池中进行：排队可能持续数十秒，若占用事件循环的默认线程池，
+    其他轮次在线程中执行的准备与收尾步骤都会被阻塞。
+    等待期间协程被取消（如客户端断开）时，线程稍后拿到的许可会被自动归还。
+
+    Args:
+        acquire: 返回许可对象（带 release 方法）的阻塞函数
+        *args: 传给acquire的参数
+
+    Returns:
+        获取到的许可对象
+    """
+    task = asyncio.get_running_loop().run_in_executor(_wait_executor, functools.partial(acquire, *args))
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        task.add_done_callback(_release_result)
+        raise
+
+
+def _release_result(task):
+    if not task.cancelled() and task.exception() is None:
+        task.result().release()
+
+
+# 异步代码等待许可的线程池，线程按需创建
+_wait_executor = ThreadPoolExecutor(max_workers=Config.ASYNC_WAIT_WORKERS, thread_name_prefix='permit-wait')
+
+# 全局聊天请求准入控制器，同步与异步聊天接口共用
+chat_admission = AdmissionController(
+    max_concurrent=Config.CHAT_MAX_CONCURRENT,
+    max_per_user=Config.CHAT_MAX_PER_USER,
+    max_queue=Config.CHAT_QUEUE_SIZE,
+    queue_timeout=Config.CHAT_QUEUE_TIMEOUT
+)
@@ -2,68 +2,332 @@
 AI聊天服务模块 - 通义千问
 集成Mem0长期记忆功能
 """
+import asyncio
+import atexit
 import json
+import threading
 import time
-from langchain.memory import ConversationBufferMemory
-from langchain_openai import ChatOpenAI
-from langchain.schema import SystemMessage
-from mem0 import MemoryClient
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from backend.config.config import Config
+from backend.services.session_store import LRUSessionStore, SharedSessionStore, default_sizeof
+from backend.services.shared_state import create_state_backend
+from backend.services.context_builder import ContextBuilder
+from backend.services.write_behind import WriteBehindQueue
+from backend.services.stage_timer import StageTimer, StageStats
+from backend.services.retrieval_cache import RetrievalCache
+from backend.services.memory_backend import create_memory_backend
+from backend.services.history_store import history_store
+from backend.services.sse import SSECoalescer, SSEStats, encode_event
+from backend.services.conversation_lock import ConversationLockManager, ConversationBusy
+from backend.services.response_cache import ResponseCache
+from backend.services.memory_listing import MemoryVersions, decode_cursor, encode_cursor, make_etag
+from backend.services import metrics
+from backend.services.tracing import tracer
+from backend.services.admission import acquire_in_thread
+
+
+def _conversation_memory_size(memory):
+    """
+    估算对话记忆占用的字节数
+
+    Args:
+        memory: ConversationBufferMemory对象
+
+    Returns:
+        int: 估算字节数
+    """
+    size = 0
+    for msg in memory.chat_memory.messages:
+        content = msg.content if isinstance(msg.content, str) else str(msg.content)
+        # 每条消息额外计入对象本身的固定开销
+        size += len(content.encode('utf-8')) + 200
+    return size
+
+
+def _dump_conversation_memory(memory):
+    """将对话记忆序列化为JSON字符串，用于共享状态后端"""
+    return json.dumps(
+        [['user' if msg.type == 'human' else 'assistant', msg.content]
+         for msg in memory.chat_memory.messages],
+        ensure_ascii=False
+    )
+
+
+def _load_conversation_memory(raw):
+    """从JSON字符串还原对话记忆"""
+    from langchain.memory import ConversationBufferMemory
+    
+    memory = ConversationBufferMemory(return_messages=True)
+    for role, content in json.loads(raw):
+        if role == 'user':
+            memory.chat_memory.add_user_message(content)
+        else:
+            memory.chat_memory.add_ai_message(content)
+    return memory
+
+
+# 异步输出流结束的标记
+_STREAM_END = object()
+
+# 同一对话的轮次冲突时返回给客户端的提示
+_TURN_BUSY_MESSAGE = '该对话正在生成回复，请等待完成后再发送'
+_TURN_CANCELLED_MESSAGE = '本轮回复已被同一对话的新消息取消'
+
+# 回放缓存的回复时每个文本块的字符数，与模型的输出块大小相近
+_REPLAY_CHUNK_CHARS = 16
+
+
+async def _anext(stream):
+    """读取异步迭代器的下一项，结束时返回 _STREAM_END"""
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return _STREAM_END
+
 
 class AIService:
     """AI聊天服务类 - 基于阿里云通义千问，集成Mem0长期记忆"""
     
     def __init__(self):
-        """初始化AI服务"""
+        """
+        初始化AI服务
+        
+        模型客户端与长期记忆后端在首次使用时才创建（见 llm 和 memory_backend 属性），
+        导入本模块不会加载langchain，也不会发起网络请求。
+        """
         try:
             # 验证配置
             if not Config.AI_API_KEY or Config.AI_API_KEY == 'sk-your-dashscope-api-key-here':
                 print("警告: 请在.env文件中配置正确的DASHSCOPE_API_KEY")
             
-            print(f"初始化通义千问AI服务...")
-            print(f"API Base: {Config.AI_API_BASE}")
-            print(f"Model: {Config.AI_MODEL_NAME}")
-            
-            self.llm = ChatOpenAI(
-                base_url=Config.AI_API_BASE,
-                api_key=Config.AI_API_KEY,
-                model=Config.AI_MODEL_NAME,
-                streaming=True,
-                temperature=1,  # 适中的创造性
-                max_tokens=8000,  # 限制响应长度
-            )
-            # 用户对话记忆管理 {username_chatid: memory}
-            self.user_memories = {}
-            # 用户系统提示词管理 {username_chatid: system_prompt}
-            self.user_system_prompts = {}
+            self._llm = None
+            self._memory_backend = None
+            self._init_lock = threading.Lock()
+            # 共享状态后端，多worker部署时跨进程共享会话状态；为None时使用进程内存储
+            self.state_backend = create_state_backend(Config)
+            if self.state_backend is None:
+                # 用户对话记忆管理 {username_chatid: memory}，按条目数/字节/空闲时间有界淘汰
+                self.user_memories = LRUSessionStore(
+                    max_entries=Config.SESSION_MAX_ENTRIES,
+                    max_bytes=Config.SESSION_MAX_BYTES,
+                    idle_ttl=Config.SESSION_IDLE_TTL,
+                    sizeof=_conversation_memory_size,
+                    on_evict=self._on_session_evicted
+                )
+                # 用户系统提示词管理 {username_chatid: system_prompt}
+                self.user_system_prompts = LRUSessionStore(
+                    max_entries=Config.SESSION_MAX_ENTRIES,
+                    idle_ttl=Config.SESSION_IDLE_TTL,
+                    sizeof=default_sizeof
+                )
+            else:
+                print(f"使用共享状态后端: {self.state_backend.name}")
+                self.user_memories = SharedSessionStore(
+                    self.state_backend, 'starpal:memory:',
+                    dumps=_dump_conversation_memory,
+                    loads=_load_conversation_memory,
+                    idle_ttl=Config.SESSION_IDLE_TTL
+                )
+                self.user_system_prompts = SharedSessionStore(
+                    self.state_backend, 'starpal:prompt:',
+                    dumps=json.dumps,
+                    loads=json.loads,
+                    idle_ttl=Config.SESSION_IDLE_TTL
+                )
             # 默认系统提示词
             self.default_system_prompt = Config.DEFAULT_SYSTEM_PROMPT
             # 系统级提示词（预设，不可被用户修改）
             self.system_level_prompt = Config.SYSTEM_LEVEL_PROMPT
+            # 按token预算裁剪对话历史的上下文构建器
+            self.context_builder = ContextBuilder(Config.CONTEXT_TOKEN_BUDGET)
+            # 各处理阶段的耗时统计
+            self.stage_stats = StageStats()
+            # SSE输出合并统计
+            self.sse_stats = SSEStats()
+            # 按对话串行化轮次的锁，不同对话之间并行；配置共享状态后端时在worker之间同样串行
+            self.conversation_locks = ConversationLockManager(
+                policy=Config.CONVERSATION_LOCK_POLICY,
+                timeout=Config.CONVERSATION_LOCK_TIMEOUT,
+                state_backend=self.state_backend,
+                lease_ttl=Config.CONVERSATION_LOCK_LEASE_TTL
+            )
+            # 模型回复缓存（可选），在所有用户之间共享
+            self.response_cache = ResponseCache(
+                ttl=Config.RESPONSE_CACHE_TTL,
+                max_entries=Config.RESPONSE_CACHE_MAX_ENTRIES,
+                max_bytes=Config.RESPONSE_CACHE_MAX_BYTES,
+                similarity=Config.RESPONSE_CACHE_SIMILARITY
+            ) if Config.RESPONSE_CACHE_ENABLED else None
             
-            # 初始化Mem0长期记忆客户端
+            # 长期记忆（Mem0云服务或本地向量存储），后端在首次使用时创建
             if Config.MEM0_ENABLED:
                 try:
-                    print(f"初始化Mem0长期记忆服务...")
-                    if not Config.MEM0_API_KEY or Config.MEM0_API_KEY == 'your-mem0-api-key-here':
-                        print("警告: 请在.env文件中配置正确的MEM0_API_KEY")
-                    
-                    self.mem0_client = MemoryClient(api_key=Config.MEM0_API_KEY)
                     self.mem0_enabled = True
-                    print(f"Mem0长期记忆服务初始化成功")
+                    # 对话结束后的Mem0写入由后台队列异步完成，不占用SSE响应
+                    self.mem0_write_queue = WriteBehindQueue(
+                        'mem0-writer',
+                        maxsize=Config.MEM0_WRITE_QUEUE_SIZE,
+                        workers=Config.MEM0_WRITE_WORKERS,
+                        max_retries=Config.MEM0_WRITE_MAX_RETRIES,
+                        backoff_base=Config.MEM0_WRITE_RETRY_BACKOFF
+                    )
+                    atexit.register(self.shutdown)
+                    # 长期记忆检索线程池，检索与提示词构建并行执行
+                    self._search_executor = ThreadPoolExecutor(
+                        max_workers=Config.MEM0_SEARCH_WORKERS,
+                        thread_name_prefix='mem0-search'
+                    )
+                    # 批量更新/删除记忆的线程池，所有批量请求共用，限制对Mem0的并发请求数
+                    self._batch_executor = ThreadPoolExecutor(
+                        max_workers=Config.MEMORY_BATCH_WORKERS,
+                        thread_name_prefix='mem0-batch'
+                    )
+                    self.batch_operations = 0
+                    self.batch_failures = 0
+                    # 按用户划分的检索结果缓存，记忆写入时失效；超时检索的迟到结果同样写入
+                    self.retrieval_cache = RetrievalCache(
+                        ttl=Config.MEM0_SEARCH_CACHE_TTL,
+                        max_entries=Config.MEM0_SEARCH_CACHE_MAX_ENTRIES,
+                        max_entries_per_user=Config.MEM0_SEARCH_CACHE_PER_USER
+                    )
+                    self.mem0_search_timeouts = 0
+                    # 按用户的长期记忆版本号，记忆写入时递增，用于记忆列表的ETag
+                    self.memory_versions = MemoryVersions(self.state_backend)
+                    # 检索到的候选记忆重排序后再注入提示词，开启时多检索一些候选；
+                    # 重排序器与记忆元数据提取器依赖NumPy，在首次使用时创建（见 memory_ranker 与 keyword_extractor 属性）
+                    self._memory_ranker = None
+                    self._importance_matcher = None
+                    self._keyword_extractor = None
+                    self.search_limit = Config.MEM0_MEMORY_LIMIT
+                    if Config.MEMORY_RERANK_ENABLED:
+                        self.search_limit = max(Config.MEMORY_RERANK_CANDIDATES, Config.MEM0_MEMORY_LIMIT)
                 except Exception as e:
-                    print(f"Mem0长期记忆初始化失败: {e}")
+                    print(f"长期记忆服务初始化失败: {e}")
                     self.mem0_enabled = False
             else:
                 print("Mem0长期记忆服务已禁用")
                 self.mem0_enabled = False
-                
-            print("通义千问AI服务初始化成功")
             
         except Exception as e:
             print(f"AI服务初始化失败: {e}")
             raise
     
+    @property
+    def llm(self):
+        """通义千问模型客户端，首次访问时创建"""
+        if self._llm is None:
+            with self._init_lock:
+                if self._llm is None:
+                    from langchain_openai import ChatOpenAI
+                    from backend.services.http_pool import http_pool
+                    
+                    print(f"初始化通义千问AI服务...")
+                    print(f"API Base: {Config.AI_API_BASE}")
+                    print(f"Model: {Config.AI_MODEL_NAME}")
+                    self._llm = ChatOpenAI(
+                        base_url=Config.AI_API_BASE,
+                        api_key=Config.AI_API_KEY,
+                        model=Config.AI_MODEL_NAME,
+                        streaming=True,
+                        temperature=1,  # 适中的创造性
+                        max_tokens=8000,  # 限制响应长度
+                        # 与Mem0共用出站连接池，复用已建立的连接
+                        http_client=http_pool.client(),
+                        http_async_client=http_pool.async_client(),
+                    )
+                    print("通义千问AI服务初始化成功")
+        return self._llm
+    
+    @llm.setter
+    def llm(self, value):
+        self._llm = value
+    
+    @property
+    def memory_backend(self):
+        """
+        长期记忆后端，首次访问时创建
+        
+        创建失败时禁用长期记忆并抛出异常，之后的请求不再尝试。
+        """
+        if self._memory_backend is None:
+            with self._init_lock:
+                if self._memory_backend is None:
+                    try:
+                        print(f"初始化长期记忆服务 (后端: {Config.MEMORY_BACKEND})...")
+                        self._memory_backend = create_memory_backend(Config)
+                        print(f"长期记忆服务初始化成功")
+                    except Exception as e:
+                        print(f"长期记忆服务初始化失败: {e}")
+                        self.mem0_enabled = False
+                        raise
+        return self._memory_backend
+    
+    def prepare_async_memory(self):
+        """
+        创建长期记忆后端及其异步客户端
+        
+        两者的创建都会同步访问Mem0（校验API Key），ASGI应用启动时在线程中调用，
+        使第一个异步对话轮次不必在事件循环中等待。失败时只打印日志。
+        """
+        if not self.mem0_enabled:
+            return
+        try:
+            self.memory_backend.prepare_async()
+        except Exception as e:
+            print(f"准备异步长期记忆检索失败: {e}")
+    
+    @property
+    def memory_ranker(self):
+        """长期记忆重排序器，首次访问时创建；未开启重排序时为None"""
+        if self._memory_ranker is None and Config.MEMORY_RERANK_ENABLED:
+            with self._init_lock:
+                if self._memory_ranker is None:
+                    from backend.services.memory_ranker import MemoryRanker
+                    
+                    relevance, recency, importance = Config.MEMORY_RANK_WEIGHTS
+                    self._memory_ranker = MemoryRanker(
+                        max_memories=Config.MEM0_MEMORY_LIMIT,
+                        token_budget=Config.MEMORY_TOKEN_BUDGET,
+                        relevance_weight=relevance,
+                        recency_weight=recency,
+                        importance_weight=importance,
+                        half_life_days=Config.MEMORY_RECENCY_HALF_LIFE_DAYS,
+                        dedup_threshold=Config.MEMORY_DEDUP_THRESHOLD,
+                        token_counter=self.context_builder.counter
+                    )
+        return self._memory_ranker
+    
+    @property
+    def importance_matcher(self):
+        """重要性信号词匹配器，首次访问时与关键词提取器一起创建"""
+        if self._importance_matcher is None:
+            self._init_memory_metadata()
+        return self._importance_matcher
+    
+    @property
+    def keyword_extractor(self):
+        """上下文关键词提取器，首次访问时与重要性信号词匹配器一起创建"""
+        if self._keyword_extractor is None:
+            self._init_memory_metadata()
+        return self._keyword_extractor
+    
+    def _init_memory_metadata(self):
+        """创建写入记忆时使用的重要性信号词匹配器与关键词提取器，规则在创建时编译"""
+        with self._init_lock:
+            if self._keyword_extractor is None:
+                from backend.services.memory_metadata import (DEFAULT_IMPORTANCE_SIGNALS, DEFAULT_STOP_WORDS,
+                                                              KeywordExtractor, SignalMatcher)
+                
+                self._importance_matcher = SignalMatcher(
+                    Config.MEMORY_IMPORTANCE_SIGNALS or DEFAULT_IMPORTANCE_SIGNALS
+                )
+                self._keyword_extractor = KeywordExtractor(
+                    Config.MEMORY_STOP_WORDS or DEFAULT_STOP_WORDS,
+                    max_keywords=Config.MEMORY_MAX_KEYWORDS,
+                    scan_chars=Config.MEMORY_KEYWORD_SCAN_CHARS
+                )
+    
     def set_system_prompt(self, username, chat_id, system_prompt=None):
         """
         设置用户对话的系统提示词
@@ -75,7 +339,7 @@ class AIService:
         """
         key = f"{username}__{chat_id}"
         # 存储用户提供的提示词，可以为None
-        self.user_system_prompts[key] = system_prompt
+        self.user_system_prompts.put(key, system_prompt)
     
     def get_system_prompt(self, username, chat_id):
         """
@@ -93,7 +357,7 @@ class AIService:
     
     def get_user_memory(self, username, chat_id):
         """
-        获取用户对话记忆
+        获取用户对话记忆，会话存储中没有时从数据库加载历史
         
         Args:
             username: 用户名
@@ -103,11 +367,45 @@ class AIService:
             ConversationBufferMemory: 对话记忆对象
         """
         key = f"{username}__{chat_id}"
-        if key not in self.user_memories:
-            self.user_memories[key] = ConversationBufferMemory(return_messages=True)
-        return self.user_memories[key]
+        memory = self.user_memories.get(key)
+        if memory is None:
+            from langchain.memory import ConversationBufferMemory
+            
+            memory = ConversationBufferMemory(return_messages=True)
+            try:
+                for role, content in history_store.load(username, chat_id, Config.HISTORY_LOAD_LIMIT):
+                    if role == 'user':
+                        memory.chat_memory.add_user_message(content)
+                    else:
+                        memory.chat_memory.add_ai_message(content)
+            except Exception as e:
+                print(f"加载对话历史失败: {e}")
+            self.user_memories.put(key, memory)
+        return memory
+    
+    def save_user_memory(self, username, chat_id, memory):
+        """
+        写回对话记忆，使会话存储重新计算其占用并执行淘汰
+        
+        Args:
+            username: 用户名
+            chat_id: 对话ID
+            memory: 对话记忆对象
+        """
+        self.user_memories.put(f"{username}__{chat_id}", memory)
     
-    def chat_stream(self, message, username, chat_id, system_prompt=None):
+    def _on_session_evicted(self, key, memory, reason):
+        """
+        对话记忆被淘汰时的回调，同时移除对应的系统提示词
+        
+        Args:
+            key: 会话键 username__chat_id
+            memory: 被淘汰的对话记忆
+            reason: 淘汰原因
+        """
+        self.user_system_prompts.pop(key)
+    
+    def chat_stream(self, message, username, chat_id, system_prompt=None, request_id=None):
         """
         流式聊天生成器
         
@@ -116,11 +414,303 @@ class AIService:
             username: 用户名
             chat_id: 对话ID
             system_prompt: 可选的系统提示词，如果提供则会覆盖当前设置
+            request_id: 请求ID，被采样时用于关联追踪记录
             
         Yields:
             str: 流式响应数据
         """
+        trace = tracer.start(request_id, 'chat_turn', username=username, chat_id=chat_id)
+        timer = StageTimer(trace)
+        coalescer = self._new_coalescer()
+        lease = None
+        cached_reply = None
+        status = 'ok'
+        metrics.CHAT_ACTIVE_STREAMS.inc()
+        try:
+            # 尽早发起Mem0检索，与记忆加载、提示词构建并行执行
+            search_future = self._start_memory_search(username, message) if self.mem0_enabled else None
+            
+            # 同一对话的轮次串行执行，避免并发请求交错修改对话记忆
+            with timer.stage('turn_lock'):
+                lease = self.conversation_locks.acquire(f"{username}__{chat_id}")
+            
+            memory, system_messages = self._prepare_turn(message, username, chat_id, system_prompt, timer)
+            
+            # 等待Mem0检索结果，超过截止时间则不带长期记忆继续
+            memories = []
+            if search_future is not None:
+                with timer.stage('memory_wait'):
+                    memories = self._wait_memory_search(search_future, timer)
+                memories = self._rank_memories(memories, timer)
+            
+            messages = self._build_messages(username, chat_id, memory, system_messages, memories, timer)
+            probe, cached_reply = self._lookup_response(messages, memories, timer)
+            
+            if cached_reply is not None:
+                # 命中回复缓存，按相同的SSE格式回放
+                for frame in self._replay_frames(cached_reply, coalescer, timer):
+                    yield frame
+            else:
+                # 流式生成响应，细粒度的输出块合并后再发送
+                for frame in self._stream_frames(messages, coalescer, timer, lease.cancelled):
+                    yield frame
+            if coalescer.chunks:
+                timer.mark('last_token')
+            if lease.cancelled.is_set():
+                status = 'cancelled'
+                yield encode_event({'error': _TURN_CANCELLED_MESSAGE})
+            elif probe is not None and cached_reply is None:
+                self.response_cache.store(probe, coalescer.reply())
+            
+            with timer.stage('finish_turn'):
+                self._finish_turn(message, username, chat_id, memory, coalescer.reply(),
+                                  remember=not lease.cancelled.is_set(), trace=trace)
+                
+        except ConversationBusy:
+            status = 'busy'
+            metrics.CHAT_ERRORS.labels('turn_lock').inc()
+            yield encode_event({'error': _TURN_BUSY_MESSAGE})
+        except Exception as e:
+            status = 'error'
+            # 未处于任何计时阶段时出错的是模型调用
+            metrics.CHAT_ERRORS.labels(timer.failed_stage or 'llm_stream').inc()
+            frame = coalescer.flush()
+            if frame:
+                yield frame
+            error_msg = f"AI服务错误: {str(e)}"
+            yield encode_event({'error': error_msg})
+        finally:
+            if lease is not None:
+                lease.release()
+            timer.mark('total')
+            self.stage_stats.record(timer)
+            self.sse_stats.record(coalescer)
+            metrics.CHAT_ACTIVE_STREAMS.dec()
+            metrics.observe_chat(timer, coalescer, 'cache' if cached_reply is not None else 'llm')
+            if trace is not None:
+                trace.finish(status, cached=cached_reply is not None, chunks=coalescer.chunks,
+                             frames=coalescer.frames, failed_stage=timer.failed_stage)
+    
+    async def achat_stream(self, message, username, chat_id, system_prompt=None, request_id=None):
+        """
+        异步流式聊天生成器，供ASGI路由使用，输出格式与 chat_stream 完全一致
+        
+        模型调用基于 llm.astream，长期记忆检索使用后端的异步接口；
+        可能访问数据库或共享状态后端的步骤放到线程中执行，不阻塞事件循环。
+        
+        Args:
+            message: 用户消息
+            username: 用户名
+            chat_id: 对话ID
+            system_prompt: 可选的系统提示词，如果提供则会覆盖当前设置
+            request_id: 请求ID，被采样时用于关联追踪记录
+            
+        Yields:
+            str: 流式响应数据
+        """
+        trace = tracer.start(request_id, 'chat_turn', username=username, chat_id=chat_id)
+        timer = StageTimer(trace)
+        coalescer = self._new_coalescer()
+        lease = None
+        cached_reply = None
+        status = 'ok'
+        metrics.CHAT_ACTIVE_STREAMS.inc()
+        try:
+            # 尽早发起Mem0检索，与记忆加载、提示词构建并行执行
+            search_task = self._start_memory_search_async(username, message) if self.mem0_enabled else None
+            
+            # 同一对话的轮次串行执行，等待锁的过程放到线程中
+            with timer.stage('turn_lock'):
+                lease = await acquire_in_thread(self.conversation_locks.acquire, f"{username}__{chat_id}")
+            
+            memory, system_messages = await asyncio.to_thread(
+                self._prepare_turn, message, username, chat_id, system_prompt, timer
+            )
+            
+            # 等待Mem0检索结果，超过截止时间则不带长期记忆继续
+            memories = []
+            if search_task is not None:
+                with timer.stage('memory_wait'):
+                    memories = await self._await_memory_search(search_task, timer)
+                memories = self._rank_memories(memories, timer)
+            
+            messages = self._build_messages(username, chat_id, memory, system_messages, memories, timer)
+            probe, cached_reply = self._lookup_response(messages, memories, timer)
+            
+            if cached_reply is not None:
+                # 命中回复缓存，按相同的SSE格式回放
+                for frame in self._replay_frames(cached_reply, coalescer, timer):
+                    yield frame
+            else:
+                # 流式生成响应，细粒度的输出块合并后再发送
+                async for frame in self._astream_frames(messages, coalescer, timer, lease.cancelled):
+                    yield frame
+            if coalescer.chunks:
+                timer.mark('last_token')
+            if lease.cancelled.is_set():
+                status = 'cancelled'
+                yield encode_event({'error': _TURN_CANCELLED_MESSAGE})
+            elif probe is not None and cached_reply is None:
+                self.response_cache.store(probe, coalescer.reply())
+            
+            with timer.stage('finish_turn'):
+                await asyncio.to_thread(self._finish_turn, message, username, chat_id, memory, coalescer.reply(),
+                                        not lease.cancelled.is_set(), trace)
+                
+        except ConversationBusy:
+            status = 'busy'
+            metrics.CHAT_ERRORS.labels('turn_lock').inc()
+            yield encode_event({'error': _TURN_BUSY_MESSAGE})
+        except Exception as e:
+            status = 'error'
+            # 未处于任何计时阶段时出错的是模型调用
+            metrics.CHAT_ERRORS.labels(timer.failed_stage or 'llm_stream').inc()
+            frame = coalescer.flush()
+            if frame:
+                yield frame
+            error_msg = f"AI服务错误: {str(e)}"
+            yield encode_event({'error': error_msg})
+        finally:
+            if lease is not None:
+                lease.release()
+            timer.mark('total')
+            self.stage_stats.record(timer)
+            self.sse_stats.record(coalescer)
+            metrics.CHAT_ACTIVE_STREAMS.dec()
+            metrics.observe_chat(timer, coalescer, 'cache' if cached_reply is not None else 'llm')
+            if trace is not None:
+                trace.finish(status, cached=cached_reply is not None, chunks=coalescer.chunks,
+                             frames=coalescer.frames, failed_stage=timer.failed_stage)
+    
+    def _new_coalescer(self):
+        """按配置创建本次响应使用的SSE合并器"""
+        return SSECoalescer(Config.SSE_FLUSH_BYTES, Config.SSE_FLUSH_INTERVAL_MS)
+    
+    def _stream_frames(self, messages, coalescer, timer, cancelled):
+        """
+        读取模型输出并合并为SSE帧
+        
+        Args:
+            messages: 发送给模型的消息列表
+            coalescer: SSE合并器
+            timer: 当前请求的阶段计时器
+            cancelled: 本轮被取消时设置的事件
+            
+        Yields:
+            str: SSE帧
+        """
+        for chunk in self.llm.stream(messages):
+            if cancelled.is_set():
+                break
+            content = chunk.content
+            if content:
+                if not coalescer.chunks:
+                    timer.mark('first_token')
+                frame = coalescer.push(content)
+                if frame:
+                    yield frame
+        frame = coalescer.flush()
+        if frame:
+            yield frame
+    
+    def _replay_frames(self, reply, coalescer, timer):
+        """
+        将缓存的回复分块后合并为SSE帧，帧格式与模型实时输出一致
+        
+        Args:
+            reply: 缓存的完整回复
+            coalescer: SSE合并器
+            timer: 当前请求的阶段计时器
+            
+        Yields:
+            str: SSE帧
+        """
+        timer.mark('first_token')
+        for start in range(0, len(reply), _REPLAY_CHUNK_CHARS):
+            frame = coalescer.push(reply[start:start + _REPLAY_CHUNK_CHARS])
+            if frame:
+                yield frame
+        frame = coalescer.flush()
+        if frame:
+            yield frame
+    
+    def _lookup_response(self, messages, memories, timer):
+        """
+        查找回复缓存
+        
+        注入了长期记忆的请求与具体用户相关，既不读取也不写入缓存。
+        
+        Args:
+            messages: 发送给模型的消息列表
+            memories: 本轮注入的长期记忆
+            timer: 当前请求的阶段计时器
+            
+        Returns:
+            tuple: (缓存键, 缓存的回复)，不使用缓存时均为None，未命中时回复为None
+        """
+        if self.response_cache is None or memories:
+            return None, None
+        with timer.stage('response_cache'):
+            return self.response_cache.lookup(messages)
+    
+    async def _astream_frames(self, messages, coalescer, timer, cancelled):
+        """
+        异步读取模型输出并合并为SSE帧
+        
+        等待下一个输出块时如果时间窗口到期，会先发送缓冲区中的内容，
+        避免模型输出停顿时已生成的文本滞留在缓冲区中。
+        
+        Args:
+            messages: 发送给模型的消息列表
+            coalescer: SSE合并器
+            timer: 当前请求的阶段计时器
+            cancelled: 本轮被取消时设置的事件
+            
+        Yields:
+            str: SSE帧
+        """
+        stream = self.llm.astream(messages).__aiter__()
+        next_chunk = None
         try:
+            while not cancelled.is_set():
+                if next_chunk is None:
+                    next_chunk = asyncio.ensure_future(_anext(stream))
+                done, _ = await asyncio.wait({next_chunk}, timeout=coalescer.time_until_flush())
+                if not done:
+                    yield coalescer.flush()
+                    continue
+                chunk, next_chunk = next_chunk.result(), None
+                if chunk is _STREAM_END:
+                    break
+                content = chunk.content
+                if content:
+                    if not coalescer.chunks:
+                        timer.mark('first_token')
+                    frame = coalescer.push(content)
+                    if frame:
+                        yield frame
+        finally:
+            if next_chunk is not None:
+                next_chunk.cancel()
+        frame = coalescer.flush()
+        if frame:
+            yield frame
+    
+    def _prepare_turn(self, message, username, chat_id, system_prompt, timer):
+        """
+        加载对话记忆、记录用户消息并构建系统提示词
+        
+        Args:
+            message: 用户消息
+            username: 用户名
+            chat_id: 对话ID
+            system_prompt: 可选的系统提示词
+            timer: 当前请求的阶段计时器
+            
+        Returns:
+            tuple: (对话记忆对象, 系统消息列表)
+        """
+        with timer.stage('memory_load'):
             # 获取用户记忆
             memory = self.get_user_memory(username, chat_id)
             
@@ -130,133 +720,434 @@ class AIService:
             
             # 添加用户消息到记忆
             memory.chat_memory.add_user_message(message)
-            
-            full_reply = ""
-            
+            self.save_user_memory(username, chat_id, memory)
+            history_store.append(username, chat_id, 'user', message)
+        
+        from langchain.schema import SystemMessage
+        
+        with timer.stage('prompt_build'):
             # 获取当前系统提示词
             current_system_prompt = self.get_system_prompt(username, chat_id)
             
-            # 从Mem0获取相关长期记忆
-            long_term_memories = ""
-            if self.mem0_enabled:
-                try:
-                    user_id = username
-                    # 构建高级过滤条件，优化v2版本搜索
-                    current_time = int(time.time())
-                    one_month_ago = current_time - (30 * 24 * 60 * 60)  # 30天前的时间戳
-                    
-                    # 构建高级过滤器，采用v2版本的完整功能
-                    filters = {
-                        "AND": [
-                            {"user_id": user_id},
-                            # 可选：增加时间过滤，优先考虑较近的记忆
-                            {"OR": [
-                                # 查找明确标记为重要的记忆
-                                {"metadata.importance": {"gte": "high"}},
-                                # 或者较新的记忆
-                                {"created_at": {"gte": one_month_ago}}
-                            ]}
-                        ]
-                    }
-                    
-                    # 使用v2版本的高级搜索功能
-                    search_results = self.mem0_client.search(
-                        query=message,
-                        version="v2",
-                        filters=filters,
-                        limit=Config.MEM0_MEMORY_LIMIT,
-                        output_format="v1.1"
-                    )
-                    
-                    # 格式化长期记忆为文本，增加可读性和相关度显示
-                    if search_results and "results" in search_results and search_results["results"]:
-                        memories = search_results["results"]
-                        long_term_memories = "用户的历史信息和偏好:\n"
-                        for i, mem in enumerate(memories):
-                            # 提取相关度分数（如果有）
-                            relevance = mem.get('relevance_score', '')
-                            relevance_str = f"[相关度: {relevance:.2f}] " if relevance else ""
-                            
-                            # 提取记忆创建时间
-                            created_time = mem.get('created_at', '')
-                            time_str = f"({created_time}) " if created_time else ""
-                            
-                            # 添加格式化的记忆条目
-                            long_term_memories += f"{i+1}. {relevance_str}{time_str}{mem['memory']}\n"
-                except Exception as e:
-                    print(f"获取Mem0长期记忆失败: {str(e)}")
-                    long_term_memories = ""
-            
-            # 构建消息列表，先添加系统级提示词（不可修改），再添加用户级提示词
-            messages = []
+            # 构建系统消息列表，先添加系统级提示词（不可修改），再添加用户级提示词
+            system_messages = []
             # 系统级提示词（必须的）
             if self.system_level_prompt:
-                messages.append(SystemMessage(content=self.system_level_prompt))
+                system_messages.append(SystemMessage(content=self.system_level_prompt))
             # 用户级提示词（可选的）
             if current_system_prompt:
-                messages.append(SystemMessage(content=current_system_prompt))
+                system_messages.append(SystemMessage(content=current_system_prompt))
+        
+        return memory, system_messages
+    
+    def _build_messages(self, username, chat_id, memory, system_messages, memories, timer):
+        """
+        加入长期记忆与对话历史，得到发送给模型的消息列表
+        
+        Args:
+            username: 用户名
+            chat_id: 对话ID
+            memory: 对话记忆对象
+            system_messages: 系统消息列表
+            memories: 检索到的长期记忆列表
+            timer: 当前请求的阶段计时器
             
+        Returns:
+            list: 消息列表
+        """
+        from langchain.schema import SystemMessage
+        
+        with timer.stage('context_build'):
+            long_term_memories = self._format_long_term_memories(memories)
             # 添加长期记忆（如果有）
             if long_term_memories:
-                messages.append(SystemMessage(content=f"以下是用户的历史信息，请在回答时考虑这些信息：\n{long_term_memories}"))
+                system_messages = system_messages + [
+                    SystemMessage(content=f"以下是用户的历史信息，请在回答时考虑这些信息：\n{long_term_memories}")
+                ]
             
-            # 添加对话历史
-            messages.extend(memory.buffer_as_messages)
+            # 添加对话历史，超出token预算时丢弃最早的轮次
+            messages, context_report = self.context_builder.build(system_messages, memory.buffer_as_messages)
+        if context_report['dropped_turns']:
+            print(f"对话上下文已裁剪 {username}__{chat_id}: "
+                  f"丢弃 {context_report['dropped_turns']} 轮 / {context_report['dropped_tokens']} tokens，"
+                  f"保留 {context_report['prompt_tokens']} tokens")
+        return messages
+    
+    def _finish_turn(self, message, username, chat_id, memory, full_reply, remember=True, trace=None):
+        """
+        将完整的AI响应写入对话记忆，并提交长期记忆写入
+        
+        Args:
+            message: 用户消息
+            username: 用户名
+            chat_id: 对话ID
+            memory: 对话记忆对象
+            full_reply: AI完整回复
+            remember: 是否写入长期记忆，被取消的轮次只保留已生成的部分回复，不写入长期记忆
+            trace: 请求的追踪记录，后台写入Mem0的耗时记录为其中的span
+        """
+        if not full_reply:
+            return
+        
+        # 将完整的AI响应添加到记忆中
+        memory.chat_memory.add_ai_message(full_reply)
+        self.save_user_memory(username, chat_id, memory)
+        history_store.append(username, chat_id, 'assistant', full_reply)
+        
+        # 将对话提交到后台队列，异步添加到Mem0长期记忆
+        if self.mem0_enabled and remember:
+            self._invalidate_retrieval_cache(username)
+            self.mem0_write_queue.submit(
+                self._add_long_term_memory,
+                username, chat_id, message, full_reply, int(time.time()), trace,
+                on_success=lambda _: self._invalidate_retrieval_cache(username)
+            )
+    
+    def _build_search_filters(self, user_id):
+        """
+        构建Mem0 v2版本的高级检索过滤条件
+        
+        Args:
+            user_id: 用户ID
             
-            # 流式生成响应
-            for chunk in self.llm.stream(messages):
-                content = chunk.content
-                if content:
-                    full_reply += content
-                    yield f"data: {json.dumps({'reply': content}, ensure_ascii=False)}\n\n"
+        Returns:
+            dict: 过滤条件
+        """
+        # 时间取整到小时，使过滤条件在一段时间内保持不变，便于缓存命中
+        current_time = int(time.time()) // 3600 * 3600
+        one_month_ago = current_time - (30 * 24 * 60 * 60)  # 30天前的时间戳
+        
+        return {
+            "AND": [
+                {"user_id": user_id},
+                # 可选：增加时间过滤，优先考虑较近的记忆
+                {"OR": [
+                    # 查找明确标记为重要的记忆
+                    {"metadata.importance": {"gte": "high"}},
+                    # 或者较新的记忆
+                    {"created_at": {"gte": one_month_ago}}
+                ]}
+            ]
+        }
+    
+    def _search_long_term_memories(self, message, filters):
+        """
+        从Mem0检索与消息相关的长期记忆（在检索线程池中执行）
+        
+        Args:
+            message: 用户消息
+            filters: 检索过滤条件
             
-            # 将完整的AI响应添加到记忆中
-            if full_reply:
-                memory.chat_memory.add_ai_message(full_reply)
-                
-                # 将对话添加到Mem0长期记忆
-                if self.mem0_enabled:
-                    try:
-                        # 构建消息列表
-                        mem0_messages = [
-                            {"role": "user", "content": message},
-                            {"role": "assistant", "content": full_reply}
-                        ]
-                        
-                        # 准备元数据，增强v2搜索能力
-                        metadata = {
-                            "chat_id": chat_id,
-                            "timestamp": int(time.time()),
-                            "importance": self._estimate_importance(message, full_reply),
-                            "context": self._extract_context_keywords(message, full_reply)
-                        }
-                        
-                        # 添加到Mem0，带有丰富的元数据
-                        self.mem0_client.add(
-                            mem0_messages, 
-                            user_id=username,
-                            metadata=metadata
-                        )
-                    except Exception as e:
-                        print(f"添加到Mem0长期记忆失败: {str(e)}")
-                
+        Returns:
+            tuple: (记忆列表, 检索耗时秒数)
+        """
+        start = time.perf_counter()
+        # 使用v2版本的高级搜索功能
+        search_results = self.memory_backend.search(
+            query=message,
+            filters=filters,
+            limit=self.search_limit
+        )
+        memories = []
+        if search_results and "results" in search_results and search_results["results"]:
+            memories = search_results["results"]
+        return memories, time.perf_counter() - start
+    
+    def _start_memory_search(self, username, message):
+        """
+        发起并行的长期记忆检索，命中缓存时直接返回已完成的结果
+        
+        检索完成后（无论是否超过截止时间）结果都会写入缓存。
+        
+        Args:
+            username: 用户名
+            message: 用户消息
+            
+        Returns:
+            Future: 检索任务
+        """
+        filters = self._build_search_filters(username)
+        cached = self.retrieval_cache.get(username, message, filters, self.search_limit)
+        if cached is not None:
+            future = Future()
+            future.set_result((cached, 0.0))
+            return future
+        
+        generation = self.retrieval_cache.generation(username)
+        future = self._search_executor.submit(self._search_long_term_memories, message, filters)
+        future.add_done_callback(
+            lambda f: self._store_search_result(f, username, message, filters, generation)
+        )
+        return future
+    
+    def _wait_memory_search(self, future, timer):
+        """
+        在截止时间内等待检索结果
+        
+        超时的检索不会被取消，完成后结果仍写入缓存，供后续相同的请求使用。
+        
+        Args:
+            future: 检索任务
+            timer: 当前请求的阶段计时器
+            
+        Returns:
+            list: 记忆列表，超时或失败时为空列表
+        """
+        try:
+            memories, elapsed = future.result(timeout=self._search_time_remaining(timer))
+            timer.record('mem0_search', elapsed)
+            return memories
+        except FutureTimeoutError:
+            self._on_search_timeout()
         except Exception as e:
-            error_msg = f"AI服务错误: {str(e)}"
-            yield f"data: {json.dumps({'error': error_msg}, ensure_ascii=False)}\n\n"
+            print(f"获取Mem0长期记忆失败: {str(e)}")
+        return []
+    
+    async def _search_long_term_memories_async(self, message, filters):
+        """
+        异步检索与消息相关的长期记忆
+        
+        Args:
+            message: 用户消息
+            filters: 检索过滤条件
+            
+        Returns:
+            tuple: (记忆列表, 检索耗时秒数)
+        """
+        start = time.perf_counter()
+        if self._memory_backend is None:
+            # 创建后端会同步访问Mem0，放到线程中执行
+            await asyncio.to_thread(self.prepare_async_memory)
+            if self._memory_backend is None:
+                return [], time.perf_counter() - start
+        search_results = await self.memory_backend.async_search(
+            query=message,
+            filters=filters,
+            limit=self.search_limit
+        )
+        memories = []
+        if search_results and "results" in search_results and search_results["results"]:
+            memories = search_results["results"]
+        return memories, time.perf_counter() - start
+    
+    def _start_memory_search_async(self, username, message):
+        """
+        在当前事件循环中发起长期记忆检索，命中缓存时直接返回已完成的结果
+        
+        Args:
+            username: 用户名
+            message: 用户消息
+            
+        Returns:
+            asyncio.Future: 检索任务
+        """
+        filters = self._build_search_filters(username)
+        cached = self.retrieval_cache.get(username, message, filters, self.search_limit)
+        if cached is not None:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result((cached, 0.0))
+            return future
+        
+        generation = self.retrieval_cache.generation(username)
+        task = asyncio.ensure_future(self._search_long_term_memories_async(message, filters))
+        task.add_done_callback(
+            lambda t: self._store_search_result(t, username, message, filters, generation)
+        )
+        return task
+    
+    async def _await_memory_search(self, task, timer):
+        """
+        在截止时间内等待异步检索结果，超时后检索继续在后台完成并写入缓存
+        
+        Args:
+            task: 检索任务
+            timer: 当前请求的阶段计时器
+            
+        Returns:
+            list: 记忆列表，超时或失败时为空列表
+        """
+        try:
+            memories, elapsed = await asyncio.wait_for(
+                asyncio.shield(task), timeout=self._search_time_remaining(timer)
+            )
+            timer.record('mem0_search', elapsed)
+            return memories
+        except asyncio.TimeoutError:
+            self._on_search_timeout()
+        except Exception as e:
+            print(f"获取Mem0长期记忆失败: {str(e)}")
+        return []
+    
+    def _rank_memories(self, memories, timer):
+        """
+        对检索到的候选记忆重排序，选出注入提示词的记忆
+        
+        Args:
+            memories: 候选记忆列表
+            timer: 当前请求的阶段计时器
+            
+        Returns:
+            list: 选中的记忆；未开启重排序时原样返回
+        """
+        if not memories or self.memory_ranker is None:
+            return memories
+        with timer.stage('memory_rank'):
+            return self.memory_ranker.rank(memories)
+    
+    def _search_time_remaining(self, timer):
+        """距离检索截止时间（从请求开始计算）还剩的秒数"""
+        return max(0.0, Config.MEM0_SEARCH_TIMEOUT_MS / 1000 - (time.perf_counter() - timer.start))
+    
+    def _on_search_timeout(self):
+        self.mem0_search_timeouts += 1
+        print(f"Mem0检索超过 {Config.MEM0_SEARCH_TIMEOUT_MS}ms，本轮不带长期记忆继续")
+    
+    def _store_search_result(self, future, username, message, filters, generation):
+        """检索完成后的回调，记录检索耗时并将结果写入缓存（期间记忆被修改过则放弃写入）"""
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            metrics.CHAT_ERRORS.labels('mem0_search').inc()
+        else:
+            memories, elapsed = future.result()
+            metrics.MEM0_LATENCY.labels('search').observe(elapsed)
+            self.retrieval_cache.put(
+                username, message, memories,
+                filters=filters, limit=self.search_limit, generation=generation
+            )
+    
+    def _invalidate_retrieval_cache(self, username=None):
+        """
+        长期记忆发生写入后使检索缓存失效，并递增记忆版本（记忆列表的ETag随之变化）
+        
+        Args:
+            username: 用户名，为None时（无法确定记忆归属）使全部缓存失效
+        """
+        if username is None:
+            self.retrieval_cache.invalidate_all()
+        else:
+            self.retrieval_cache.invalidate_user(username)
+        self.memory_versions.bump(username)
+    
+    def _format_long_term_memories(self, memories):
+        """
+        格式化长期记忆为文本，增加可读性和相关度显示
+        
+        Args:
+            memories: 记忆列表
+            
+        Returns:
+            str: 格式化后的文本，没有记忆时为空字符串
+        """
+        if not memories:
+            return ""
+        long_term_memories = "用户的历史信息和偏好:\n"
+        for i, mem in enumerate(memories):
+            # 提取相关度分数（如果有）
+            relevance = mem.get('relevance_score', '')
+            relevance_str = f"[相关度: {relevance:.2f}] " if relevance else ""
+            
+            # 提取记忆创建时间
+            created_time = mem.get('created_at', '')
+            time_str = f"({created_time}) " if created_time else ""
+            
+            # 添加格式化的记忆条目
+            long_term_memories += f"{i+1}. {relevance_str}{time_str}{mem['memory']}\n"
+        return long_term_memories
+    
+    def _add_long_term_memory(self, username, chat_id, message, full_reply, timestamp, trace=None):
+        """
+        将一轮对话添加到Mem0长期记忆（在后台写入线程中执行）
+        
+        Args:
+            username: 用户名
+            chat_id: 对话ID
+            message: 用户消息
+            full_reply: AI完整回复
+            timestamp: 对话完成时间戳
+            trace: 请求的追踪记录，未被采样时为None
+        """
+        # 构建消息列表
+        mem0_messages = [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": full_reply}
+        ]
+        
+        # 准备元数据，增强v2搜索能力
+        metadata = {
+            "chat_id": chat_id,
+            "timestamp": timestamp,
+            "importance": self._estimate_importance(message, full_reply),
+            "context": self._extract_context_keywords(message, full_reply)
+        }
+        
+        # 添加到Mem0，带有丰富的元数据
+        start = time.perf_counter()
+        # 后台写入发生在请求结束之后，作为单独的span写出，每次重试各记录一次
+        span = trace.span('mem0_add') if trace is not None else nullcontext()
+        try:
+            with span:
+                return self.memory_backend.add(
+                    mem0_messages, 
+                    user_id=username,
+                    metadata=metadata
+                )
+        except Exception:
+            metrics.CHAT_ERRORS.labels('mem0_add').inc()
+            raise
+        finally:
+            metrics.MEM0_LATENCY.labels('add').observe(time.perf_counter() - start)
+    
+    def get_stage_stats(self):
+        """
+        获取聊天请求各阶段的耗时统计
+        
+        Returns:
+            dict: 各阶段耗时统计及Mem0检索超时次数
+        """
+        stats = {'stages': self.stage_stats.snapshot()}
+        if self.mem0_enabled:
+            stats['mem0_search_timeouts'] = self.mem0_search_timeouts
+            stats['retrieval_cache'] = self.retrieval_cache.stats()
+        return stats
+    
+    def get_write_queue_stats(self):
+        """
+        获取Mem0后台写入队列的统计信息
+        
+        Returns:
+            dict: 队列深度、积压时长等指标，Mem0未启用时返回None
+        """
+        if not self.mem0_enabled:
+            return None
+        return self.mem0_write_queue.stats()
+    
+    def shutdown(self, timeout=None):
+        """
+        关闭服务，排空Mem0后台写入队列并释放长期记忆后端
+        
+        Args:
+            timeout: 最长等待秒数，默认使用配置值
+        """
+        if self.mem0_enabled:
+            if timeout is None:
+                timeout = Config.MEM0_WRITE_DRAIN_TIMEOUT
+            self.mem0_write_queue.shutdown(timeout=timeout)
+        if self._memory_backend is not None:
+            self._memory_backend.close()
     
     def clear_user_memory(self, username, chat_id):
         """
-        清除用户对话记忆和系统提示词
+        清除用户对话记忆、系统提示词及持久化的对话历史
         
         Args:
             username: 用户名
             chat_id: 对话ID
         """
         key = f"{username}__{chat_id}"
-        if key in self.user_memories:
-            del self.user_memories[key]
-        if key in self.user_system_prompts:
-            del self.user_system_prompts[key]
+        self.user_memories.pop(key)
+        self.user_system_prompts.pop(key)
+        history_store.delete(username, chat_id)
             
     def clear_long_term_memory(self, username):
         """
@@ -269,7 +1160,8 @@ class AIService:
             try:
                 # 使用v2版本API删除指定用户的所有记忆
                 filters = {"AND": [{"user_id": username}]}
-                self.mem0_client.delete_all(user_id=username, filters=filters, version="v2")
+                self.memory_backend.delete_all(user_id=username, filters=filters)
+                self._invalidate_retrieval_cache(username)
                 return True, "已清除用户的长期记忆"
             except Exception as e:
                 print(f"清除Mem0长期记忆失败: {str(e)}")
@@ -285,22 +1177,142 @@ class AIService:
             int: 记忆数量
         """
         return len(self.user_memories)
+    
+    def get_session_stats(self):
+        """
+        获取会话存储的统计信息（命中、未命中、淘汰次数等）
         
-    def get_long_term_memories(self, username, limit=10):
+        Returns:
+            dict: 对话记忆与系统提示词存储的统计信息
+        """
+        return {
+            'memories': self.user_memories.stats(),
+            'system_prompts': self.user_system_prompts.stats()
+        }
+    
+    def get_lock_stats(self):
         """
-        获取用户的长期记忆
+        获取对话锁竞争统计信息
+        
+        Returns:
+            dict: 锁策略及累计的竞争、拒绝、取消、超时次数和等待时间
+        """
+        return self.conversation_locks.stats()
+    
+    def get_response_cache_stats(self):
+        """
+        获取模型回复缓存统计信息
+        
+        Returns:
+            dict: 缓存统计，未启用时返回 {'enabled': False}
+        """
+        if self.response_cache is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.response_cache.stats()}
+    
+    def get_stream_stats(self):
+        """
+        获取SSE输出统计信息
+        
+        Returns:
+            dict: 累计的流、文本块与帧数量
+        """
+        return self.sse_stats.snapshot()
+    
+    def get_memory_ranker_stats(self):
+        """
+        获取长期记忆重排序统计信息
+        
+        Returns:
+            dict: 重排序统计，未启用时返回 {'enabled': False}
+        """
+        if not self.mem0_enabled or self.memory_ranker is None:
+            return {'enabled': False}
+        return {'enabled': True, 'search_limit': self.search_limit, **self.memory_ranker.stats()}
+    
+    def get_context_stats(self):
+        """
+        获取上下文裁剪统计信息
+        
+        Returns:
+            dict: token预算、累计丢弃轮次与token数、token计数缓存命中情况
+        """
+        return self.context_builder.stats()
+        
+    def _memory_page(self, limit, cursor=None):
+        """
+        解析记忆列表的分页参数
+        
+        Args:
+            limit: 客户端请求的每页条数，超过 MEMORY_PAGE_MAX_SIZE 时按上限处理
+            cursor: 上一页返回的 next_cursor，为空时从第一页开始
+            
+        Returns:
+            tuple: (页码, 每页条数, 游标签发时的记忆版本，无游标时为None)
+            
+        Raises:
+            ValueError: 游标格式无效
+        """
+        if cursor:
+            # 后续页沿用游标中的每页条数，保证页码对应的偏移量不变
+            page, page_size, version = decode_cursor(cursor)
+        else:
+            page, page_size, version = 1, limit or 10, None
+        return page, max(1, min(page_size, Config.MEMORY_PAGE_MAX_SIZE)), version
+    
+    def get_long_term_memories_etag(self, username, limit=10, cursor=None):
+        """
+        计算记忆列表当前的ETag，只读取版本号，不访问Mem0
+        
+        Args:
+            username: 用户名
+            limit: 每页条数
+            cursor: 分页游标
+            
+        Returns:
+            str: ETag，长期记忆未启用、多worker运行却未配置共享状态后端或无法读取版本号时返回None（按无条件请求处理）
+            
+        Raises:
+            ValueError: 游标格式无效
+        """
+        if not self.mem0_enabled:
+            return None
+        page, page_size, _ = self._memory_page(limit, cursor)
+        if not self.memory_versions.shared and Config.WEB_CONCURRENCY > 1:
+            # 多worker时进程内的版本号看不到其他worker处理的写入，不能据此返回304
+            return None
+        try:
+            version = self.memory_versions.get(username)
+        except Exception as e:
+            print(f"读取记忆版本失败: {e}")
+            return None
+        return make_etag(version, page, page_size, ttl=Config.MEMORY_LIST_ETAG_TTL)
+    
+    def get_long_term_memories(self, username, limit=10, cursor=None):
+        """
+        获取用户的长期记忆（游标分页）
         
         Args:
             username: 用户名
-            limit: 返回的记忆数量限制
+            limit: 每页条数，超过 MEMORY_PAGE_MAX_SIZE 时按上限处理
+            cursor: 上一页返回的 next_cursor，为空时从第一页开始
             
         Returns:
-            dict: 记忆列表及状态信息
+            dict: 记忆列表及状态信息；next_cursor 为下一页游标（没有更多时为None），
+                  cursor_stale 表示游标签发后记忆已被修改，分页位置可能有偏移
         """
         if not self.mem0_enabled:
             return {"success": False, "message": "Mem0长期记忆服务未启用", "memories": []}
             
         try:
+            page, page_size, cursor_version = self._memory_page(limit, cursor)
+        except ValueError as e:
+            return {"success": False, "message": str(e), "memories": []}
+            
+        try:
+            # 在读取列表之前取版本号：读取期间发生的写入会使版本变化，下次请求不会误判为未修改
+            version = self.memory_versions.get(username)
+            
             # 构建高级查询条件（v2版本）
             filters = {
                 "AND": [
@@ -309,16 +1321,28 @@ class AIService:
             }
             
             # 使用高级查询功能
-            response = self.mem0_client.get_all(
-                version="v2", 
+            response = self.memory_backend.get_all(
                 filters=filters, 
-                page=1, 
-                page_size=limit,
-                output_format="v1.1",
+                page=page, 
+                page_size=page_size,
                 sort_by="created_at",
                 sort_order="desc"  # 最新的记忆优先
             )
             
+            page_info = {
+                "version": version,
+                "next_cursor": None,
+                "cursor_stale": cursor_version is not None and cursor_version != version
+            }
+            # 后端返回总数（本地后端与Mem0分页响应的 count）时按总数判断是否还有下一页
+            total = response.get("count") if isinstance(response, dict) else None
+            if isinstance(total, int):
+                page_info["total"] = total
+                if page * page_size < total:
+                    page_info["next_cursor"] = encode_cursor(page + 1, page_size, version)
+            else:
+                total = None
+            
             # 如果结果包含元数据，增强返回的记忆信息
             if response and "items" in response:
                 memories = response["items"]
@@ -342,21 +1366,26 @@ class AIService:
                     
                     enhanced_memories.append(enhanced_mem)
                 
-                return {"success": True, "message": "成功获取长期记忆", "memories": enhanced_memories}
+                if total is None and len(memories) >= page_size:
+                    # 后端未返回总数时，以本页是否已满判断是否还有下一页
+                    page_info["next_cursor"] = encode_cursor(page + 1, page_size, version)
+                
+                return {"success": True, "message": "成功获取长期记忆", "memories": enhanced_memories, **page_info}
             
-            return {"success": True, "message": "成功获取长期记忆", "memories": response}
+            return {"success": True, "message": "成功获取长期记忆", "memories": response, **page_info}
         except Exception as e:
             print(f"获取Mem0长期记忆失败: {str(e)}")
             return {"success": False, "message": f"获取长期记忆失败: {str(e)}", "memories": []}
     
-    def update_long_term_memory(self, memory_id, new_text, metadata=None):
+    def update_long_term_memory(self, memory_id, new_text, metadata=None, username=None):
         """
         更新特定的长期记忆
         
         Args:
             memory_id: 记忆ID
             new_text: 新的记忆内容
-            metadata: 可选的元数据
+            metadata: 可选的元数据，提供时不再读取现有记忆
+            username: 记忆所属用户名，用于使该用户的检索缓存失效
             
         Returns:
             tuple: (成功状态, 消息)
@@ -365,47 +1394,55 @@ class AIService:
             return False, "Mem0长期记忆服务未启用"
             
         try:
-            # 如果没有提供元数据，获取现有元数据并增强它
-            if metadata is None:
-                try:
-                    # 获取现有记忆
-                    existing_memory = self.mem0_client.get(memory_id=memory_id)
-                    existing_metadata = existing_memory.get('metadata', {}) if existing_memory else {}
-                    
-                    # 更新元数据
-                    metadata = existing_metadata.copy()
-                    metadata['updated_at'] = int(time.time())
-                    metadata['last_modified'] = 'user_edit'
-                    
-                    # 估计重要性（如果之前没有设置）
-                    if 'importance' not in metadata:
-                        metadata['importance'] = 'high'  # 用户手动编辑的记忆通常比较重要
-                except Exception as e:
-                    print(f"获取现有记忆元数据失败: {str(e)}")
-                    metadata = {
-                        'updated_at': int(time.time()),
-                        'last_modified': 'user_edit',
-                        'importance': 'high'
-                    }
-            
-            # 使用v2版本API更新记忆
-            self.mem0_client.update(
-                memory_id=memory_id,
-                text=new_text,
-                metadata=metadata,
-                version="v2"
-            )
+            self._apply_memory_update(memory_id, new_text, metadata)
+            self._invalidate_retrieval_cache(username)
             return True, "成功更新长期记忆"
         except Exception as e:
             print(f"更新Mem0长期记忆失败: {str(e)}")
             return False, f"更新长期记忆失败: {str(e)}"
     
-    def delete_long_term_memory(self, memory_id):
+    def _apply_memory_update(self, memory_id, new_text, metadata=None):
+        """
+        写入一条记忆的新内容与元数据（不使检索缓存失效）
+        
+        Args:
+            memory_id: 记忆ID
+            new_text: 新的记忆内容
+            metadata: 调用方提供的元数据；为None时读取现有记忆的元数据并在其基础上修改
+        """
+        if metadata is None:
+            # 如果没有提供元数据，获取现有元数据并增强它
+            try:
+                # 获取现有记忆
+                existing_memory = self.memory_backend.get(memory_id)
+                metadata = dict(existing_memory.get('metadata') or {}) if existing_memory else {}
+                
+                # 估计重要性（如果之前没有设置）
+                if 'importance' not in metadata:
+                    metadata['importance'] = 'high'  # 用户手动编辑的记忆通常比较重要
+            except Exception as e:
+                print(f"获取现有记忆元数据失败: {str(e)}")
+                metadata = {'importance': 'high'}
+        else:
+            # 调用方提供了元数据，省去一次读取请求
+            metadata = dict(metadata)
+        metadata['updated_at'] = int(time.time())
+        metadata['last_modified'] = 'user_edit'
+        
+        # 使用v2版本API更新记忆
+        self.memory_backend.update(
+            memory_id=memory_id,
+            text=new_text,
+            metadata=metadata
+        )
+    
+    def delete_long_term_memory(self, memory_id, username=None):
         """
         删除特定的长期记忆
         
         Args:
             memory_id: 记忆ID
+            username: 记忆所属用户名，用于使该用户的检索缓存失效
             
         Returns:
             tuple: (成功状态, 消息)
@@ -414,12 +1451,116 @@ class AIService:
             return False, "Mem0长期记忆服务未启用"
             
         try:
-            self.mem0_client.delete(memory_id=memory_id, version="v2")
+            self.memory_backend.delete(memory_id)
+            self._invalidate_retrieval_cache(username)
             return True, "成功删除长期记忆"
         except Exception as e:
             print(f"删除Mem0长期记忆失败: {str(e)}")
             return False, f"删除长期记忆失败: {str(e)}"
     
+    def batch_long_term_memories(self, operations, username=None):
+        """
+        批量更新/删除长期记忆
+        
+        各操作提交到共用的有界线程池并行执行，单个操作失败不影响其他操作；
+        全部完成后只使检索缓存失效一次。
+        
+        Args:
+            operations: 操作列表，每项为 {"op": "update", "id": ..., "text": ..., "metadata": 可选}
+                        或 {"op": "delete", "id": ...}
+            username: 记忆所属用户名，用于使该用户的检索缓存失效
+            
+        Returns:
+            dict: success（全部成功）、succeeded / failed 计数，以及与 operations 顺序一致的
+                  results，每项为 {"index", "op", "id", "success", "message"}
+        """
+        if not self.mem0_enabled:
+            return {"success": False, "message": "Mem0长期记忆服务未启用", "results": []}
+        
+        results = [None] * len(operations)
+        futures = []
+        for index, operation in enumerate(operations):
+            op, memory_id, error = self._check_batch_operation(operation)
+            results[index] = {"index": index, "op": op, "id": memory_id, "success": False, "message": error}
+            if error is None:
+                futures.append((index, self._batch_executor.submit(self._run_batch_operation, operation)))
+        
+        for index, future in futures:
+            try:
+                future.result()
+                results[index].update(success=True, message="成功")
+            except Exception as e:
+                print(f"批量{results[index]['op']}长期记忆 {results[index]['id']} 失败: {str(e)}")
+                results[index]['message'] = str(e) or e.__class__.__name__
+        
+        succeeded = sum(1 for item in results if item['success'])
+        failed = len(results) - succeeded
+        if succeeded:
+            self._invalidate_retrieval_cache(username)
+        self.batch_operations += len(results)
+        self.batch_failures += failed
+        
+        if not failed:
+            message = f"成功处理 {succeeded} 条记忆"
+        else:
+            message = f"成功 {succeeded} 条，失败 {failed} 条"
+        return {
+            "success": failed == 0,
+            "message": message,
+            "succeeded": succeeded,
+            "failed": failed,
+            "results": results
+        }
+    
+    @staticmethod
+    def _check_batch_operation(operation):
+        """
+        校验单个批量操作
+        
+        Returns:
+            tuple: (操作类型, 记忆ID, 错误信息，校验通过时为None)
+        """
+        if not isinstance(operation, dict):
+            return None, None, "操作格式不正确"
+        op = operation.get('op')
+        memory_id = operation.get('id')
+        if op not in ('update', 'delete'):
+            return op, memory_id, "不支持的操作类型"
+        if not isinstance(memory_id, str) or not memory_id:
+            return op, memory_id, "缺少记忆ID"
+        if op == 'update':
+            text = operation.get('text')
+            if not isinstance(text, str) or not text.strip():
+                return op, memory_id, "缺少必要的记忆内容"
+            metadata = operation.get('metadata')
+            if metadata is not None and not isinstance(metadata, dict):
+                return op, memory_id, "元数据格式不正确"
+        return op, memory_id, None
+    
+    def _run_batch_operation(self, operation):
+        """在批量线程池中执行单个已校验的操作，失败时抛出异常"""
+        if operation['op'] == 'delete':
+            self.memory_backend.delete(operation['id'])
+        else:
+            self._apply_memory_update(operation['id'], operation['text'], operation.get('metadata'))
+    
+    def get_memory_batch_stats(self):
+        """
+        获取批量记忆操作统计信息
+        
+        Returns:
+            dict: 累计的批量操作数与失败数，未启用时返回 {'enabled': False}
+        """
+        if not self.mem0_enabled:
+            return {'enabled': False}
+        return {
+            'enabled': True,
+            'workers': Config.MEMORY_BATCH_WORKERS,
+            'max_operations': Config.MEMORY_BATCH_MAX_OPERATIONS,
+            'operations': self.batch_operations,
+            'failures': self.batch_failures
+        }
+    
     def _estimate_importance(self, user_message, ai_reply):
         """
         评估对话的重要性，用于记忆优先级排序
@@ -431,18 +1572,9 @@ class AIService:
         Returns:
             str: 重要性级别 'low', 'medium', 或 'high'
         """
-        # 重要性信号词
-        high_importance_signals = [
-            '记住', '不要忘记', '重要', '必须', '请记住', 
-            '我的信息', '我的地址', '我的喜好', '我的偏好',
-            '电话', '邮箱', '地址', '生日', '重要日期'
-        ]
-        
-        # 检查信号词出现
-        combined_text = (user_message + ' ' + ai_reply).lower()
-        for signal in high_importance_signals:
-            if signal in combined_text:
-                return 'high'
+        # 检查信号词出现（全部信号词预编译为一个正则，每段文本只扫描一遍）
+        if self.importance_matcher.search(user_message, ai_reply):
+            return 'high'
         
         # 消息长度也是重要性的一个指标
         if len(user_message) > 100 or len(ai_reply) > 300:
@@ -461,19 +1593,8 @@ class AIService:
         Returns:
             list: 关键词列表
         """
-        # 简单的关键词提取逻辑
-        combined_text = (user_message + ' ' + ai_reply).lower()
-        
-        # 常见的中文停用词
-        stop_words = ['的', '了', '和', '是', '在', '我', '有', '你', '我们', '他', '她', '它', '这', '那', '都']
-        
-        # 分词并过滤
-        words = []
-        for word in combined_text.replace(',', ' ').replace('.', ' ').replace('?', ' ').replace('!', ' ').split():
-            if len(word) > 1 and word not in stop_words:
-                words.append(word)
-        
-        # 返回最多10个关键词
-        return words[:10]
+        # 中文按字二元组、英文按单词统计，过滤停用词后按出现次数取前 MEMORY_MAX_KEYWORDS 个
+        return self.keyword_extractor.extract(user_message, ai_reply)
 # 创建全局AI服务实例
 ai_service = AIService()
+metrics.SESSION_STORE_ENTRIES.set_function(ai_service.get_memory_count)
@@ -0,0 +1,215 @@
+"""
+对话上下文构建模块
+按token预算裁剪对话历史，保证提示词长度可控
+"""
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+
+
+# 中日韩字符，通常每个字符约占一个token
+_CJK_PATTERN = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+# 每条消息在对话格式中的固定开销（角色标记等）
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+class TokenCounter:
+    """
+    token计数器
+
+    优先使用 tiktoken（可选依赖）精确计数，未安装时按字符类别估算；
+    计数结果按文本内容缓存，历史消息只需计算一次。缓存键是文本的16字节摘要而不是文本本身，
+    每个条目的占用与文本长度无关，条目数上限即可约束缓存的内存。
+    """
+
+    def __init__(self, max_cache_entries=50000):
+        """
+        初始化计数器
+
+        Args:
+            max_cache_entries: 缓存的最大文本条目数
+        """
+        self.max_cache_entries = max_cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # tiktoken编码表在首次计数时加载（可能需要下载），None表示尚未加载
+        self._encoding = None
+        self._encoding_loaded = False
+
+    def count_text(self, text):
+        """
+        计算文本的token数
+
+        Args:
+            text: 文本内容
+
+        Returns:
+            int: token数
+        """
+        if not text:
+            return 0
+
+        key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        with self._lock:
+            count = self._cache.get(key)
+            if count is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return count
+            self.cache_misses += 1
+
+        count = self._count_uncached(text)
+
+        with self._lock:
+            self._cache[key] = count
+            if len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+        return count
+
+    def count_message(self, message):
+        """
+        计算单条消息的token数（含消息格式开销）
+
+        Args:
+            message: langchain消息对象
+
+        Returns:
+            int: token数
+        """
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        return self.count_text(content) + MESSAGE_TOKEN_OVERHEAD
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                'cached_texts': len(self._cache),
+                'cache_hits': self.cache_hits,
+                'cache_misses': self.cache_misses,
+                'exact': self._encoding is not None
+            }
+
+    def _load_encoding(self):
+        """加载tiktoken编码表，未安装或加载失败时退回估算"""
+        with self._lock:
+            if self._encoding_loaded:
+                return
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding('cl100k_base')
+            except Exception:
+                self._encoding = None
+            self._encoding_loaded = True
+
+    def _count_uncached(self, text):
+        if not self._encoding_loaded:
+            self._load_encoding()
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        cjk_count = len(_CJK_PATTERN.findall(text))
+        return cjk_count + math.ceil((len(text) - cjk_count) / 4)
+
+
+class ContextBuilder:
+    """
+    上下文构建器
+
+    系统级提示词、用户提示词、长期记忆和当前用户消息始终保留，
+    其余对话历史按轮次从新到旧保留，直至用完token预算。
+    """
+
+    def __init__(self, token_budget, counter=None):
+        """
+        初始化上下文构建器
+
+        Args:
+            token_budget: 提示词总token预算，0或None表示不裁剪
+            counter: token计数器
+        """
+        self.token_budget = token_budget or None
+        self.counter = counter or TokenCounter()
+        self._lock = threading.Lock()
+        self.trimmed_requests = 0
+        self.dropped_turns_total = 0
+        self.dropped_tokens_total = 0
+
+    def build(self, system_messages, history):
+        """
+        构建发送给模型的消息列表
+
+        Args:
+            system_messages: 必须保留的系统消息列表
+            history: 对话历史消息列表，最后一条为当前用户消息
+
+        Returns:
+            tuple: (消息列表, 裁剪报告字典)
+        """
+        history = list(history)
+        current = history[-1:]
+        turns = self._split_turns(history[:-1])
+
+        fixed_tokens = sum(self.counter.count_message(m) for m in system_messages + current)
+        remaining = None if self.token_budget is None else self.token_budget - fixed_tokens
+
+        kept = []
+        kept_tokens = 0
+        dropped_turns = 0
+        dropped_tokens = 0
+        # 从最新一轮开始保留，一旦某轮放不下，更早的轮次全部丢弃，保证历史连续
+        for turn in reversed(turns):
+            turn_tokens = sum(self.counter.count_message(m) for m in turn)
+            if dropped_turns == 0 and (remaining is None or kept_tokens + turn_tokens <= remaining):
+                kept.append(turn)
+                kept_tokens += turn_tokens
+            else:
+                dropped_turns += 1
+                dropped_tokens += turn_tokens
+
+        messages = list(system_messages)
+        for turn in reversed(kept):
+            messages.extend(turn)
+        messages.extend(current)
+
+        report = {
+            'budget': self.token_budget,
+            'prompt_tokens': fixed_tokens + kept_tokens,
+            'kept_turns': len(kept),
+            'dropped_turns': dropped_turns,
+            'dropped_tokens': dropped_tokens
+        }
+
+        if dropped_turns:
+            with self._lock:
+                self.trimmed_requests += 1
+                self.dropped_turns_total += dropped_turns
+                self.dropped_tokens_total += dropped_tokens
+
+        return messages, report
+
+    def stats(self):
+        """返回裁剪统计与token缓存统计"""
+        with self._lock:
+            stats = {
+                'token_budget': self.token_budget,
+                'trimmed_requests': self.trimmed_requests,
+                'dropped_turns': self.dropped_turns_total,
+                'dropped_tokens': self.dropped_tokens_total
+            }
+        stats['token_cache'] = self.counter.stats()
+        return stats
+
+    @staticmethod
+    def _split_turns(messages):
+        """按用户消息切分对话轮次，每轮以一条用户消息开始"""
+        turns = []
+        for msg in messages:
+            if msg.type == 'human' or not turns:
+                turns.append([msg])
+            else:
+                turns[-1].append(msg)
+        return turns
@@ -0,0 +1,265 @@
+"""
+对话锁模块
+按 username__chat_id 串行化同一对话的多个轮次，不同对话之间互不影响
+"""
+import threading
+import time
+import uuid
+
+# 跨进程对话锁的键前缀
+_SHARED_PREFIX = 'starpal:turnlock:'
+
+
+class ConversationBusy(Exception):
+    """
+    对话正在处理其他轮次，本轮未能获得对话锁
+
+    Attributes:
+        reason: 'busy'（reject策略下对话已被占用）或 'timeout'（等待超时）
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class TurnLease:
+    """
+    对话锁的持有凭证
+
+    cancelled 事件在 cancel 策略下被同一对话的新轮次设置，持有者应尽快结束本轮并调用 release()。
+    """
+
+    def __init__(self, manager, key, entry):
+        self.manager = manager
+        self.key = key
+        self.cancelled = threading.Event()
+        self._entry = entry
+        self._released = False
+        # 跨进程锁的持有标记，未持有时为None
+        self.token = None
+
+    def release(self):
+        """释放对话锁，重复调用无副作用"""
+        if self._released:
+            return
+        self._released = True
+        self.manager._release(self)
+
+
+class _LockEntry:
+    """单个对话的锁状态，refs 为持有者与等待者的总数，归零时从管理器中移除"""
+
+    __slots__ = ('lock', 'holder', 'refs')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.holder = None
+        self.refs = 0
+
+
+class ConversationLockManager:
+    """
+    按对话键管理的锁
+
+    只为正在使用的对话保留锁对象，空闲后立即回收，内存占用与并发对话数成正比。
+    同一对话已有轮次在进行时，新轮次按 policy 处理：
+    - 'queue'：排队等待上一轮结束，最多等待 timeout 秒
+    - 'reject'：立即拒绝
+    - 'cancel'：通知上一轮取消，等待其释放后继续
+
+    未配置共享状态后端时锁只在当前进程内生效。配置后，获得进程内的锁之后还要在状态后端中
+    取得同一对话的租约（SET NX 加过期时间，后台线程定期续期），多个worker之间同样串行；
+    cancel 策略只能通知本进程内的上一轮，其他进程中的轮次按 queue 等待。
+    状态后端不可用时只使用进程内的锁，不影响对话。
+    """
+
+    POLICIES = ('queue', 'reject', 'cancel')
+
+    def __init__(self, policy='queue', timeout=30.0, state_backend=None, lease_ttl=30.0):
+        """
+        初始化对话锁管理器
+
+        Args:
+            policy: 冲突处理策略 'queue' / 'reject' / 'cancel'
+            timeout: 等待锁的最长秒数
+            state_backend: 共享状态后端，为None时只在进程内加锁
+            lease_ttl: 跨进程租约的有效秒数，持有期间每 lease_ttl/3 秒续期；进程异常退出时最多占用这么久
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的对话锁策略: {policy}")
+        self.policy = policy
+        self.timeout = timeout
+        self.state = state_backend
+        self.lease_ttl = lease_ttl
+
+        self._entries = {}
+        self._lock = threading.Lock()
+        # 持有跨进程租约的凭证，由续期线程定期刷新
+        self._shared_leases = set()
+        self._renewer = None
+
+        self.acquired = 0
+        self.contended = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.shared_errors = 0
+
+    def acquire(self, key):
+        """
+        获取对话锁
+
+        Args:
+            key: 对话键 username__chat_id
+
+        Returns:
+            TurnLease: 锁持有凭证
+
+        Raises:
+            ConversationBusy: reject策略下对话已被占用，或等待超时
+        """
+        start = time.perf_counter()
+        lease = self._acquire_local(key)
+        if self.state is not None:
+            try:
+                self._acquire_shared(lease, start + self.timeout)
+            except ConversationBusy:
+                lease.release()
+                raise
+        return lease
+
+    def _acquire_local(self, key):
+        """获取进程内的对话锁"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _LockEntry()
+            entry.refs += 1
+            if entry.lock.acquire(blocking=False):
+                return self._grant(key, entry, 0.0)
+
+            self.contended += 1
+            if self.policy == 'reject':
+                self.rejected += 1
+                self._unref(key, entry)
+                raise ConversationBusy('busy')
+            if self.policy == 'cancel' and entry.holder is not None and not entry.holder.cancelled.is_set():
+                self.cancelled += 1
+                entry.holder.cancelled.set()
+
+        start = time.perf_counter()
+        if not entry.lock.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+                self._unref(key, entry)
+            raise ConversationBusy('timeout')
+        with self._lock:
+            return self._grant(key, entry, time.perf_counter() - start)
+
+    def stats(self):
+        """
+        获取锁竞争统计信息
+
+        Returns:
+            dict: 当前加锁的对话数及累计的竞争、拒绝、取消、超时次数和等待时间
+        """
+        with self._lock:
+            return {
+                'policy': self.policy,
+                'shared': self.state is not None,
+                'shared_errors': self.shared_errors,
+                'active_conversations': len(self._entries),
+                'acquired': self.acquired,
+                'contended': self.contended,
+                'rejected': self.rejected,
+                'cancelled': self.cancelled,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': round(self.total_wait / self.contended * 1000, 2) if self.contended else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 2)
+            }
+
+    def _grant(self, key, entry, waited):
+        """记录获得锁的凭证，需在持有管理器锁时调用"""
+        lease = TurnLease(self, key, entry)
+        entry.holder = lease
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return lease
+
+    def _unref(self, key, entry):
+        """减少引用计数并在空闲时回收，需在持有管理器锁时调用"""
+        entry.refs -= 1
+        if entry.refs == 0 and self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def _acquire_shared(self, lease, deadline):
+        """在状态后端中取得对话租约，已持有进程内的锁时调用"""
+        shared_key = _SHARED_PREFIX + lease.key
+        token = uuid.uuid4().hex
+        delay = 0.02
+        waited_from = None
+        while True:
+            try:
+                if self.state.set_nx(shared_key, token, self.lease_ttl):
+                    break
+            except Exception as e:
+                with self._lock:
+                    self.shared_errors += 1
+                print(f"获取跨进程对话锁失败，只使用进程内的锁: {e}")
+                return
+            if waited_from is None:
+                waited_from = time.perf_counter()
+                with self._lock:
+                    self.contended += 1
+            if self.policy == 'reject':
+                with self._lock:
+                    self.rejected += 1
+                raise ConversationBusy('busy')
+            if time.perf_counter() + delay > deadline:
+                with self._lock:
+                    self.timeouts += 1
+                raise ConversationBusy('timeout')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+        lease.token = token
+        with self._lock:
+            if waited_from is not None:
+                waited = time.perf_counter() - waited_from
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            self._shared_leases.add(lease)
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_loop, name='turn-lock-renew', daemon=True)
+                self._renewer.start()
+
+    def _renew_loop(self):
+        """定期续期本进程持有的跨进程租约"""
+        while True:
+            time.sleep(self.lease_ttl / 3)
+            with self._lock:
+                leases = list(self._shared_leases)
+            for lease in leases:
+                try:
+                    self.state.touch(_SHARED_PREFIX + lease.key, self.lease_ttl)
+                except Exception as e:
+                    print(f"续期跨进程对话锁失败: {e}")
+
+    def _release(self, lease):
+        if lease.token is not None:
+            with self._lock:
+                self._shared_leases.discard(lease)
+            try:
+                self.state.delete_if(_SHARED_PREFIX + lease.key, lease.token)
+            except Exception as e:
+                print(f"释放跨进程对话锁失败，租约将在过期后释放: {e}")
+        entry = lease._entry
+        with self._lock:
+            if entry.holder is lease:
+                entry.holder = None
+            self._unref(lease.key, entry)
+            entry.lock.release()
@@ -0,0 +1,273 @@
+"""
+对话历史持久化模块
+将对话消息批量异步写入数据库，并在会话首次访问时加载历史
+"""
+import atexit
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import OperationalError
+
+from backend.models import db
+from backend.models.conversation import Conversation, Message
+
+
+class HistoryStore:
+    """
+    对话历史存储
+
+    append() 只把消息放入内存缓冲区，由后台线程按条数或时间间隔批量写入数据库；
+    load() 从数据库读取最近的消息，并补上尚未写入的缓冲消息。
+    整批写入失败时改为逐条写入：数据库不可用（连接错误、锁超时）时消息原样放回缓冲区，
+    其他错误（如字段超长）计入该消息的重试次数，超过 max_retries 后丢弃，不阻塞其他消息。
+    需要先调用 init_app(app) 绑定Flask应用，未绑定时所有操作均为空操作。
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.batch_size = 50
+        self.flush_interval = 1.0
+        self.max_buffer = 10000
+        self.max_retries = 3
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        # 同一时间只允许一个线程执行写库；跨进程的序号分配由对话行锁与唯一索引保证
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.appended = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+
+    def init_app(self, app):
+        """
+        绑定Flask应用并启动后台写入线程
+
+        Args:
+            app: Flask应用实例
+        """
+        self.app = app
+        self.enabled = app.config.get('HISTORY_PERSIST_ENABLED', True)
+        self.batch_size = app.config.get('HISTORY_FLUSH_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('HISTORY_FLUSH_INTERVAL', self.flush_interval)
+        self.max_buffer = app.config.get('HISTORY_MAX_BUFFER', self.max_buffer)
+        self.max_retries = app.config.get('HISTORY_MAX_RETRIES', self.max_retries)
+
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name='history-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def append(self, user_id, chat_id, role, content):
+        """
+        追加一条消息到写入缓冲区
+
+        Args:
+            user_id: 用户名
+            chat_id: 对话ID
+            role: 消息角色 'user' 或 'assistant'
+            content: 消息内容
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                print("对话历史写入缓冲区已满，丢弃消息")
+                return
+            # 最后一项为已失败的写入次数
+            self._buffer.append((user_id, chat_id, role, content, time.time(), 0))
+            self.appended += 1
+            should_flush = len(self._buffer) >= self.batch_size
+        if should_flush:
+            self._wakeup.set()
+
+    def load(self, user_id, chat_id, limit=200):
+        """
+        加载对话最近的消息
+
+        Args:
+            user_id: 用户名
+            chat_id: 对话ID
+            limit: 最多加载的消息数量
+
+        Returns:
+            list: [(role, content)] 按时间顺序排列
+        """
+        if not self.enabled:
+            return []
+
+        with self.app.app_context():
+            rows = Message.load_recent(user_id, chat_id, limit)
+            history = [(row.role, row.content) for row in rows]
+
+        with self._lock:
+            pending = [(role, content) for uid, cid, role, content, _, _ in self._buffer
+                       if uid == user_id and cid == chat_id]
+        return (history + pending)[-limit:]
+
+    def delete(self, user_id, chat_id):
+        """
+        删除对话的持久化历史及尚未写入的缓冲消息
+
+        Args:
+            user_id: 用户名
+            chat_id: 对话ID
+        """
+        if not self.enabled:
+            return
+        with self._flush_lock:
+            with self._lock:
+                self._buffer = [item for item in self._buffer
+                                if not (item[0] == user_id and item[1] == chat_id)]
+            with self.app.app_context():
+                Message.delete_history(user_id, chat_id)
+
+    def flush(self):
+        """
+        将缓冲区中的消息批量写入数据库
+
+        Returns:
+            int: 写入的消息数量
+        """
+        if not self.enabled:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+
+            start = time.perf_counter()
+            retry = []
+            with self.app.app_context():
+                try:
+                    self._write_batch(batch)
+                    written = len(batch)
+                except Exception as e:
+                    db.session.rollback()
+                    self.flush_errors += 1
+                    print(f"对话历史批量写入数据库失败，改为逐条写入: {e}")
+                    written, retry = self._write_each(batch)
+
+            if retry:
+                # 需要重试的消息放回缓冲区头部，下次写入
+                with self._lock:
+                    self._buffer = retry + self._buffer
+            self.flushed += written
+            self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+            return written
+
+    def shutdown(self):
+        """停止后台线程并写入剩余消息"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        """
+        获取写入统计信息
+
+        Returns:
+            dict: 缓冲区长度及累计计数
+        """
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            'enabled': self.enabled,
+            'buffered': buffered,
+            'appended': self.appended,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'flush_errors': self.flush_errors,
+            'last_flush_ms': self.last_flush_ms
+        }
+
+    def _write_batch(self, batch):
+        """
+        在一个事务中写入一批消息并更新对话的消息计数，需在应用上下文中调用
+
+        多个worker进程各自写库时，对话行以 SELECT ... FOR UPDATE 锁定到提交为止，
+        读取 message_count 与分配序号之间不会被其他进程插入；按ID顺序加锁避免互相等待。
+        SQLite 不支持行锁，写事务由数据库串行化，并发插入的重复序号被唯一索引拒绝，
+        由 flush 逐条重写时重新读取序号；两个进程同时新建同一对话时，由对话表的唯一约束以同样方式处理。
+        """
+        keys = list(dict.fromkeys((item[0], item[1]) for item in batch))
+        condition = or_(*[and_(Conversation.user_id == user_id, Conversation.chat_id == chat_id)
+                          for user_id, chat_id in keys])
+        conversations = {
+            (conversation.user_id, conversation.chat_id): conversation
+            for conversation in Conversation.query.filter(condition).order_by(Conversation.id).with_for_update()
+        }
+        for key in keys:
+            if key not in conversations:
+                conversation = Conversation(user_id=key[0], chat_id=key[1], message_count=0)
+                db.session.add(conversation)
+                conversations[key] = conversation
+
+        rows = []
+        for user_id, chat_id, role, content, created, _ in batch:
+            conversation = conversations[(user_id, chat_id)]
+            rows.append({
+                'user_id': user_id,
+                'chat_id': chat_id,
+                'seq': conversation.message_count,
+                'role': role,
+                'content': content,
+                'created_at': datetime.utcfromtimestamp(created)
+            })
+            conversation.message_count += 1
+
+        db.session.execute(Message.__table__.insert(), rows)
+        db.session.commit()
+
+    def _write_each(self, batch):
+        """
+        逐条写入整批写入失败的消息，需在应用上下文中调用
+
+        Returns:
+            tuple: (写入的消息数量, 需要放回缓冲区重试的消息列表)
+        """
+        written = 0
+        retry = []
+        for index, item in enumerate(batch):
+            try:
+                self._write_batch([item])
+                written += 1
+            except OperationalError as e:
+                # 数据库不可用，本条及剩余消息原样重试，不计入重试次数
+                db.session.rollback()
+                print(f"对话历史写入数据库失败，稍后重试: {e}")
+                retry.extend(batch[index:])
+                break
+            except Exception as e:
+                db.session.rollback()
+                attempts = item[5] + 1
+                if attempts >= self.max_retries:
+                    self.failed += 1
+                    print(f"对话历史消息写入失败 {attempts} 次，已丢弃 ({item[0]}/{item[1]}): {e}")
+                else:
+                    retry.append(item[:5] + (attempts,))
+        return written, retry
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+# 全局对话历史存储实例，在应用工厂中调用 init_app 绑定
+history_store = HistoryStore()
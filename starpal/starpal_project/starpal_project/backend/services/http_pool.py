@@ -0,0 +1,472 @@
+"""
+出站HTTP连接池模块
+通义千问（ChatOpenAI）与Mem0客户端共用同一组httpx传输层，复用保持连接（keep-alive），
+避免突发请求时反复建立TCP/TLS连接；按目标主机限制同时进行的请求数，并提供启动预热与使用统计。
+"""
+import asyncio
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import httpx
+
+from backend.config.config import Config
+
+
+class _HostStats:
+    """单个目标主机的请求计数"""
+
+    __slots__ = ('in_flight', 'peak', 'requests', 'waits', 'timeouts', 'errors')
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+        self.requests = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.errors = 0
+
+
+class _Slot:
+    """一次请求占用的主机名额，响应体读取完毕或关闭时归还，重复释放无副作用"""
+
+    def __init__(self, pool, host, release):
+        self._pool = pool
+        self._host = host
+        self._release = release
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._release()
+        self._pool._finish(self._host)
+
+
+class _SlotStream(httpx.SyncByteStream):
+    """包装响应体，流式响应在读取结束后才归还主机名额"""
+
+    def __init__(self, stream, slot):
+        self._stream = stream
+        self._slot = slot
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._slot.release()
+
+
+class _AsyncSlotStream(httpx.AsyncByteStream):
+    """_SlotStream 的异步版本"""
+
+    def __init__(self, stream, slot):
+        self._stream = stream
+        self._slot = slot
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._slot.release()
+
+
+class _SharedTransport(httpx.BaseTransport):
+    """
+    按主机限流的共享传输层
+
+    多个httpx.Client共用同一个实例，客户端关闭时不会关闭底层连接池，由 HttpPool.close() 统一关闭。
+    """
+
+    def __init__(self, pool, transport):
+        self._pool = pool
+        self._transport = transport
+
+    def handle_request(self, request):
+        host = request.url.host
+        slot = self._pool._acquire(host)
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            self._pool._count_error(host)
+            slot.release()
+            raise
+        response.stream = _SlotStream(response.stream, slot)
+        return response
+
+    def close(self):
+        pass
+
+
+class _AsyncSharedTransport(httpx.AsyncBaseTransport):
+    """_SharedTransport 的异步版本"""
+
+    def __init__(self, pool, transport):
+        self._pool = pool
+        self._transport = transport
+
+    async def handle_async_request(self, request):
+        host = request.url.host
+        slot = await self._pool._async_acquire(host)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._pool._count_error(host)
+            slot.release()
+            raise
+        response.stream = _AsyncSlotStream(response.stream, slot)
+        return response
+
+    async def aclose(self):
+        pass
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpPool:
+    """
+    出站HTTP连接池
+
+    同步与异步各一个底层传输层（httpx连接池），首次创建客户端时建立。client() / async_client()
+    返回的客户端相互独立（各自的base_url、请求头与超时），但共享底层连接；
+    每个目标主机同时进行的请求数不超过 per_host，超出时等待，等待超过 acquire_timeout 抛出 httpx.PoolTimeout。
+    异步传输层绑定到首次使用它的事件循环。
+    """
+
+    def __init__(self, max_connections=100, max_keepalive=20, keepalive_expiry=60.0, per_host=32,
+                 http2=False, connect_timeout=5.0, read_timeout=60.0, acquire_timeout=10.0):
+        """
+        初始化连接池
+
+        Args:
+            max_connections: 最大连接数（所有主机合计）
+            max_keepalive: 最多保留的空闲连接数
+            keepalive_expiry: 空闲连接保留秒数
+            per_host: 每个主机同时进行的最大请求数，0表示不限制
+            http2: 是否启用HTTP/2（需安装h2包，未安装时回退到HTTP/1.1）
+            connect_timeout: 建立连接超时秒数
+            read_timeout: 读取响应超时秒数
+            acquire_timeout: 等待可用连接或主机名额的最长秒数
+        """
+        if http2 and not _http2_available():
+            print("警告: HTTP_POOL_HTTP2 已开启但未安装h2包，回退到HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.per_host = per_host
+        self.acquire_timeout = acquire_timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=acquire_timeout)
+
+        self._transport = None
+        self._async_transport = None
+        self._shared = None
+        self._async_shared = None
+        self._init_lock = threading.Lock()
+
+        self._hosts = {}
+        self._host_semaphores = {}
+        self._async_host_semaphores = {}
+        self._lock = threading.Lock()
+        self.clients_created = 0
+        self.warmup_connections = 0
+
+    def client(self, timeout=None, **kwargs):
+        """
+        创建使用共享连接的同步客户端
+
+        Args:
+            timeout: 超时配置，默认使用连接池的超时
+            **kwargs: 传给 httpx.Client 的其他参数（base_url、headers等）
+
+        Returns:
+            httpx.Client: 客户端，关闭时不影响其他客户端
+        """
+        self._ensure_transports()
+        with self._lock:
+            self.clients_created += 1
+        return httpx.Client(transport=self._shared, timeout=timeout or self.timeout, **kwargs)
+
+    def async_client(self, timeout=None, **kwargs):
+        """
+        创建使用共享连接的异步客户端
+
+        Args:
+            timeout: 超时配置，默认使用连接池的超时
+            **kwargs: 传给 httpx.AsyncClient 的其他参数
+
+        Returns:
+            httpx.AsyncClient: 客户端，关闭时不影响其他客户端
+        """
+        self._ensure_transports()
+        with self._lock:
+            self.clients_created += 1
+        return httpx.AsyncClient(transport=self._async_shared, timeout=timeout or self.timeout, **kwargs)
+
+    def warmup(self, urls, connections=2):
+        """
+        预先建立到目标主机的连接，使首批请求不必等待TCP/TLS握手
+
+        对每个主机并发发送 connections 个HEAD请求（HTTP/2下每个主机一个连接即可多路复用），
+        任意响应状态码都视为连接已建立，失败只打印日志。
+
+        Args:
+            urls: 目标地址列表，按 scheme://host:port 去重
+            connections: 每个主机预先建立的连接数
+
+        Returns:
+            int: 成功建立连接的请求数
+        """
+        origins, targets = self._warmup_targets(urls, connections)
+        if not targets:
+            return 0
+
+        start = time.perf_counter()
+        with self.client() as client, ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            results = list(executor.map(lambda origin: self._warm_one(client, origin), targets))
+        return self._record_warmup(origins, targets, sum(results), start)
+
+    async def awarmup(self, urls, connections=2):
+        """
+        warmup() 的异步版本，预热异步传输层的连接（ASGI模式下聊天请求使用异步传输层）
+
+        Args:
+            urls: 目标地址列表
+            connections: 每个主机预先建立的连接数
+
+        Returns:
+            int: 成功建立连接的请求数
+        """
+        origins, targets = self._warmup_targets(urls, connections)
+        if not targets:
+            return 0
+
+        start = time.perf_counter()
+        async with self.async_client() as client:
+            results = await asyncio.gather(*(self._awarm_one(client, origin) for origin in targets))
+        return self._record_warmup(origins, targets, sum(results), start)
+
+    def start_warmup(self, urls, connections=2):
+        """
+        在后台线程中预热连接，不阻塞应用启动
+
+        Args:
+            urls: 目标地址列表
+            connections: 每个主机预先建立的连接数
+
+        Returns:
+            threading.Thread: 预热线程
+        """
+        thread = threading.Thread(target=self.warmup, args=(urls, connections),
+                                  name='http-pool-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        """
+        获取连接池使用统计
+
+        Returns:
+            dict: 连接池配置、同步/异步连接数（活动与空闲）及各主机的并发请求统计
+        """
+        with self._lock:
+            hosts = {
+                host: {
+                    'in_flight': s.in_flight,
+                    'peak': s.peak,
+                    'utilization': round(s.in_flight / self.per_host, 3) if self.per_host else None,
+                    'requests': s.requests,
+                    'waits': s.waits,
+                    'timeouts': s.timeouts,
+                    'errors': s.errors
+                }
+                for host, s in self._hosts.items()
+            }
+            clients_created = self.clients_created
+            warmup_connections = self.warmup_connections
+        max_connections = self.limits.max_connections
+        return {
+            'http2': self.http2,
+            'max_connections': max_connections,
+            'max_keepalive': self.limits.max_keepalive_connections,
+            'per_host': self.per_host,
+            'clients_created': clients_created,
+            'warmup_connections': warmup_connections,
+            'sync': self._connection_stats(self._transport, max_connections),
+            'async': self._connection_stats(self._async_transport, max_connections),
+            'hosts': hosts
+        }
+
+    def close(self):
+        """关闭底层连接"""
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+            self._shared = None
+        # 异步传输层的连接绑定在事件循环上，进程退出时随事件循环一起释放
+        self._async_transport = None
+        self._async_shared = None
+
+    def _ensure_transports(self):
+        if self._transport is None:
+            with self._init_lock:
+                if self._transport is None:
+                    self._async_transport = httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2)
+                    self._async_shared = _AsyncSharedTransport(self, self._async_transport)
+                    transport = httpx.HTTPTransport(limits=self.limits, http2=self.http2)
+                    self._shared = _SharedTransport(self, transport)
+                    self._transport = transport
+                    atexit.register(self.close)
+
+    def _warmup_targets(self, urls, connections):
+        """按 scheme://host:port 去重，返回 (主机列表, 每个预热请求的目标列表)"""
+        origins = []
+        for url in urls:
+            parts = urlsplit(url)
+            origin = f"{parts.scheme}://{parts.netloc}"
+            if parts.scheme in ('http', 'https') and origin not in origins:
+                origins.append(origin)
+        per_origin = 1 if self.http2 else max(1, connections)
+        return origins, [origin for origin in origins for _ in range(per_origin)]
+
+    def _record_warmup(self, origins, targets, opened, start):
+        with self._lock:
+            self.warmup_connections += opened
+        print(f"出站连接预热完成: {opened}/{len(targets)} 个连接, "
+              f"耗时 {(time.perf_counter() - start) * 1000:.0f} ms ({', '.join(origins)})")
+        return opened
+
+    def _warm_one(self, client, origin):
+        try:
+            client.head(origin)
+            return 1
+        except httpx.HTTPError as e:
+            print(f"出站连接预热失败 ({origin}): {e}")
+            return 0
+
+    async def _awarm_one(self, client, origin):
+        try:
+            await client.head(origin)
+            return 1
+        except httpx.HTTPError as e:
+            print(f"出站连接预热失败 ({origin}): {e}")
+            return 0
+
+    def _host_stats(self, host):
+        """获取主机统计对象，需在持有 self._lock 时调用"""
+        stats = self._hosts.get(host)
+        if stats is None:
+            stats = self._hosts[host] = _HostStats()
+        return stats
+
+    def _acquire(self, host):
+        """占用一个主机名额（同步）"""
+        if not self.per_host:
+            return self._start(host, False, lambda: None)
+        with self._lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._host_semaphores[host] = threading.BoundedSemaphore(self.per_host)
+        waited = not semaphore.acquire(blocking=False)
+        if waited and not semaphore.acquire(timeout=self.acquire_timeout):
+            self._count_timeout(host)
+            raise httpx.PoolTimeout(f"等待主机 {host} 的请求名额超时")
+        return self._start(host, waited, semaphore.release)
+
+    async def _async_acquire(self, host):
+        """占用一个主机名额（异步）"""
+        if not self.per_host:
+            return self._start(host, False, lambda: None)
+        with self._lock:
+            semaphore = self._async_host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._async_host_semaphores[host] = asyncio.Semaphore(self.per_host)
+        waited = semaphore.locked()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._count_timeout(host)
+            raise httpx.PoolTimeout(f"等待主机 {host} 的请求名额超时")
+        return self._start(host, waited, semaphore.release)
+
+    def _start(self, host, waited, release):
+        with self._lock:
+            stats = self._host_stats(host)
+            stats.requests += 1
+            stats.in_flight += 1
+            stats.peak = max(stats.peak, stats.in_flight)
+            if waited:
+                stats.waits += 1
+        return _Slot(self, host, release)
+
+    def _finish(self, host):
+        with self._lock:
+            self._hosts[host].in_flight -= 1
+
+    def _count_timeout(self, host):
+        with self._lock:
+            self._host_stats(host).timeouts += 1
+
+    def _count_error(self, host):
+        with self._lock:
+            self._host_stats(host).errors += 1
+
+    @staticmethod
+    def _connection_stats(transport, max_connections):
+        """读取httpx传输层底层连接池（httpcore）的连接状态"""
+        connections = list(getattr(getattr(transport, '_pool', None), 'connections', None) or [])
+        idle = sum(1 for c in connections if c.is_idle())
+        return {
+            'connections': len(connections),
+            'active': len(connections) - idle,
+            'idle': idle,
+            'utilization': round(len(connections) / max_connections, 3) if max_connections else None
+        }
+
+
+# 全局出站连接池实例
+http_pool = HttpPool(
+    max_connections=Config.HTTP_POOL_MAX_CONNECTIONS,
+    max_keepalive=Config.HTTP_POOL_MAX_KEEPALIVE,
+    keepalive_expiry=Config.HTTP_POOL_KEEPALIVE_EXPIRY,
+    per_host=Config.HTTP_POOL_PER_HOST,
+    http2=Config.HTTP_POOL_HTTP2,
+    connect_timeout=Config.HTTP_POOL_CONNECT_TIMEOUT,
+    read_timeout=Config.HTTP_POOL_READ_TIMEOUT,
+    acquire_timeout=Config.HTTP_POOL_ACQUIRE_TIMEOUT
+)
+
+
+def warmup_targets(config):
+    """
+    根据配置列出需要预热的出站地址
+
+    Args:
+        config: 配置类
+
+    Returns:
+        list: 通义千问API地址，以及启用Mem0时的Mem0服务地址
+    """
+    urls = [config.AI_API_BASE]
+    if config.MEM0_ENABLED and (config.MEMORY_BACKEND or 'mem0').lower() == 'mem0':
+        urls.append(config.MEM0_HOST)
+    return urls
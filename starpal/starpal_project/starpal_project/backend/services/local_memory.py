@@ -0,0 +1,440 @@
+"""
+本地向量记忆后端模块
+在进程内用NumPy数组保存记忆及其向量，无需访问外部服务即可提供长期记忆
+"""
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+
+from backend.services.memory_backend import MemoryBackend
+
+# 重要性等级，比较 metadata.importance 时按等级而非字符串大小比较
+IMPORTANCE_LEVELS = {'low': 0, 'medium': 1, 'high': 2}
+
+# 取值为时间的字段，比较时统一转换为时间戳
+_TIME_FIELDS = {'created_at', 'updated_at', 'metadata.timestamp', 'metadata.updated_at'}
+
+_CJK_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af]+')
+_WORD = re.compile(r'[a-z0-9_]+')
+
+
+class HashingEmbedder:
+    """
+    基于特征哈希的文本向量化
+
+    英文按单词、中日韩文本按单字与相邻双字提取特征，哈希到固定维度后做L2归一化。
+    不依赖外部模型，适合离线运行；可通过 LocalVectorBackend 的 embedder 参数替换为其他实现。
+    """
+
+    def __init__(self, dim=512):
+        """
+        Args:
+            dim: 向量维度
+        """
+        self.dim = dim
+
+    def embed(self, text):
+        """
+        将文本转换为单位向量
+
+        Args:
+            text: 文本
+
+        Returns:
+            np.ndarray: float32向量
+        """
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode('utf-8'))
+            vec[h % self.dim] += weight if (h >> 31) & 1 else -weight
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        return vec
+
+    @staticmethod
+    def _features(text):
+        text = unicodedata.normalize('NFKC', text or '').lower()
+        for word in _WORD.findall(text):
+            yield 'w:' + word, 1.0
+        for run in _CJK_RUN.findall(text):
+            for i, ch in enumerate(run):
+                yield 'c:' + ch, 0.5
+                if i + 1 < len(run):
+                    yield 'b:' + run[i:i + 2], 1.0
+
+
+def _to_timestamp(value):
+    """将时间戳或ISO格式字符串转换为时间戳，无法转换时返回None"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def _comparable(field, value):
+    """将字段值转换为可比较的形式"""
+    if field in _TIME_FIELDS:
+        return _to_timestamp(value)
+    if field == 'metadata.importance' and value in IMPORTANCE_LEVELS:
+        return IMPORTANCE_LEVELS[value]
+    return value
+
+
+def _field_value(record, field):
+    if field.startswith('metadata.'):
+        return (record.get('metadata') or {}).get(field[len('metadata.'):])
+    return record.get(field)
+
+
+def _compare(field, actual, op, expected):
+    if op == 'in':
+        return actual in expected
+    if op == 'nin':
+        return actual not in expected
+    if op == 'contains':
+        return actual is not None and expected in actual
+    if op == 'icontains':
+        return isinstance(actual, str) and str(expected).lower() in actual.lower()
+
+    a = _comparable(field, actual)
+    b = _comparable(field, expected)
+    if op == 'eq':
+        return a == b
+    if op == 'ne':
+        return a != b
+    if a is None or b is None:
+        return False
+    try:
+        if op == 'gt':
+            return a > b
+        if op == 'gte':
+            return a >= b
+        if op == 'lt':
+            return a < b
+        if op == 'lte':
+            return a <= b
+    except TypeError:
+        return False
+    raise ValueError(f"不支持的过滤运算符: {op}")
+
+
+def match_filters(record, filters):
+    """
+    判断记忆是否满足Mem0 v2格式的过滤条件
+
+    支持 AND / OR / NOT 组合，字段条件可以是等值（值为"*"表示字段存在），
+    也可以是 {"gte": ...} 形式的 eq/ne/gt/gte/lt/lte/in/nin/contains/icontains 运算。
+
+    Args:
+        record: 记忆记录
+        filters: 过滤条件
+
+    Returns:
+        bool: 是否满足
+    """
+    if not filters:
+        return True
+    for key, cond in filters.items():
+        if key == 'AND':
+            if not all(match_filters(record, c) for c in cond):
+                return False
+        elif key == 'OR':
+            if not any(match_filters(record, c) for c in cond):
+                return False
+        elif key == 'NOT':
+            if any(match_filters(record, c) for c in cond):
+                return False
+        else:
+            actual = _field_value(record, key)
+            if isinstance(cond, dict):
+                if not all(_compare(key, actual, op, expected) for op, expected in cond.items()):
+                    return False
+            elif cond == '*':
+                if actual is None:
+                    return False
+            elif not _compare(key, actual, 'eq', cond):
+                return False
+    return True
+
+
+def _required_user_id(filters):
+    """提取过滤条件中必须满足的 user_id 等值条件，用于预筛选"""
+    if not filters:
+        return None
+    user_id = filters.get('user_id')
+    if isinstance(user_id, str) and user_id != '*':
+        return user_id
+    for cond in filters.get('AND', []):
+        user_id = _required_user_id(cond)
+        if user_id is not None:
+            return user_id
+    return None
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class LocalVectorBackend(MemoryBackend):
+    """
+    进程内向量记忆后端
+
+    记忆向量按行保存在一个float32矩阵中，检索时先按 user_id 向量化预筛选，
+    再对候选记录应用完整过滤条件，最后用一次矩阵乘法计算余弦相似度并取top-k。
+    数据定期快照到磁盘（.npz），启动时自动加载。
+    只支持单进程：多个进程各自持有索引并覆盖同一个快照文件，写入会互相丢失。
+    """
+
+    name = 'local'
+
+    def __init__(self, snapshot_path=None, dim=512, snapshot_interval=30, embedder=None):
+        """
+        初始化本地记忆后端
+
+        Args:
+            snapshot_path: 快照文件路径，为None时不持久化
+            dim: 向量维度（使用默认向量化方法时）
+            snapshot_interval: 自动快照间隔秒数，0表示只在关闭时快照
+            embedder: 文本向量化对象，需提供 dim 属性和 embed(text) 方法
+        """
+        self.embedder = embedder or HashingEmbedder(dim)
+        self.dim = self.embedder.dim
+        self.snapshot_path = snapshot_path
+
+        self._lock = threading.RLock()
+        self._records = []
+        self._index = {}
+        self._vectors = np.zeros((64, self.dim), dtype=np.float32)
+        self._user_codes = np.zeros(64, dtype=np.int32)
+        self._user_ids = {}
+        self._dirty = False
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._load_snapshot()
+
+        self._stop = threading.Event()
+        self._snapshot_thread = None
+        if snapshot_path and snapshot_interval:
+            self._snapshot_thread = threading.Thread(
+                target=self._snapshot_loop, args=(snapshot_interval,),
+                name='local-memory-snapshot', daemon=True
+            )
+            self._snapshot_thread.start()
+
+    def add(self, messages, user_id, metadata=None):
+        # 以用户发言作为记忆内容，没有用户发言时退化为全部消息
+        texts = [m['content'] for m in messages if m.get('role') == 'user'] or \
+                [m['content'] for m in messages]
+        text = '\n'.join(t for t in texts if t)
+        if not text:
+            return {"results": []}
+
+        now = time.time()
+        record = {
+            'id': str(uuid.uuid4()),
+            'memory': text,
+            'user_id': user_id,
+            'metadata': dict(metadata or {}),
+            'created_at': now,
+            'updated_at': now
+        }
+        vector = self.embedder.embed(text)
+        with self._lock:
+            self._append(record, vector)
+        return {"results": [{"id": record['id'], "memory": text, "event": "ADD"}]}
+
+    def search(self, query, filters=None, limit=10):
+        query_vector = self.embedder.embed(query)
+        with self._lock:
+            rows = self._candidate_rows(filters)
+            if rows.size == 0 or limit <= 0:
+                return {"results": []}
+
+            scores = self._vectors[rows] @ query_vector
+            k = min(limit, rows.size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results = []
+            for t in top:
+                item = self._public(self._records[rows[t]])
+                item['score'] = float(scores[t])
+                results.append(item)
+        return {"results": results}
+
+    def get_all(self, filters=None, page=1, page_size=50, sort_by='created_at', sort_order='desc'):
+        with self._lock:
+            records = [self._records[i] for i in self._candidate_rows(filters)]
+            records.sort(key=lambda r: r.get(sort_by) or 0, reverse=(sort_order == 'desc'))
+            start = max(0, (page - 1) * page_size)
+            items = [self._public(r) for r in records[start:start + page_size]]
+        return {"items": items, "count": len(records), "page": page, "page_size": page_size}
+
+    def get(self, memory_id):
+        with self._lock:
+            row = self._index.get(memory_id)
+            return self._public(self._records[row]) if row is not None else None
+
+    def update(self, memory_id, text, metadata=None):
+        vector = self.embedder.embed(text)
+        with self._lock:
+            row = self._index.get(memory_id)
+            if row is None:
+                raise KeyError(f"记忆不存在: {memory_id}")
+            record = self._records[row]
+            record['memory'] = text
+            if metadata is not None:
+                record['metadata'] = dict(metadata)
+            record['updated_at'] = time.time()
+            self._vectors[row] = vector
+            self._dirty = True
+        return {"id": memory_id, "memory": text}
+
+    def delete(self, memory_id):
+        with self._lock:
+            row = self._index.get(memory_id)
+            if row is None:
+                raise KeyError(f"记忆不存在: {memory_id}")
+            self._remove_row(row)
+        return {"message": "Memory deleted successfully"}
+
+    def delete_all(self, user_id, filters=None):
+        combined = {"AND": [{"user_id": user_id}, filters]} if filters else {"user_id": user_id}
+        with self._lock:
+            # 从后往前删除，避免交换删除影响尚未处理的行号
+            for row in sorted(self._candidate_rows(combined).tolist(), reverse=True):
+                self._remove_row(row)
+        return {"message": "Memories deleted successfully"}
+
+    def snapshot(self):
+        """
+        将当前数据写入快照文件（先写临时文件再原子替换）
+
+        Returns:
+            bool: 是否写入
+        """
+        if not self.snapshot_path:
+            return False
+        with self._lock:
+            n = len(self._records)
+            vectors = self._vectors[:n].copy()
+            records = json.dumps(self._records, ensure_ascii=False)
+            self._dirty = False
+
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, vectors=vectors, records=np.array(records))
+        os.replace(tmp_path, self.snapshot_path)
+        return True
+
+    def close(self):
+        self._stop.set()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join(timeout=5)
+        try:
+            self.snapshot()
+        except Exception as e:
+            print(f"本地记忆快照写入失败: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
+
+    def _candidate_rows(self, filters):
+        """返回满足过滤条件的行号数组，需在持锁状态下调用"""
+        n = len(self._records)
+        user_id = _required_user_id(filters)
+        if user_id is not None:
+            code = self._user_ids.get(user_id)
+            if code is None:
+                return np.zeros(0, dtype=np.intp)
+            rows = np.flatnonzero(self._user_codes[:n] == code)
+        else:
+            rows = np.arange(n)
+        if filters:
+            rows = np.fromiter(
+                (i for i in rows if match_filters(self._records[i], filters)), dtype=np.intp
+            )
+        return rows
+
+    def _append(self, record, vector):
+        """追加一行记录，容量不足时成倍扩容，需在持锁状态下调用"""
+        row = len(self._records)
+        if row >= self._vectors.shape[0]:
+            capacity = self._vectors.shape[0] * 2
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            vectors[:row] = self._vectors[:row]
+            codes = np.zeros(capacity, dtype=np.int32)
+            codes[:row] = self._user_codes[:row]
+            self._vectors, self._user_codes = vectors, codes
+
+        self._vectors[row] = vector
+        self._user_codes[row] = self._user_ids.setdefault(record['user_id'], len(self._user_ids))
+        self._records.append(record)
+        self._index[record['id']] = row
+        self._dirty = True
+
+    def _remove_row(self, row):
+        """用最后一行覆盖被删除的行，需在持锁状态下调用"""
+        last = len(self._records) - 1
+        removed = self._records[row]
+        if row != last:
+            moved = self._records[last]
+            self._records[row] = moved
+            self._vectors[row] = self._vectors[last]
+            self._user_codes[row] = self._user_codes[last]
+            self._index[moved['id']] = row
+        self._records.pop()
+        del self._index[removed['id']]
+        self._dirty = True
+
+    @staticmethod
+    def _public(record):
+        """转换为与Mem0返回格式一致的字典"""
+        return {
+            'id': record['id'],
+            'memory': record['memory'],
+            'user_id': record['user_id'],
+            'metadata': dict(record['metadata']),
+            'created_at': _isoformat(record['created_at']),
+            'updated_at': _isoformat(record['updated_at'])
+        }
+
+    def _load_snapshot(self):
+        try:
+            with np.load(self.snapshot_path, allow_pickle=False) as data:
+                vectors = data['vectors']
+                records = json.loads(str(data['records']))
+        except Exception as e:
+            print(f"本地记忆快照加载失败: {e}")
+            return
+
+        # 快照的向量维度与当前配置不一致时重新计算向量
+        reembed = vectors.ndim != 2 or vectors.shape[1] != self.dim
+        for i, record in enumerate(records):
+            vector = self.embedder.embed(record['memory']) if reembed else vectors[i]
+            self._append(record, vector)
+        self._dirty = reembed
+        print(f"已加载本地记忆快照: {len(records)} 条")
+
+    def _snapshot_loop(self, interval):
+        while not self._stop.wait(interval):
+            if self._dirty:
+                try:
+                    self.snapshot()
+                except Exception as e:
+                    print(f"本地记忆快照写入失败: {e}")
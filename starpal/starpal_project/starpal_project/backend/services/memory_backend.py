@@ -0,0 +1,203 @@
+"""
+长期记忆后端模块
+定义AIService使用的长期记忆接口，并提供Mem0云服务实现
+"""
+import asyncio
+import threading
+
+
+class MemoryBackend:
+    """
+    长期记忆后端接口
+
+    方法签名与返回格式与Mem0 v2 API（output_format="v1.1"）保持一致：
+    search 返回 {"results": [...]}，get_all 返回 {"items": [...]}，
+    每条记忆至少包含 id、memory、metadata、created_at 字段。
+    """
+
+    name = 'base'
+
+    def add(self, messages, user_id, metadata=None):
+        """
+        根据对话消息添加记忆
+
+        Args:
+            messages: [{"role": ..., "content": ...}] 消息列表
+            user_id: 用户ID
+            metadata: 元数据
+        """
+        raise NotImplementedError
+
+    def search(self, query, filters=None, limit=10):
+        """
+        按语义相似度检索记忆
+
+        Args:
+            query: 检索语句
+            filters: AND/OR 过滤条件
+            limit: 返回数量
+
+        Returns:
+            dict: {"results": [...]}
+        """
+        raise NotImplementedError
+
+    def prepare_async(self):
+        """
+        完成异步检索前可能阻塞的准备工作（如创建异步客户端），默认无操作
+
+        会阻塞调用线程，不能在事件循环中直接调用。
+        """
+
+    async def async_search(self, query, filters=None, limit=10):
+        """
+        search 的异步版本，默认在线程中执行同步实现
+
+        Returns:
+            dict: {"results": [...]}
+        """
+        return await asyncio.to_thread(self.search, query, filters, limit)
+
+    def get_all(self, filters=None, page=1, page_size=50, sort_by='created_at', sort_order='desc'):
+        """
+        分页列出记忆
+
+        Returns:
+            dict: {"items": [...], ...}
+        """
+        raise NotImplementedError
+
+    def get(self, memory_id):
+        """获取单条记忆"""
+        raise NotImplementedError
+
+    def update(self, memory_id, text, metadata=None):
+        """更新单条记忆的内容与元数据"""
+        raise NotImplementedError
+
+    def delete(self, memory_id):
+        """删除单条记忆"""
+        raise NotImplementedError
+
+    def delete_all(self, user_id, filters=None):
+        """删除用户的全部记忆"""
+        raise NotImplementedError
+
+    def close(self):
+        """释放资源，默认无操作"""
+
+
+class Mem0Backend(MemoryBackend):
+    """基于Mem0云服务（MemoryClient）的长期记忆后端"""
+
+    name = 'mem0'
+
+    def __init__(self, api_key, host=None, pool=None):
+        """
+        初始化Mem0客户端
+
+        Args:
+            api_key: Mem0 API Key
+            host: Mem0服务地址，默认使用官方地址
+            pool: 出站连接池（HttpPool），为None时由Mem0客户端自行管理连接
+        """
+        from mem0 import MemoryClient
+
+        if not api_key or api_key == 'your-mem0-api-key-here':
+            print("警告: 请在.env文件中配置正确的MEM0_API_KEY")
+        self.api_key = api_key
+        self.host = host
+        self.pool = pool
+        self.client = MemoryClient(api_key=api_key, host=host,
+                                   client=pool.client() if pool is not None else None)
+        # 异步客户端只在ASGI模式下使用，由 prepare_async 创建
+        self._async_client = None
+        self._async_lock = threading.Lock()
+
+    def add(self, messages, user_id, metadata=None):
+        return self.client.add(messages, user_id=user_id, metadata=metadata)
+
+    def search(self, query, filters=None, limit=10):
+        return self.client.search(
+            query=query,
+            version="v2",
+            filters=filters,
+            limit=limit,
+            output_format="v1.1"
+        )
+
+    def prepare_async(self):
+        # AsyncMemoryClient 的构造函数会同步请求Mem0校验API Key，只创建一次
+        if self._async_client is None:
+            with self._async_lock:
+                if self._async_client is None:
+                    from mem0 import AsyncMemoryClient
+                    # httpx的异步传输在首次请求时才导入anyio的asyncio后端（约100毫秒，期间阻塞事件循环），提前导入
+                    import anyio._backends._asyncio  # noqa: F401
+                    import httpcore._backends.anyio  # noqa: F401
+                    self._async_client = AsyncMemoryClient(
+                        api_key=self.api_key, host=self.host,
+                        client=self.pool.async_client() if self.pool is not None else None
+                    )
+
+    async def async_search(self, query, filters=None, limit=10):
+        if self._async_client is None:
+            # 启动时未能预先创建，在线程中创建，不阻塞事件循环
+            await asyncio.to_thread(self.prepare_async)
+        return await self._async_client.search(
+            query=query,
+            version="v2",
+            filters=filters,
+            limit=limit,
+            output_format="v1.1"
+        )
+
+    def get_all(self, filters=None, page=1, page_size=50, sort_by='created_at', sort_order='desc'):
+        return self.client.get_all(
+            version="v2",
+            filters=filters,
+            page=page,
+            page_size=page_size,
+            output_format="v1.1",
+            sort_by=sort_by,
+            sort_order=sort_order
+        )
+
+    def get(self, memory_id):
+        return self.client.get(memory_id=memory_id)
+
+    def update(self, memory_id, text, metadata=None):
+        return self.client.update(memory_id=memory_id, text=text, metadata=metadata, version="v2")
+
+    def delete(self, memory_id):
+        return self.client.delete(memory_id=memory_id, version="v2")
+
+    def delete_all(self, user_id, filters=None):
+        return self.client.delete_all(user_id=user_id, filters=filters, version="v2")
+
+
+def create_memory_backend(config):
+    """
+    根据配置创建长期记忆后端
+
+    Args:
+        config: 配置类，读取 MEMORY_BACKEND 等配置项
+
+    Returns:
+        MemoryBackend: 长期记忆后端实例
+    """
+    backend = (config.MEMORY_BACKEND or 'mem0').lower()
+    if backend == 'mem0':
+        from backend.services.http_pool import http_pool
+        return Mem0Backend(api_key=config.MEM0_API_KEY, host=config.MEM0_HOST, pool=http_pool)
+    if backend == 'local':
+        if config.WEB_CONCURRENCY > 1:
+            # 各进程的索引互不可见，且会用各自的数据覆盖同一个快照文件
+            raise ValueError(f"本地长期记忆后端只支持单进程运行，当前 WEB_CONCURRENCY={config.WEB_CONCURRENCY}")
+        from backend.services.local_memory import LocalVectorBackend
+        return LocalVectorBackend(
+            snapshot_path=config.LOCAL_MEMORY_PATH,
+            dim=config.LOCAL_MEMORY_DIM,
+            snapshot_interval=config.LOCAL_MEMORY_SNAPSHOT_INTERVAL
+        )
+    raise ValueError(f"未知的长期记忆后端: {backend}")
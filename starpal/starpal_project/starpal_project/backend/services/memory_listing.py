@@ -0,0 +1,138 @@
+"""
+长期记忆列表模块
+为 GET /api/memory/long-term 提供游标分页与条件请求（ETag / If-None-Match）：
+每个用户维护一个记忆版本号，记忆写入时加一；列表的ETag由版本号与分页参数算出，
+不需要访问Mem0即可判断客户端缓存的列表是否仍然有效。
+"""
+import base64
+import binascii
+import hashlib
+import json
+import random
+import time
+
+from backend.services.shared_state import LocalStateBackend
+
+# 版本号的键前缀
+_VERSION_PREFIX = 'starpal:memver:'
+# 无法确定记忆归属的写入（如按ID更新而未提供用户名）使全部用户的版本失效
+_GLOBAL_KEY = _VERSION_PREFIX + '*'
+
+
+class MemoryVersions:
+    """
+    按用户划分的长期记忆版本号
+
+    版本号保存在共享状态后端中，多worker部署时各进程看到相同的版本；未配置共享状态后端时
+    使用进程内存储，此时 shared 为False：单进程运行时不受影响，多worker时其他worker处理的写入
+    不会改变本进程的版本，版本号不能用于判断列表是否未修改。键不存在时初始化为随机值而不是从0开始，
+    服务重启或状态被清空后不会与客户端缓存的旧ETag重合。
+    """
+
+    def __init__(self, state_backend=None):
+        """
+        Args:
+            state_backend: 共享状态后端，为None时使用进程内存储
+        """
+        self.shared = state_backend is not None
+        self.state = state_backend or LocalStateBackend()
+        self.bumps = 0
+
+    def get(self, username):
+        """
+        获取用户当前的记忆版本
+
+        Args:
+            username: 用户名
+
+        Returns:
+            str: 版本标识，由用户版本号与全局版本号组成
+        """
+        return f"{self._read(_VERSION_PREFIX + username)}.{self._read(_GLOBAL_KEY)}"
+
+    def bump(self, username=None):
+        """
+        记忆发生写入后递增版本号
+
+        Args:
+            username: 用户名，为None时递增全局版本号（使全部用户的列表缓存失效）
+        """
+        key = _GLOBAL_KEY if username is None else _VERSION_PREFIX + username
+        try:
+            self._read(key)
+            self.state.incr(key)
+            self.bumps += 1
+        except Exception as e:
+            print(f"递增记忆版本失败: {e}")
+
+    def _read(self, key):
+        value = self.state.get(key)
+        if value is None:
+            value = str(random.getrandbits(48))
+            self.state.set(key, value)
+        return value
+
+
+def encode_cursor(page, page_size, version):
+    """
+    生成下一页的游标
+
+    Mem0 的列表接口按页码分页，游标封装页码、每页条数与签发时的记忆版本，
+    客户端只需原样传回，不依赖页码语义。
+
+    Args:
+        page: 下一页的页码
+        page_size: 每页条数
+        version: 签发游标时的记忆版本
+
+    Returns:
+        str: URL安全的不透明游标
+    """
+    raw = json.dumps({'p': page, 's': page_size, 'v': version}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标
+
+    Args:
+        cursor: encode_cursor 生成的游标
+
+    Returns:
+        tuple: (页码, 每页条数, 签发时的记忆版本)
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        page, page_size, version = int(data['p']), int(data['s']), str(data['v'])
+    except (binascii.Error, ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
+    if page < 1 or page_size < 1:
+        raise ValueError(f"无效的游标: {cursor}")
+    return page, page_size, version
+
+
+def make_etag(version, page, page_size, ttl=0, clock=time.time):
+    """
+    计算列表响应的ETag值（作为弱ETag使用）
+
+    Mem0 的写入在服务端异步处理，接口返回后记忆可能稍后才出现在列表中；ttl 大于0时
+    ETag 另含时间分段，同一ETag最多沿用 ttl 秒，之后重新读取一次列表。
+
+    Args:
+        version: 记忆版本
+        page: 页码
+        page_size: 每页条数
+        ttl: ETag的最长有效时间（秒），0表示只随版本变化
+        clock: 时钟函数（便于测试替换）
+
+    Returns:
+        str: 不含引号与 W/ 前缀的ETag值，如 '3f2a9c0d1b7e4a5f'
+    """
+    window = int(clock() // ttl) if ttl > 0 else 0
+    digest = hashlib.sha256(f"{version}|{page}|{page_size}|{window}".encode('utf-8')).hexdigest()
+    return digest[:16]
@@ -0,0 +1,246 @@
+"""
+长期记忆元数据模块
+为写入长期记忆的每轮对话评估重要性（信号词匹配）并提取上下文关键词（中文按字二元组、英文按单词）
+"""
+import re
+from collections import Counter
+
+import numpy as np
+
+# 默认的重要性信号词（MEMORY_IMPORTANCE_SIGNALS 可覆盖）
+DEFAULT_IMPORTANCE_SIGNALS = (
+    '记住', '不要忘记', '重要', '必须', '请记住',
+    '我的信息', '我的地址', '我的喜好', '我的偏好',
+    '电话', '邮箱', '地址', '生日', '重要日期'
+)
+
+# 默认的停用词（MEMORY_STOP_WORDS 可覆盖）：单字停用词使包含它的二元组全部被过滤，多字停用词按整词过滤
+DEFAULT_STOP_WORDS = (
+    '的', '了', '和', '是', '在', '我', '有', '你', '他', '她', '它', '这', '那', '都',
+    '也', '就', '要', '会', '对', '与', '及', '或', '而', '但', '把', '被', '给', '让', '从', '向',
+    '吗', '呢', '吧', '啊', '呀', '哦', '嗯', '么', '个', '些', '着', '过', '得', '地', '之', '其',
+    '很', '更', '最', '还', '再', '又', '才', '由', '为',
+    '我们', '你们', '他们', '她们', '它们', '自己', '什么', '怎么', '如何', '为什么', '因为', '所以',
+    '如果', '可以', '可能', '已经', '还是', '以及', '或者', '然后', '一些', '一个', '一下', '没有',
+    '不是', '就是', '这样', '那样', '这些', '那些', '非常', '比较', '时候', '需要', '希望', '帮助',
+    'the', 'a', 'an', 'and', 'or', 'but', 'is', 'are', 'was', 'were', 'be', 'to', 'of', 'in', 'on',
+    'for', 'with', 'at', 'by', 'from', 'as', 'it', 'this', 'that', 'you', 'your', 'we', 'our', 'can',
+    'will', 'not', 'have', 'has', 'do', 'does', 'if', 'so', 'me', 'my'
+)
+
+# 组成二元组的中文字符范围（统一表意文字、扩展A区与兼容表意文字）
+_CJK_RANGES = ((0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF))
+# 英文单词
+_WORD = re.compile(r'[A-Za-z][A-Za-z0-9_\-]+')
+_EMPTY_BIGRAMS = (np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+
+def compile_literals(words, flags=re.IGNORECASE):
+    """
+    将一组字面量编译为按前缀树展开的正则表达式
+
+    共同前缀只出现一次（如 '记住' 与 '记录' 编译为 '记(?:住|录)'），一次扫描即可同时匹配全部词，
+    效果与Aho-Corasick自动机相同，匹配在C层完成。
+
+    Args:
+        words: 字面量列表
+        flags: 正则标志，默认忽略大小写
+
+    Returns:
+        re.Pattern: 编译后的正则，words 为空时返回None
+    """
+    trie = {}
+    for word in words:
+        if not word:
+            continue
+        node = trie
+        for ch in (word.lower() if flags & re.IGNORECASE else word):
+            node = node.setdefault(ch, {})
+        node[''] = True
+    if not trie:
+        return None
+    return re.compile(_trie_pattern(trie), flags)
+
+
+def _trie_pattern(node):
+    """将前缀树节点展开为正则表达式片段"""
+    alternatives = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch != '']
+    if not alternatives:
+        return ''
+    body = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+    if '' in node:
+        # 较短的词已经命中，后续字符可选
+        return '(?:' + body + ')?'
+    return body
+
+
+class SignalMatcher:
+    """
+    信号词匹配器
+
+    信号词在创建时编译为一个正则，每次检查对每段文本只扫描一遍，找到第一个信号词即返回。
+    """
+
+    def __init__(self, signals=DEFAULT_IMPORTANCE_SIGNALS):
+        """
+        Args:
+            signals: 信号词列表
+        """
+        self.signals = tuple(signals)
+        self._pattern = compile_literals(self.signals)
+
+    def search(self, *texts):
+        """
+        查找第一个出现的信号词
+
+        Args:
+            *texts: 待检查的文本（依次检查）
+
+        Returns:
+            str: 命中的信号词（小写），均未命中时返回None
+        """
+        if self._pattern is None:
+            return None
+        for text in texts:
+            if text:
+                match = self._pattern.search(text)
+                if match:
+                    return match.group(0).lower()
+        return None
+
+
+class KeywordExtractor:
+    """
+    上下文关键词提取器
+
+    中文文本没有空格分词，按相邻两个中文字符（不含单字停用词）切分为字二元组，英文按单词切分，
+    按出现次数排序（用户消息中的词按 user_weight 加权，次数相同时先出现的优先），
+    并跳过停用词与已选词首尾相接的二元组。二元组用NumPy按字符码整体生成与计数，
+    Python层只处理排名靠前的候选词，耗时与回复长度基本无关。
+    """
+
+    def __init__(self, stop_words=DEFAULT_STOP_WORDS, max_keywords=10, user_weight=3, scan_chars=0):
+        """
+        Args:
+            stop_words: 停用词列表
+            max_keywords: 返回的最大关键词数
+            user_weight: 用户消息中词语的计数权重
+            scan_chars: 只扫描AI回复的前N个字符，0表示扫描全文
+        """
+        self.stop_words = frozenset(word.lower() for word in stop_words)
+        # 基本多文种平面内各字符能否组成二元组的查找表：中文字符且不是单字停用词
+        self._bigram_chars = np.zeros(0x10000, dtype=bool)
+        for low, high in _CJK_RANGES:
+            self._bigram_chars[low:high + 1] = True
+        for word in self.stop_words:
+            if len(word) == 1 and ord(word) < 0x10000:
+                self._bigram_chars[ord(word)] = False
+        self.max_keywords = max_keywords
+        self.user_weight = user_weight
+        self.scan_chars = scan_chars
+
+    def extract(self, user_message, ai_reply):
+        """
+        从一轮对话中提取关键词
+
+        Args:
+            user_message: 用户消息
+            ai_reply: AI回复
+
+        Returns:
+            list: 关键词列表，最多 max_keywords 个
+        """
+        user_message = user_message or ''
+        ai_reply = ai_reply or ''
+        if self.scan_chars and len(ai_reply) > self.scan_chars:
+            ai_reply = ai_reply[:self.scan_chars]
+        # 每个来源只取排名靠前的候选词，足以覆盖停用词与首尾相接的过滤
+        limit = self.max_keywords * 8
+
+        # {词: [加权次数, 首次出现位置]}，回复中的位置排在用户消息之后
+        candidates = {}
+        user_bigrams = self._count_bigrams(user_message)
+        reply_bigrams = self._count_bigrams(ai_reply)
+        user_words = Counter(word.lower() for word in _WORD.findall(user_message))
+        reply_words = Counter(word.lower() for word in _WORD.findall(ai_reply))
+
+        user_top = self._top_bigrams(user_bigrams, len(user_bigrams[0]))
+        reply_counts = self._lookup_counts(reply_bigrams, user_bigrams[0])
+        for token, count, first in user_top:
+            candidates[token] = [count * self.user_weight + reply_counts.get(token, 0), first]
+        offset = len(user_message) + 1
+        for token, count, first in self._top_bigrams(reply_bigrams, limit):
+            if token not in candidates:
+                candidates[token] = [count, offset + first]
+        for position, (token, count) in enumerate(user_words.items()):
+            candidates[token] = [count * self.user_weight + reply_words.get(token, 0), position]
+        for position, (token, count) in enumerate(reply_words.most_common(limit)):
+            if token not in candidates:
+                candidates[token] = [count, offset + position]
+
+        keywords = []
+        # 已选中文关键词的首字与尾字：跨越两个词边界的二元组（如"拿铁咖啡"中的"铁咖"）首字
+        # 是已选词的尾字或尾字是已选词的首字，不再选入
+        heads, tails = set(), set()
+        for token in sorted(candidates, key=lambda t: (-candidates[t][0], candidates[t][1])):
+            if token in self.stop_words:
+                continue
+            if not token.isascii():
+                if token[0] in tails or token[1] in heads:
+                    continue
+                heads.add(token[0])
+                tails.add(token[1])
+            keywords.append(token)
+            if len(keywords) >= self.max_keywords:
+                break
+        return keywords
+
+    def _count_bigrams(self, text):
+        """
+        统计文本中的中文二元组
+
+        Returns:
+            tuple: (按数值排序的二元组编码数组, 次数数组, 首次出现位置数组)
+        """
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        if codes.size < 2:
+            return _EMPTY_BIGRAMS
+        # 基本多文种平面以外的字符映射到不能组成二元组的 U+FFFF
+        cjk = self._bigram_chars[np.minimum(codes, 0xFFFF)]
+        starts = np.flatnonzero(cjk[:-1] & cjk[1:])
+        if not starts.size:
+            return _EMPTY_BIGRAMS
+        # 两个字符码（均小于2^21）拼成一个整数
+        keys = (codes[starts].astype(np.uint64) << np.uint64(21)) | codes[starts + 1]
+        keys, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        return keys, counts, starts[first]
+
+    @staticmethod
+    def _top_bigrams(bigrams, limit):
+        """按次数降序、首次出现位置升序取前 limit 个二元组，返回 (词, 次数, 位置) 列表"""
+        keys, counts, first = bigrams
+        if not keys.size:
+            return []
+        order = np.lexsort((first, -counts.astype(np.int64)))[:limit]
+        return [(_decode(key), count, position)
+                for key, count, position in zip(keys[order].tolist(), counts[order].tolist(), first[order].tolist())]
+
+    @staticmethod
+    def _lookup_counts(bigrams, keys):
+        """
+        查询一组二元组编码在统计结果中的次数
+
+        Returns:
+            dict: {词: 次数}，只包含出现过的二元组
+        """
+        known, counts, _ = bigrams
+        if not known.size or not keys.size:
+            return {}
+        index = np.minimum(np.searchsorted(known, keys), known.size - 1)
+        found = known[index] == keys
+        return dict(zip(map(_decode, keys[found].tolist()), counts[index[found]].tolist()))
+
+
+def _decode(key):
+    """二元组编码还原为字符串"""
+    return chr(key >> 21) + chr(key & 0x1FFFFF)
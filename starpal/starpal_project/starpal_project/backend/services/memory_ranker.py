@@ -0,0 +1,181 @@
+"""
+长期记忆重排序模块
+对检索到的候选记忆按相关度、时间衰减与重要性综合打分，去除近似重复的记忆，
+在token预算内选出注入提示词的记忆
+"""
+import math
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from backend.services.local_memory import HashingEmbedder
+
+# 重要性元数据对应的分值
+IMPORTANCE_SCORES = {'low': 0.0, 'medium': 0.5, 'high': 1.0}
+# 缺少重要性元数据时的分值
+_DEFAULT_IMPORTANCE = 0.25
+# 每条记忆在格式化文本中的固定开销（序号、时间等）
+MEMORY_LINE_OVERHEAD = 12
+
+
+def _timestamp(memory):
+    """取记忆的时间戳：优先使用写入时的 metadata.timestamp，其次 created_at / updated_at"""
+    candidates = [(memory.get('metadata') or {}).get('timestamp'), memory.get('created_at'), memory.get('updated_at')]
+    for value in candidates:
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str) and value:
+            try:
+                return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                continue
+    return None
+
+
+class MemoryRanker:
+    """
+    长期记忆重排序器
+
+    综合分 = relevance_weight × 相关度 + recency_weight × 时间衰减 + importance_weight × 重要性，
+    三项均在0~1之间，对全部候选一次性用NumPy计算。时间衰减按半衰期指数衰减，缺少时间的记忆按0.5计。
+    按综合分从高到低选取，与已选记忆的文本向量余弦相似度不低于 dedup_threshold 的视为重复跳过，
+    超出token预算的跳过，最多选取 max_memories 条。
+    """
+
+    def __init__(self, max_memories=5, token_budget=400, relevance_weight=0.6, recency_weight=0.25,
+                 importance_weight=0.15, half_life_days=30, dedup_threshold=0.85, token_counter=None,
+                 embedder=None, clock=time.time):
+        """
+        初始化重排序器
+
+        Args:
+            max_memories: 最多注入的记忆条数
+            token_budget: 注入记忆的token预算，0表示不限制
+            relevance_weight: 相关度权重
+            recency_weight: 时间衰减权重
+            importance_weight: 重要性权重
+            half_life_days: 时间衰减的半衰期（天）
+            dedup_threshold: 视为重复的文本相似度阈值，大于等于1表示不去重
+            token_counter: 具有 count_text(text) 方法的token计数器，默认按字符数估算
+            embedder: 计算去重相似度的文本向量化器，默认 HashingEmbedder
+            clock: 时钟函数（便于测试替换）
+        """
+        self.max_memories = max_memories
+        self.token_budget = token_budget
+        self.weights = np.array([relevance_weight, recency_weight, importance_weight], dtype=np.float64)
+        self.half_life = half_life_days * 86400
+        self.dedup_threshold = dedup_threshold
+        self.token_counter = token_counter
+        self.embedder = embedder or HashingEmbedder(256)
+        self.clock = clock
+        self._lock = threading.Lock()
+
+        self.ranked = 0
+        self.candidates_total = 0
+        self.selected_total = 0
+        self.duplicates_total = 0
+        self.over_budget_total = 0
+
+    def rank(self, memories):
+        """
+        对候选记忆重排序并选取
+
+        Args:
+            memories: 检索到的候选记忆列表（Mem0返回格式，含 memory、score、metadata、created_at）
+
+        Returns:
+            list: 选中的记忆，按综合分从高到低；每条记忆增加 rank_score 字段（不修改传入的字典）
+        """
+        memories = [m for m in memories or [] if m.get('memory')]
+        if not memories:
+            return []
+
+        scores = self.score(memories)
+        order = np.argsort(-scores, kind='stable')
+
+        # 候选之间的两两相似度一次算出
+        similarity = None
+        if self.dedup_threshold < 1 and len(memories) > 1:
+            vectors = np.stack([self.embedder.embed(m['memory']) for m in memories])
+            similarity = vectors @ vectors.T
+
+        selected, chosen_rows = [], []
+        duplicates = over_budget = 0
+        remaining = self.token_budget or math.inf
+        for row in order:
+            if len(selected) >= self.max_memories:
+                break
+            if chosen_rows and similarity is not None:
+                if float(similarity[row, chosen_rows].max()) >= self.dedup_threshold:
+                    duplicates += 1
+                    continue
+            tokens = self._count_tokens(memories[row]['memory']) + MEMORY_LINE_OVERHEAD
+            if tokens > remaining:
+                # 继续尝试更短的记忆
+                over_budget += 1
+                continue
+            remaining -= tokens
+            chosen_rows.append(row)
+            selected.append(dict(memories[row], rank_score=round(float(scores[row]), 4)))
+
+        with self._lock:
+            self.ranked += 1
+            self.candidates_total += len(memories)
+            self.selected_total += len(selected)
+            self.duplicates_total += duplicates
+            self.over_budget_total += over_budget
+        return selected
+
+    def score(self, memories):
+        """
+        计算候选记忆的综合分
+
+        Args:
+            memories: 记忆列表
+
+        Returns:
+            np.ndarray: 与 memories 等长的综合分
+        """
+        now = self.clock()
+        features = np.empty((len(memories), 3), dtype=np.float64)
+        ages = np.full(len(memories), np.nan)
+        for i, memory in enumerate(memories):
+            score = memory.get('score')
+            features[i, 0] = score if isinstance(score, (int, float)) else 0.0
+            importance = (memory.get('metadata') or {}).get('importance')
+            features[i, 2] = IMPORTANCE_SCORES.get(importance, _DEFAULT_IMPORTANCE)
+            ts = _timestamp(memory)
+            if ts is not None:
+                ages[i] = max(0.0, now - ts)
+
+        np.clip(features[:, 0], 0.0, 1.0, out=features[:, 0])
+        if self.half_life > 0:
+            features[:, 1] = np.where(np.isnan(ages), 0.5, np.exp2(-np.nan_to_num(ages) / self.half_life))
+        else:
+            features[:, 1] = 0.5
+        return features @ self.weights
+
+    def stats(self):
+        """
+        获取重排序统计信息
+
+        Returns:
+            dict: 累计的候选、选中、去重与超出预算的记忆数
+        """
+        with self._lock:
+            return {
+                'ranked_requests': self.ranked,
+                'candidates': self.candidates_total,
+                'selected': self.selected_total,
+                'duplicates_removed': self.duplicates_total,
+                'over_budget_skipped': self.over_budget_total,
+                'max_memories': self.max_memories,
+                'token_budget': self.token_budget
+            }
+
+    def _count_tokens(self, text):
+        if self.token_counter is not None:
+            return self.token_counter.count_text(text)
+        return len(text)
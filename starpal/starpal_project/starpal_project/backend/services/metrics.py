@@ -0,0 +1,370 @@
+"""
+监控指标模块
+以Prometheus文本格式导出聊天流程的延迟与吞吐指标（/metrics），不依赖prometheus_client
+"""
+import math
+import threading
+import time
+
+# Prometheus文本格式的Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 延迟类直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 输出速度直方图的分桶（token/秒）
+RATE_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160, 320)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if math.isnan(value):
+        return 'NaN'
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类，按标签值保存子指标"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # 无标签的指标在首次更新前也导出0值
+            self._children[()] = self._new_child()
+
+    def labels(self, *values, **kwargs):
+        """
+        获取指定标签值的子指标
+
+        Args:
+            *values: 按 labelnames 顺序给出的标签值
+            **kwargs: 按名称给出的标签值
+
+        Returns:
+            子指标对象
+        """
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}")
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _default(self):
+        """无标签指标的唯一子指标"""
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self):
+        """
+        Returns:
+            list: 文本格式的样本行
+        """
+        with self._lock:
+            children = list(self._children.items())
+        lines = []
+        for values, child in sorted(children):
+            lines.extend(child.samples(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def samples(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self._value)}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._function = None
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """导出时调用 function() 取值，适合读取其他组件的当前状态"""
+        self._function = function
+
+    def samples(self, name, labelnames, values):
+        value = self._value
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                value = math.nan
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def samples(self, name, labelnames, values):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self._buckets, counts):
+            cumulative += n
+            le = 'le="%s"' % _format_value(bound)
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+        le = 'le="+Inf"'
+        lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {count}")
+        return lines
+
+
+class Histogram(_Metric):
+    """按分桶累计观测值的直方图"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+
+class MetricsRegistry:
+    """指标注册表，负责生成 /metrics 的文本内容"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        注册指标
+
+        Args:
+            metric: Counter / Gauge / Histogram 对象
+
+        Returns:
+            注册的指标对象
+        """
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """
+        生成Prometheus文本格式的全部指标
+
+        Returns:
+            str: 指标文本
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+# 全局指标注册表（每个进程单独统计，多worker部署时由Prometheus按实例汇总）
+registry = MetricsRegistry()
+
+CHAT_TTFT = registry.histogram(
+    'starpal_chat_time_to_first_token_seconds', '从收到聊天请求到输出首个文本块的时间')
+CHAT_STREAM = registry.histogram(
+    'starpal_chat_stream_seconds', '单次聊天请求的流式输出总时长')
+CHAT_TOKENS_PER_SECOND = registry.histogram(
+    'starpal_chat_tokens_per_second', '首个文本块之后的模型输出速度（按输出块计数，约等于token数）',
+    buckets=RATE_BUCKETS)
+CHAT_STAGE = registry.histogram(
+    'starpal_chat_stage_seconds', '聊天请求各处理阶段的耗时', ['stage'])
+CHAT_ERRORS = registry.counter(
+    'starpal_chat_errors_total', '聊天流程中按阶段统计的错误次数', ['stage'])
+CHAT_ACTIVE_STREAMS = registry.gauge(
+    'starpal_chat_active_streams', '正在输出的聊天流数量')
+CHAT_RESPONSES = registry.counter(
+    'starpal_chat_responses_total', '完成的聊天请求数', ['source'])
+MEM0_LATENCY = registry.histogram(
+    'starpal_mem0_request_seconds', '长期记忆后端的请求耗时', ['operation'])
+DB_QUERY = registry.histogram(
+    'starpal_db_query_seconds', '数据库语句的执行耗时', ['statement'])
+SESSION_STORE_ENTRIES = registry.gauge(
+    'starpal_session_store_entries', '短期会话存储中的对话数量')
+HTTP_REQUESTS = registry.histogram(
+    'starpal_http_request_seconds', '接口处理耗时（流式接口不含流式输出时间）', ['blueprint', 'endpoint', 'status'])
+
+
+def observe_chat(timer, coalescer, source='llm'):
+    """
+    记录一次聊天请求的延迟与吞吐指标
+
+    Args:
+        timer: 请求的StageTimer，需已标记 total（以及 first_token，如有输出）
+        coalescer: 本次请求的SSE合并器，chunks 为模型输出块数
+        source: 回复来源，'llm' 或 'cache'
+    """
+    stages = timer.stages
+    total = stages.get('total')
+    if total is not None:
+        CHAT_STREAM.observe(total)
+    first_token = stages.get('first_token')
+    if first_token is not None:
+        CHAT_TTFT.observe(first_token)
+        CHAT_RESPONSES.labels(source).inc()
+        generating = (total or first_token) - first_token
+        if source == 'llm' and generating > 0 and coalescer.chunks > 1:
+            CHAT_TOKENS_PER_SECOND.observe((coalescer.chunks - 1) / generating)
+    for name, seconds in stages.items():
+        if name not in ('total', 'first_token', 'last_token'):
+            CHAT_STAGE.labels(name).observe(seconds)
+
+
+def instrument_engine(engine):
+    """
+    为SQLAlchemy引擎注册语句执行耗时的监听
+
+    Args:
+        engine: SQLAlchemy Engine
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('starpal_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('starpal_query_start')
+        if starts:
+            verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+            DB_QUERY.labels(verb).observe(time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine, 'handle_error')
+    def _handle_error(context):
+        starts = context.connection.info.get('starpal_query_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+        CHAT_ERRORS.labels('db').inc()
+
+
+def instrument_blueprint(blueprint):
+    """
+    为蓝图注册接口耗时统计
+
+    Args:
+        blueprint: Flask蓝图
+    """
+    from flask import g, request
+
+    @blueprint.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @blueprint.after_request
+    def _observe_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            HTTP_REQUESTS.labels(blueprint.name, request.endpoint or '', response.status_code).observe(
+                time.perf_counter() - start
+            )
+        return response
@@ -0,0 +1,163 @@
+"""
+密码哈希模块
+使用标准库的 scrypt（内存困难型哈希）存储密码，哈希计算放在独立的进程池中执行，
+避免登录高峰时占满Web worker的CPU；子进程中执行的函数见 scrypt_hash 模块
+"""
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.config.config import Config
+from backend.services.scrypt_hash import PREFIX, check_password, hash_password, parse_hash
+
+
+class HasherBusy(Exception):
+    """等待哈希计算的请求过多"""
+
+
+class PasswordHasher:
+    """
+    密码哈希服务
+
+    哈希与校验在 spawn 方式启动的进程池中执行，进程数即同时占用的CPU核数；
+    排队中的计算数量有上限，超过上限且等待超时的请求抛出 HasherBusy。
+    workers 为0时在当前线程中直接计算（适合开发环境和测试）。
+    """
+
+    def __init__(self, n=16384, r=8, p=1, workers=2, max_pending=32, queue_timeout=5.0):
+        """
+        初始化密码哈希服务
+
+        Args:
+            n: scrypt CPU/内存开销参数
+            r: scrypt 块大小
+            p: scrypt 并行度
+            workers: 进程池大小，0表示不使用进程池
+            max_pending: 同时提交到进程池的最大计算数量
+            queue_timeout: 等待提交名额的最长秒数
+        """
+        self.n = n
+        self.r = r
+        self.p = p
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.busy = 0
+
+    def hash(self, password):
+        """
+        计算新密码的哈希
+
+        Args:
+            password: 明文密码
+
+        Returns:
+            str: 哈希字符串
+        """
+        self._count('hashed')
+        return self._run(hash_password, password, self.n, self.r, self.p)
+
+    def verify(self, password, stored):
+        """
+        校验密码
+
+        Args:
+            password: 待验证的明文密码
+            stored: 数据库中保存的密码字段
+
+        Returns:
+            tuple: (密码是否正确, 是否需要按当前参数重新哈希)
+        """
+        self._count('verified')
+        ok = self._run(check_password, password, stored)
+        return ok, ok and self.needs_rehash(stored)
+
+    def needs_rehash(self, stored):
+        """
+        判断存储的密码是否为明文或使用了与当前配置不同的参数
+
+        Args:
+            stored: 数据库中保存的密码字段
+
+        Returns:
+            bool: 是否需要重新哈希
+        """
+        params = parse_hash(stored)
+        return params is None or params[:3] != (self.n, self.r, self.p)
+
+    def stats(self):
+        """
+        获取哈希统计信息
+
+        Returns:
+            dict: 参数配置与累计计数
+        """
+        return {
+            'algorithm': PREFIX,
+            'n': self.n,
+            'r': self.r,
+            'p': self.p,
+            'workers': self.workers,
+            'hashed': self.hashed,
+            'verified': self.verified,
+            'rehashed': self.rehashed,
+            'busy': self.busy
+        }
+
+    def record_rehash(self):
+        """记录一次登录时的重新哈希"""
+        self._count('rehashed')
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _run(self, fn, *args):
+        """在进程池中执行哈希计算并等待结果"""
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count('busy')
+            raise HasherBusy()
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    # spawn方式启动，避免fork时复制Web worker中的线程与连接
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                    atexit.register(self.shutdown)
+        return self._executor
+
+
+# 全局密码哈希服务实例
+password_hasher = PasswordHasher(
+    n=Config.PASSWORD_HASH_N,
+    r=Config.PASSWORD_HASH_R,
+    p=Config.PASSWORD_HASH_P,
+    workers=Config.PASSWORD_HASH_WORKERS,
+    max_pending=Config.PASSWORD_HASH_MAX_PENDING,
+    queue_timeout=Config.PASSWORD_HASH_QUEUE_TIMEOUT
+)
@@ -0,0 +1,344 @@
+"""
+请求录制模块
+录制 /api/chat 与 /api/memory/* 的请求序列（到达时间、接口、脱敏后的参数、状态码与耗时），
+写入gzip压缩的JSON Lines文件，供 benchmarks/replay.py 回放做性能回归测试。
+
+脱敏规则：用户名、对话ID与记忆ID替换为带本次录制随机盐的HMAC假名，同一用户在一份录制中
+保持一致、不同录制之间无法关联；消息、提示词等文本替换为等长的占位文本，只保留长度与
+字符类别（中文/字母/数字/空白与标点），数值与布尔值原样保留。
+"""
+import atexit
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+
+from backend.config.config import Config
+
+# 替换为假名的字段
+_PSEUDONYM_FIELDS = {'username': 'u', 'chat_id': 'c', 'memory_id': 'm'}
+# 文本字段中原样保留的字符（空白与常见标点），其余字符按类别替换
+_KEEP = re.compile(r'[\s\.,!?;:\'"。，！？；：、~…「」“”‘’（）()\-]')
+# 两次刷新写入之间的最短间隔（秒），减少压缩流同步刷新的次数
+_FLUSH_INTERVAL = 1.0
+
+
+def mask_text(text):
+    """
+    将文本替换为等长的占位文本，保留字符类别
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        str: 中文等宽字符替换为'字'，字母替换为'a'，数字替换为'0'，空白与标点保留
+    """
+    out = []
+    for ch in text:
+        if _KEEP.match(ch):
+            out.append(ch)
+        elif ch.isdigit():
+            out.append('0')
+        elif ch.isascii():
+            out.append('a')
+        else:
+            out.append('字')
+    return ''.join(out)
+
+
+class RequestCapture:
+    """
+    请求录制器
+
+    每个进程写入单独的文件（文件名含启动时间与进程号），每条记录一行：
+        {"t": 相对录制开始的秒数, "u": 用户假名, "m": 方法, "r": 路由模板, "p": 脱敏后的路径,
+         "a": 是否携带认证令牌, "b": 脱敏后的请求体, "q": 脱敏后的查询参数, "s": 状态码, "d": 耗时毫秒}
+    流式响应的耗时在响应关闭（流式输出结束）时计算。按用户假名采样，被采样用户的全部请求都会录制，
+    以保留完整的会话形态。
+    """
+
+    def __init__(self, enabled=False, directory='data/capture', sample_rate=1.0, salt=None):
+        """
+        初始化录制器
+
+        Args:
+            enabled: 是否开启录制
+            directory: 录制文件目录
+            sample_rate: 按用户采样的比例 0~1
+            salt: 假名的HMAC密钥，默认每次启动随机生成
+        """
+        self.enabled = enabled
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.salt = salt or os.urandom(16)
+        self.path = None
+        self._file = None
+        self._start = time.time()
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+        self.recorded = 0
+        self.skipped = 0
+
+    def pseudonym(self, kind, value):
+        """
+        生成稳定的假名
+
+        Args:
+            kind: 字段类别前缀 u / c / m
+            value: 原始值
+
+        Returns:
+            str: 假名，如 'u-3f2a9c0d1b7e'
+        """
+        digest = hmac.new(self.salt, f"{kind}:{value}".encode('utf-8'), hashlib.sha256).hexdigest()
+        return f"{kind}-{digest[:12]}"
+
+    def sampled(self, user):
+        """
+        判断用户是否被采样（同一用户的结果固定）
+
+        Args:
+            user: 用户假名
+
+        Returns:
+            bool: 是否录制该用户的请求
+        """
+        if self.sample_rate >= 1:
+            return True
+        return int(user[2:10], 16) / 0xFFFFFFFF < self.sample_rate
+
+    def anonymize(self, value):
+        """
+        递归脱敏请求体或查询参数
+
+        Args:
+            value: JSON值
+
+        Returns:
+            脱敏后的值
+        """
+        if isinstance(value, dict):
+            result = {}
+            for key, item in value.items():
+                if key in _PSEUDONYM_FIELDS and isinstance(item, str):
+                    result[key] = self.pseudonym(_PSEUDONYM_FIELDS[key], item.strip())
+                else:
+                    result[key] = self.anonymize(item)
+            return result
+        if isinstance(value, list):
+            return [self.anonymize(item) for item in value]
+        if isinstance(value, str):
+            return mask_text(value)
+        return value
+
+    def anonymize_query(self, args):
+        """
+        脱敏查询参数，纯数字的参数（如 limit）原样保留
+
+        Args:
+            args: 查询参数字典
+
+        Returns:
+            dict: 脱敏后的查询参数，无参数时返回None
+        """
+        if not args:
+            return None
+        return {key: value if value.isdigit() else self.anonymize({key: value})[key] for key, value in args.items()}
+
+    def timestamp(self):
+        """返回录制开始以来的秒数，作为记录的 t 字段"""
+        return round(time.time() - self._start, 3)
+
+    def make_entry(self, t, username, method, rule, path, authorized, body, query, status):
+        """
+        构建一条请求记录，Flask蓝图与异步路由共用
+
+        Args:
+            t: 请求开始的时间（timestamp() 的返回值）
+            username: 请求所属的用户名
+            method: 请求方法
+            rule: 路由规则
+            path: 请求路径（路径中的ID需已脱敏）
+            authorized: 是否携带了 Bearer 令牌
+            body: 解析后的JSON请求体，没有时为None
+            query: 查询参数字典
+            status: 响应状态码
+
+        Returns:
+            dict: 记录字典（不含耗时 d），无法识别用户或用户未被采样时记为跳过并返回None
+        """
+        if not isinstance(username, str) or not username.strip():
+            # 无法识别用户的请求（如参数错误）不录制
+            self.skip()
+            return None
+        user = self.pseudonym('u', username.strip())
+        if not self.sampled(user):
+            self.skip()
+            return None
+        return {
+            't': t,
+            'u': user,
+            'm': method,
+            'r': rule,
+            'p': path,
+            'a': authorized,
+            'b': self.anonymize(body) if body is not None else None,
+            'q': self.anonymize_query(query),
+            's': status
+        }
+
+    def record(self, entry):
+        """
+        写入一条记录
+
+        Args:
+            entry: 记录字典（不含 t 字段时使用当前时间）
+        """
+        entry.setdefault('t', round(time.time() - self._start, 3))
+        line = (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._lock:
+            try:
+                self._get_file().write(line)
+                now = time.monotonic()
+                if now - self._last_flush >= _FLUSH_INTERVAL:
+                    # 同步刷新压缩流，进程异常退出时已写入的记录仍可读取
+                    self._file.flush()
+                    self._last_flush = now
+                self.recorded += 1
+            except OSError as e:
+                print(f"写入请求录制失败: {e}")
+
+    def skip(self):
+        """记录一次未录制的请求"""
+        with self._lock:
+            self.skipped += 1
+
+    def close(self):
+        """关闭录制文件"""
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
+
+    def stats(self):
+        """
+        获取录制统计信息
+
+        Returns:
+            dict: 是否开启、文件路径与录制/跳过的请求数
+        """
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'path': self.path,
+                'sample_rate': self.sample_rate,
+                'recorded': self.recorded,
+                'skipped': self.skipped
+            }
+
+    def _get_file(self):
+        """打开录制文件并写入文件头，需在持锁状态下调用"""
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            started = time.strftime('%Y%m%d-%H%M%S', time.localtime(self._start))
+            self.path = os.path.join(self.directory, f"capture-{started}-{os.getpid()}.jsonl.gz")
+            self._file = gzip.open(self.path, 'ab')
+            header = {'capture': 1, 'started': round(self._start, 3), 'pid': os.getpid()}
+            self._file.write((json.dumps(header) + '\n').encode('utf-8'))
+        return self._file
+
+
+def read_capture(path):
+    """
+    读取录制文件，忽略因进程异常退出而截断的末尾
+
+    Args:
+        path: 录制文件路径
+
+    Returns:
+        tuple: (文件头字典, 记录列表)
+    """
+    header, records = {}, []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                item = json.loads(line)
+                if 'capture' in item:
+                    header = item
+                else:
+                    records.append(item)
+        except (EOFError, OSError, ValueError):
+            pass
+    return header, records
+
+
+def capture_blueprint(blueprint):
+    """
+    为蓝图注册请求录制，录制未开启时不注册任何钩子
+
+    用户取自请求体的 username，或 validate_token 校验通过后的 g.current_user。
+
+    Args:
+        blueprint: Flask蓝图
+    """
+    if not request_capture.enabled:
+        return
+    from flask import g, request
+
+    @blueprint.before_request
+    def _capture_start():
+        g.capture_start = time.perf_counter()
+        g.capture_time = request_capture.timestamp()
+
+    @blueprint.after_request
+    def _capture_request(response):
+        start = g.pop('capture_start', None)
+        if start is None:
+            return response
+        body = request.get_json(silent=True) if request.is_json else None
+        username = body.get('username') if isinstance(body, dict) else None
+        if not isinstance(username, str):
+            username = (g.get('current_user') or {}).get('username')
+
+        path = request.path
+        view_args = request.view_args or {}
+        if 'memory_id' in view_args:
+            path = path.replace(view_args['memory_id'], request_capture.pseudonym('m', view_args['memory_id']))
+        entry = request_capture.make_entry(
+            g.pop('capture_time'), username, request.method,
+            request.url_rule.rule if request.url_rule else request.path, path,
+            request.headers.get('Authorization', '').startswith('Bearer '),
+            body, request.args.to_dict(), response.status_code
+        )
+        if entry is None:
+            return response
+
+        def finish():
+            entry['d'] = round((time.perf_counter() - start) * 1000, 2)
+            request_capture.record(entry)
+
+        if response.is_streamed:
+            # 流式响应在输出结束、响应关闭时记录总耗时
+            response.call_on_close(finish)
+        else:
+            finish()
+        return response
+
+
+# 全局请求录制器实例
+request_capture = RequestCapture(
+    enabled=Config.CAPTURE_ENABLED,
+    directory=Config.CAPTURE_DIR,
+    sample_rate=Config.CAPTURE_SAMPLE_RATE
+)
+atexit.register(request_capture.close)
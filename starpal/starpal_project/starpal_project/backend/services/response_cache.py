@@ -0,0 +1,252 @@
+"""
+模型回复缓存模块
+缓存完整的模型回复，相同（或近似相同）的提示词再次出现时直接回放，不再调用模型
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from backend.services.retrieval_cache import normalize_query
+
+# 计算相似度时忽略的标点与空白
+_IGNORED = re.compile(r'[\s\.,!?;:\'"。，！？；：、~…「」“”‘’（）()]+')
+
+
+def _digest(*parts):
+    """对若干字符串计算SHA-256摘要"""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def shingles(text, size=2):
+    """
+    将文本切分为字符n-gram集合，用于计算Jaccard相似度
+
+    中文逐字切分即可表达词语，短文本（不足 size 个字符）整体作为一个元素。
+
+    Args:
+        text: 原始文本
+        size: n-gram长度
+
+    Returns:
+        frozenset: 字符n-gram集合
+    """
+    text = _IGNORED.sub('', normalize_query(text))
+    if len(text) <= size:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + size] for i in range(len(text) - size + 1))
+
+
+def jaccard(a, b):
+    """
+    计算两个集合的Jaccard相似度
+
+    Args:
+        a: 集合
+        b: 集合
+
+    Returns:
+        float: 0~1之间的相似度
+    """
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class CacheProbe:
+    """
+    一次查找使用的缓存键，未命中时传给 store() 写入
+
+    Attributes:
+        key: 完整提示词（系统提示词、对话历史与当前消息）的摘要
+        context: 除当前消息外其余部分的摘要，近似匹配只在 context 相同的条目之间进行
+        shingles: 当前消息的字符n-gram集合
+    """
+
+    __slots__ = ('key', 'context', 'shingles')
+
+    def __init__(self, key, context, shingles):
+        self.key = key
+        self.context = context
+        self.shingles = shingles
+
+
+class ResponseCache:
+    """
+    模型回复缓存
+
+    以发送给模型的完整消息列表（系统级提示词、用户提示词、裁剪后的对话历史与当前消息）
+    的摘要为键；similarity 大于0时，对于上下文完全相同、只有当前消息措辞不同的请求，
+    按字符二元组的Jaccard相似度做近似匹配。条目按TTL过期，并按条目数与回复总字节数做LRU淘汰。
+    缓存只在当前进程内生效。
+    """
+
+    def __init__(self, ttl=3600, max_entries=1000, max_bytes=8 * 1024 * 1024, similarity=0.0,
+                 max_candidates=64, clock=time.monotonic):
+        """
+        初始化回复缓存
+
+        Args:
+            ttl: 条目有效期（秒）
+            max_entries: 最大条目数
+            max_bytes: 缓存回复的最大总字节数，超过该值的单条回复不缓存
+            similarity: 近似匹配的Jaccard相似度阈值，0表示只做精确匹配
+            max_candidates: 近似匹配时每个上下文最多比较的条目数（最近写入的优先）
+            clock: 时钟函数（便于测试替换）
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.similarity = similarity
+        self.max_candidates = max_candidates
+        self.clock = clock
+
+        # {key: (回复, 字节数, 写入时间, context, shingles)}，按最近使用排序
+        self._entries = OrderedDict()
+        # {context: OrderedDict{key: None}}，近似匹配的候选索引
+        self._contexts = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def probe(messages):
+        """
+        根据消息列表生成缓存键
+
+        Args:
+            messages: 发送给模型的消息列表，最后一条为当前用户消息
+
+        Returns:
+            CacheProbe: 缓存键
+        """
+        context = _digest(json.dumps([[m.type, m.content] for m in messages[:-1]], ensure_ascii=False))
+        last = messages[-1].content if messages else ''
+        return CacheProbe(_digest(context, last), context, shingles(last))
+
+    def lookup(self, messages):
+        """
+        查找缓存的回复
+
+        Args:
+            messages: 发送给模型的消息列表
+
+        Returns:
+            tuple: (CacheProbe, 回复文本)，未命中时回复为None
+        """
+        probe = self.probe(messages)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(probe.key)
+            if entry is not None and now - entry[2] > self.ttl:
+                self._remove(probe.key)
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(probe.key)
+                return probe, entry[0]
+
+            if self.similarity > 0:
+                key = self._nearest(probe, now)
+                if key is not None:
+                    self.near_hits += 1
+                    self._entries.move_to_end(key)
+                    return probe, self._entries[key][0]
+
+            self.misses += 1
+            return probe, None
+
+    def store(self, probe, reply):
+        """
+        写入完整的回复
+
+        Args:
+            probe: lookup() 返回的缓存键
+            reply: 完整回复文本
+
+        Returns:
+            bool: 是否写入
+        """
+        size = len(reply.encode('utf-8'))
+        if not reply or size > self.max_bytes:
+            return False
+        with self._lock:
+            if probe.key in self._entries:
+                self._remove(probe.key)
+            self._entries[probe.key] = (reply, size, self.clock(), probe.context, probe.shingles)
+            self._contexts.setdefault(probe.context, OrderedDict())[probe.key] = None
+            self._bytes += size
+            self.stores += 1
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._contexts.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        获取缓存统计信息
+
+        Returns:
+            dict: 条目数、字节数及命中/近似命中/未命中次数
+        """
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.near_hits) / lookups, 3) if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'ttl': self.ttl,
+                'similarity': self.similarity
+            }
+
+    def _nearest(self, probe, now):
+        """在相同上下文的条目中查找最相似且未过期的条目，需在持锁状态下调用"""
+        candidates = self._contexts.get(probe.context)
+        if not candidates or not probe.shingles:
+            return None
+        best_key, best_score = None, self.similarity
+        expired = []
+        for key in list(reversed(candidates))[:self.max_candidates]:
+            entry = self._entries[key]
+            if now - entry[2] > self.ttl:
+                expired.append(key)
+                continue
+            score = jaccard(probe.shingles, entry[4])
+            if score >= best_score:
+                best_key, best_score = key, score
+        for key in expired:
+            self._remove(key)
+        return best_key
+
+    def _remove(self, key):
+        """删除单个条目并维护上下文索引，需在持锁状态下调用"""
+        reply, size, _, context, _ = self._entries.pop(key)
+        self._bytes -= size
+        keys = self._contexts.get(context)
+        if keys is not None:
+            keys.pop(key, None)
+            if not keys:
+                del self._contexts[context]
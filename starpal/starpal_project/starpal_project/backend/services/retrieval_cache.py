@@ -0,0 +1,225 @@
+"""
+长期记忆检索缓存模块
+缓存Mem0检索结果，减少重复的网络请求
+"""
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# 查询末尾不影响语义的标点
+_TRAILING_PUNCTUATION = re.compile(r'[\s\.,!?;:。，！？；：、~…]+$')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query):
+    """
+    规范化检索语句：统一全角/半角、大小写、空白，去掉末尾标点
+
+    Args:
+        query: 原始检索语句
+
+    Returns:
+        str: 规范化后的检索语句
+    """
+    text = unicodedata.normalize('NFKC', query or '').lower()
+    text = _WHITESPACE.sub(' ', text).strip()
+    return _TRAILING_PUNCTUATION.sub('', text)
+
+
+class RetrievalCache:
+    """
+    按用户划分的检索结果缓存
+
+    以 (规范化查询, 过滤条件, 返回数量) 为键保存检索到的记忆列表，支持TTL、
+    每用户条目上限和全局条目上限。用户的记忆发生写入时调用 invalidate_user()
+    使该用户的全部缓存失效，无法确定归属时调用 invalidate_all()。
+
+    失效前发起、失效后才返回的检索结果不会被写回缓存：每次失效使全局代数加一，检索发起时
+    记下当前代数，写回时与该用户最近一次失效的代数比较；invalidate_all() 抬高所有用户共用的
+    下限，从未缓存过的用户同样生效。没有缓存条目的用户的失效记录超过上限时被清理，
+    清理时同样抬高下限，代价只是当时正在进行的检索不写回缓存。
+    """
+
+    def __init__(self, ttl=60, max_entries=1000, max_entries_per_user=20, clock=time.monotonic):
+        """
+        初始化缓存
+
+        Args:
+            ttl: 条目有效期（秒）
+            max_entries: 全局最大条目数
+            max_entries_per_user: 每个用户的最大条目数
+            clock: 时钟函数（便于测试替换）
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_entries_per_user = max_entries_per_user
+        self.clock = clock
+
+        # {user_id: OrderedDict{key: (memories, 写入时间)}}，用户按最近使用排序
+        self._users = OrderedDict()
+        # 全局代数，每次失效加一
+        self._generation = 0
+        # {user_id: 该用户最近一次失效后的代数}
+        self._invalidated = {}
+        # 没有单独记录的用户视为在此代数失效
+        self._floor = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_writes = 0
+
+    @staticmethod
+    def make_key(query, filters=None, limit=None):
+        """
+        生成缓存键
+
+        Args:
+            query: 检索语句
+            filters: 过滤条件
+            limit: 返回数量
+
+        Returns:
+            tuple: 缓存键
+        """
+        filters_key = json.dumps(filters, sort_keys=True, ensure_ascii=False) if filters else ''
+        return normalize_query(query), filters_key, limit
+
+    def generation(self, user_id):
+        """
+        获取当前的缓存代数，发起检索前调用，写回结果时传入
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            int: 缓存代数
+        """
+        with self._lock:
+            return self._generation
+
+    def get(self, user_id, query, filters=None, limit=None):
+        """
+        读取缓存的检索结果
+
+        Args:
+            user_id: 用户ID
+            query: 检索语句
+            filters: 过滤条件
+            limit: 返回数量
+
+        Returns:
+            list: 记忆列表，未命中时返回None
+        """
+        key = self.make_key(query, filters, limit)
+        with self._lock:
+            entries = self._users.get(user_id)
+            entry = entries.get(key) if entries is not None else None
+            if entry is not None and self.clock() - entry[1] > self.ttl:
+                self._remove(user_id, key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entries.move_to_end(key)
+            self._users.move_to_end(user_id)
+            return entry[0]
+
+    def put(self, user_id, query, memories, filters=None, limit=None, generation=None):
+        """
+        写入检索结果
+
+        Args:
+            user_id: 用户ID
+            query: 检索语句
+            memories: 记忆列表
+            filters: 过滤条件
+            limit: 返回数量
+            generation: 发起检索时的缓存代数，此后该用户的缓存被失效过时放弃写入
+
+        Returns:
+            bool: 是否写入
+        """
+        key = self.make_key(query, filters, limit)
+        with self._lock:
+            if generation is not None and generation < max(self._floor, self._invalidated.get(user_id, 0)):
+                self.stale_writes += 1
+                return False
+
+            entries = self._users.setdefault(user_id, OrderedDict())
+            if key in entries:
+                self._remove(user_id, key)
+                entries = self._users.setdefault(user_id, OrderedDict())
+            entries[key] = (memories, self.clock())
+            self._size += 1
+            self._users.move_to_end(user_id)
+
+            while len(entries) > self.max_entries_per_user:
+                self._remove(user_id, next(iter(entries)))
+            # 全局超限时从最久未使用的用户开始淘汰
+            while self._size > self.max_entries:
+                oldest_user = next(iter(self._users))
+                self._remove(oldest_user, next(iter(self._users[oldest_user])))
+            return True
+
+    def invalidate_user(self, user_id):
+        """
+        使用户的全部缓存失效
+
+        Args:
+            user_id: 用户ID
+        """
+        with self._lock:
+            self._generation += 1
+            self._invalidated[user_id] = self._generation
+            entries = self._users.pop(user_id, None)
+            if entries:
+                self._size -= len(entries)
+            self.invalidations += 1
+            if len(self._invalidated) > self.max_entries:
+                self._prune_invalidated()
+
+    def invalidate_all(self):
+        """使全部用户的缓存失效，包括尚未缓存过、检索仍在进行中的用户"""
+        with self._lock:
+            self._generation += 1
+            self._floor = self._generation
+            self._invalidated.clear()
+            self._users.clear()
+            self._size = 0
+            self.invalidations += 1
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                'entries': self._size,
+                'users': len(self._users),
+                'invalidated_users': len(self._invalidated),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'stale_writes': self.stale_writes,
+                'ttl': self.ttl,
+                'max_entries': self.max_entries,
+                'max_entries_per_user': self.max_entries_per_user
+            }
+
+    def _prune_invalidated(self):
+        """清理没有缓存条目的用户的失效记录，并把下限抬高到其中最大的代数，需在持锁状态下调用"""
+        for user_id in [user_id for user_id in self._invalidated if user_id not in self._users]:
+            self._floor = max(self._floor, self._invalidated.pop(user_id))
+
+    def _remove(self, user_id, key):
+        """删除单个条目，用户没有剩余条目时一并移除，需在持锁状态下调用"""
+        entries = self._users[user_id]
+        del entries[key]
+        self._size -= 1
+        if not entries:
+            del self._users[user_id]
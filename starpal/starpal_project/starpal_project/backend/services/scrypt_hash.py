@@ -0,0 +1,86 @@
+"""
+scrypt 密码哈希计算函数
+password_hasher 的进程池在子进程中执行本模块的函数。子进程反序列化任务时会导入函数所在的模块，
+因此本模块只依赖标准库，不导入配置、Flask 或其他服务模块。
+"""
+import base64
+import hashlib
+import hmac
+import os
+
+# 哈希值格式：scrypt$n$r$p$盐$哈希，总长度约85个字符，可存入 String(120) 的 password 列
+PREFIX = 'scrypt'
+_SALT_BYTES = 16
+_KEY_BYTES = 32
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(
+        password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r + 1024 * 1024, dklen=_KEY_BYTES
+    )
+
+
+def hash_password(password, n, r, p):
+    """
+    计算密码哈希（CPU密集，通常在进程池中执行）
+
+    Args:
+        password: 明文密码
+        n: CPU/内存开销参数，必须是2的幂
+        r: 块大小
+        p: 并行度
+
+    Returns:
+        str: scrypt$n$r$p$盐$哈希 格式的字符串
+    """
+    salt = os.urandom(_SALT_BYTES)
+    key = _scrypt(password, salt, n, r, p)
+    return f"{PREFIX}${n}${r}${p}${_b64encode(salt)}${_b64encode(key)}"
+
+
+def check_password(password, stored):
+    """
+    校验密码（CPU密集，通常在进程池中执行）
+
+    不是scrypt格式的存储值视为旧版本的明文密码，使用常量时间比较。
+
+    Args:
+        password: 待验证的明文密码
+        stored: 数据库中保存的密码字段
+
+    Returns:
+        bool: 密码是否正确
+    """
+    params = parse_hash(stored)
+    if params is None:
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    n, r, p, salt, key = params
+    return hmac.compare_digest(_scrypt(password, salt, n, r, p), key)
+
+
+def parse_hash(stored):
+    """
+    解析哈希字符串
+
+    Args:
+        stored: 数据库中保存的密码字段
+
+    Returns:
+        tuple: (n, r, p, 盐, 哈希)，不是scrypt格式时返回None
+    """
+    parts = stored.split('$')
+    if len(parts) != 6 or parts[0] != PREFIX:
+        return None
+    try:
+        return int(parts[1]), int(parts[2]), int(parts[3]), _b64decode(parts[4]), _b64decode(parts[5])
+    except ValueError:
+        return None
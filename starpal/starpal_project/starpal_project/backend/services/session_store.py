@@ -0,0 +1,297 @@
+"""
+会话存储模块
+为短期对话记忆、系统提示词等按会话保存的状态提供有界存储
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionStore:
+    """
+    会话存储接口
+
+    所有实现都以 username__chat_id 为键，需要提供 get / put / pop / stats 等方法，
+    AIService 只依赖此接口，便于替换为其他存储实现。
+    """
+
+    def get(self, key, default=None):
+        """读取条目，不存在时返回default"""
+        raise NotImplementedError
+
+    def put(self, key, value):
+        """写入条目；条目被原地修改后也应重新put以更新占用统计"""
+        raise NotImplementedError
+
+    def pop(self, key, default=None):
+        """删除并返回条目，不触发淘汰回调"""
+        raise NotImplementedError
+
+    def stats(self):
+        """返回存储统计信息字典"""
+        raise NotImplementedError
+
+    def __contains__(self, key):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+def default_sizeof(value):
+    """
+    估算条目占用的字节数
+
+    Args:
+        value: 条目值
+
+    Returns:
+        int: 估算字节数
+    """
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return sys.getsizeof(value)
+
+
+class LRUSessionStore(SessionStore):
+    """
+    基于LRU顺序的有界会话存储
+
+    支持最大条目数、最大字节预算和空闲TTL三种淘汰条件，
+    淘汰时调用 on_evict(key, value, reason) 回调，reason 取值为
+    'capacity'（条目数超限）、'bytes'（字节预算超限）或 'expired'（空闲超时）。
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, idle_ttl=None,
+                 sizeof=None, on_evict=None, clock=time.monotonic):
+        """
+        初始化会话存储
+
+        Args:
+            max_entries: 最大条目数，None或0表示不限制
+            max_bytes: 最大字节预算，None或0表示不限制
+            idle_ttl: 空闲超时秒数，None或0表示不过期
+            sizeof: 估算条目字节数的函数
+            on_evict: 淘汰回调函数
+            clock: 时钟函数（便于测试替换）
+        """
+        self.max_entries = max_entries or None
+        self.max_bytes = max_bytes or None
+        self.idle_ttl = idle_ttl or None
+        self.sizeof = sizeof or default_sizeof
+        self.on_evict = on_evict
+        self.clock = clock
+
+        # {key: [value, size, last_access]}，按最近访问顺序排列
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {'capacity': 0, 'bytes': 0, 'expired': 0}
+
+    def get(self, key, default=None):
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry, self.clock()):
+                evicted.append(self._remove(key, 'expired'))
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                result = default
+            else:
+                self.hits += 1
+                entry[2] = self.clock()
+                self._entries.move_to_end(key)
+                result = entry[0]
+
+        self._notify(evicted)
+        return result
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            now = self.clock()
+            old = self._entries.get(key)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[key] = [value, size, now]
+            self._entries.move_to_end(key)
+            self._total_bytes += size
+            evicted = self._enforce_limits(key, now)
+
+        self._notify(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self._total_bytes -= entry[1]
+            return entry[0]
+
+    def sweep(self):
+        """
+        主动清理所有空闲超时的条目
+
+        Returns:
+            int: 清理的条目数量
+        """
+        with self._lock:
+            evicted = self._sweep_expired(self.clock())
+        self._notify(evicted)
+        return len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'idle_ttl': self.idle_ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': dict(self.evictions),
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._is_expired(entry, self.clock())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _is_expired(self, entry, now):
+        return self.idle_ttl is not None and now - entry[2] > self.idle_ttl
+
+    def _remove(self, key, reason):
+        """移除条目并记录淘汰原因，需在持锁状态下调用"""
+        value, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+        self.evictions[reason] += 1
+        return key, value, reason
+
+    def _sweep_expired(self, now):
+        """从最久未访问的一端清理过期条目，需在持锁状态下调用"""
+        evicted = []
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if not self._is_expired(entry, now):
+                break
+            evicted.append(self._remove(key, 'expired'))
+        return evicted
+
+    def _enforce_limits(self, protected_key, now):
+        """
+        按TTL、条目数和字节预算淘汰条目，需在持锁状态下调用
+
+        刚写入的条目（protected_key）不会被淘汰，避免当前会话丢失上下文。
+        """
+        evicted = self._sweep_expired(now)
+
+        while self.max_entries is not None and len(self._entries) > self.max_entries:
+            key = next(iter(self._entries))
+            if key == protected_key:
+                break
+            evicted.append(self._remove(key, 'capacity'))
+
+        while self.max_bytes is not None and self._total_bytes > self.max_bytes:
+            key = next(iter(self._entries))
+            if key == protected_key:
+                break
+            evicted.append(self._remove(key, 'bytes'))
+
+        return evicted
+
+    def _notify(self, evicted):
+        """在锁外调用淘汰回调，回调异常不影响存储本身"""
+        if not self.on_evict:
+            return
+        for key, value, reason in evicted:
+            try:
+                self.on_evict(key, value, reason)
+            except Exception as e:
+                print(f"会话淘汰回调执行失败: {e}")
+
+
+class SharedSessionStore(SessionStore):
+    """
+    基于共享状态后端的会话存储
+
+    条目序列化后保存在 StateBackend（SQLite / Redis 等）中，多个worker进程看到同一份状态。
+    空闲过期由后端的TTL实现，每次读写都会刷新TTL；条目数和内存上限交由后端自身控制
+    （如Redis的maxmemory策略），因此不会触发淘汰回调。
+    """
+
+    def __init__(self, backend, namespace, dumps, loads, idle_ttl=None):
+        """
+        初始化共享会话存储
+
+        Args:
+            backend: StateBackend实例
+            namespace: 键前缀，区分不同用途的存储
+            dumps: 将条目序列化为字符串的函数
+            loads: 将字符串反序列化为条目的函数
+            idle_ttl: 空闲超时秒数，None或0表示不过期
+        """
+        self.backend = backend
+        self.namespace = namespace
+        self.dumps = dumps
+        self.loads = loads
+        self.idle_ttl = idle_ttl or None
+        # 条目数量由 count 统计，提前声明前缀以便后端维护计数索引
+        self.backend.track(namespace)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        raw = self.backend.get(self._key(key))
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if raw is None:
+            return default
+        if self.idle_ttl:
+            # 只刷新空闲TTL：其他worker可能已在读取之后写入了更新的条目，不能把读到的旧值写回
+            self.backend.touch(self._key(key), self.idle_ttl)
+        return self.loads(raw)
+
+    def put(self, key, value):
+        self.backend.set(self._key(key), self.dumps(value), ttl=self.idle_ttl)
+
+    def pop(self, key, default=None):
+        raw = self.backend.get(self._key(key))
+        self.backend.delete(self._key(key))
+        return self.loads(raw) if raw is not None else default
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.backend.name,
+                'entries': len(self),
+                'idle_ttl': self.idle_ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def __contains__(self, key):
+        return self.backend.get(self._key(key)) is not None
+
+    def __len__(self):
+        return self.backend.count(self.namespace)
+
+    def _key(self, key):
+        return f"{self.namespace}{key}"
@@ -0,0 +1,404 @@
+"""
+共享状态后端模块
+为多进程部署提供跨worker共享的键值存储（系统提示词、短期对话记忆等）
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+class StateBackend:
+    """
+    共享状态后端接口
+
+    值统一为字符串，过期时间以秒为单位，None表示永不过期。
+    """
+
+    name = 'base'
+
+    def get(self, key):
+        """读取键值，不存在或已过期时返回None"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """写入键值"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """删除键"""
+        raise NotImplementedError
+
+    def touch(self, key, ttl):
+        """只刷新键的过期时间，不改写值；键不存在或已过期时无操作"""
+        raise NotImplementedError
+
+    def set_nx(self, key, value, ttl):
+        """
+        键不存在（或已过期）时写入，用于实现跨进程的锁
+
+        Returns:
+            bool: 是否写入
+        """
+        raise NotImplementedError
+
+    def delete_if(self, key, value):
+        """
+        键的当前值等于 value 时删除，用于释放自己持有的锁
+
+        Returns:
+            bool: 是否删除
+        """
+        raise NotImplementedError
+
+    def incr(self, key):
+        """
+        原子地将整数值加一
+
+        Returns:
+            int: 加一后的值
+        """
+        raise NotImplementedError
+
+    def count(self, prefix):
+        """统计指定前缀下未过期的键数量"""
+        raise NotImplementedError
+
+    def track(self, prefix):
+        """声明会对该前缀调用 count，需要维护计数索引的后端据此建立索引，默认无操作"""
+
+    def close(self):
+        """释放资源，默认无操作"""
+
+
+class LocalStateBackend(StateBackend):
+    """
+    进程内状态后端
+
+    不在进程间共享，用于单进程运行和测试，行为与其他后端保持一致。
+    """
+
+    name = 'local'
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = self.clock() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def touch(self, key, ttl):
+        now = self.clock()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= now):
+                return
+            self._data[key] = (entry[0], now + ttl if ttl else None)
+
+    def set_nx(self, key, value, ttl):
+        now = self.clock()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                return False
+            self._data[key] = (value, now + ttl if ttl else None)
+            return True
+
+    def delete_if(self, key, value):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != value:
+                return False
+            del self._data[key]
+            return True
+
+    def incr(self, key):
+        with self._lock:
+            value, expires_at = self._data.get(key, ('0', None))
+            value = str(int(value) + 1)
+            self._data[key] = (value, expires_at)
+            return int(value)
+
+    def count(self, prefix):
+        now = self.clock()
+        with self._lock:
+            return sum(1 for key, (_, expires_at) in self._data.items()
+                       if key.startswith(prefix) and (expires_at is None or expires_at > now))
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    基于SQLite（WAL模式）的状态后端
+
+    适合单机多worker部署：各进程共享同一个数据库文件，WAL模式下读写互不阻塞。
+    每个线程使用独立的连接，过期数据在写入时按固定间隔清理。
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, busy_timeout_ms=5000, purge_interval=60):
+        """
+        初始化SQLite状态后端
+
+        Args:
+            path: 数据库文件路径
+            busy_timeout_ms: 等待写锁的超时时间（毫秒）
+            purge_interval: 清理过期数据的最小间隔秒数
+        """
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._last_purge = 0.0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS kv ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_kv_expires_at ON kv (expires_at)')
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self._conn().execute(
+            'INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at',
+            (key, value, expires_at)
+        )
+        self._maybe_purge()
+
+    def delete(self, key):
+        self._conn().execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def touch(self, key, ttl):
+        now = time.time()
+        self._conn().execute(
+            'UPDATE kv SET expires_at = ? WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (now + ttl if ttl else None, key, now)
+        )
+
+    def set_nx(self, key, value, ttl):
+        now = time.time()
+        # 冲突时只覆盖已过期的行；changes 为0表示键仍被占用
+        cursor = self._conn().execute(
+            'INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at '
+            'WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?',
+            (key, value, now + ttl if ttl else None, now)
+        )
+        return cursor.rowcount == 1
+
+    def delete_if(self, key, value):
+        cursor = self._conn().execute('DELETE FROM kv WHERE key = ? AND value = ?', (key, value))
+        return cursor.rowcount == 1
+
+    def incr(self, key):
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, '1', NULL) "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+                (key,)
+            )
+            row = conn.execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()
+        return int(row[0])
+
+    def count(self, prefix):
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM kv WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+            (prefix, prefix + '\uffff', time.time())
+        ).fetchone()
+        return row[0]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _conn(self):
+        """获取当前线程的数据库连接（自动提交模式）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = now
+        self._conn().execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?', (now,))
+
+
+class RedisStateBackend(StateBackend):
+    """
+    基于Redis协议的状态后端
+
+    适合跨主机的多worker部署，依赖可选的 redis 包；
+    兼容任何实现Redis协议的存储（Redis、Valkey、KeyDB等）。
+
+    按前缀计数不扫描键空间：通过 track 声明的前缀各维护一个有序集合，成员为键、分值为过期时间，
+    写入和删除时在同一次往返中更新，count 只清理已过期的成员并返回集合大小。
+    被 maxmemory 策略提前淘汰的键要到原定过期时间才从索引中移除，因此计数是近似值。
+    """
+
+    name = 'redis'
+
+    # 计数索引的键前缀，不与被统计的前缀重叠
+    INDEX_PREFIX = 'starpal:keyindex:'
+
+    def __init__(self, url, purge_interval=60):
+        """
+        Args:
+            url: 连接地址，例如 redis://localhost:6379/0
+            purge_interval: 写入时清理索引中过期成员的最小间隔秒数
+        """
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.purge_interval = purge_interval
+        self._prefixes = ()
+        self._last_purge = 0.0
+        self._delete_if_script = None
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None):
+        index = self._index_for(key)
+        if index is None:
+            self.client.set(key, value, ex=int(ttl) if ttl else None)
+            return
+        expires_at = time.time() + int(ttl) if ttl else float('inf')
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(key, value, ex=int(ttl) if ttl else None)
+        pipe.zadd(index, {key: expires_at})
+        pipe.execute()
+        self._maybe_purge(index)
+
+    def delete(self, key):
+        index = self._index_for(key)
+        if index is None:
+            self.client.delete(key)
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(key)
+        pipe.zrem(index, key)
+        pipe.execute()
+
+    def touch(self, key, ttl):
+        index = self._index_for(key)
+        pipe = self.client.pipeline(transaction=False)
+        if ttl:
+            pipe.expire(key, int(ttl))
+        else:
+            pipe.persist(key)
+        if index is not None:
+            # 只更新索引中已有的成员，已被清理的过期键不会重新计入
+            pipe.zadd(index, {key: time.time() + int(ttl) if ttl else float('inf')}, xx=True)
+        pipe.execute()
+
+    def set_nx(self, key, value, ttl):
+        return bool(self.client.set(key, value, nx=True, px=int(ttl * 1000) if ttl else None))
+
+    def delete_if(self, key, value):
+        if self._delete_if_script is None:
+            self._delete_if_script = self.client.register_script(
+                "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+            )
+        return bool(self._delete_if_script(keys=[key], args=[value]))
+
+    def incr(self, key):
+        index = self._index_for(key)
+        if index is None:
+            return int(self.client.incr(key))
+        pipe = self.client.pipeline(transaction=False)
+        pipe.incr(key)
+        pipe.zadd(index, {key: float('inf')}, nx=True)
+        return int(pipe.execute()[0])
+
+    def count(self, prefix):
+        if prefix not in self._prefixes:
+            # 未声明的前缀没有索引，只能扫描键空间
+            return sum(1 for _ in self.client.scan_iter(match=f'{prefix}*', count=1000))
+        index = self.INDEX_PREFIX + prefix
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zremrangebyscore(index, '-inf', time.time())
+        pipe.zcard(index)
+        return int(pipe.execute()[1])
+
+    def track(self, prefix):
+        if prefix not in self._prefixes:
+            self._prefixes += (prefix,)
+
+    def close(self):
+        self.client.close()
+
+    def _index_for(self, key):
+        """返回键所属前缀的计数索引，不属于任何已声明前缀时返回None"""
+        for prefix in self._prefixes:
+            if key.startswith(prefix):
+                return self.INDEX_PREFIX + prefix
+        return None
+
+    def _maybe_purge(self, index):
+        now = time.time()
+        if now - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = now
+        self.client.zremrangebyscore(index, '-inf', now)
+
+
+def create_state_backend(config):
+    """
+    根据配置创建共享状态后端
+
+    Args:
+        config: 配置类，读取 STATE_BACKEND 等配置项
+
+    Returns:
+        StateBackend: 状态后端实例；STATE_BACKEND 为 'memory' 时返回None，表示使用进程内的LRU存储
+    """
+    backend = (config.STATE_BACKEND or 'memory').lower()
+    if backend == 'memory':
+        return None
+    if backend == 'local':
+        return LocalStateBackend()
+    if backend == 'sqlite':
+        return SQLiteStateBackend(config.STATE_SQLITE_PATH)
+    if backend == 'redis':
+        return RedisStateBackend(config.STATE_REDIS_URL)
+    raise ValueError(f"未知的共享状态后端: {backend}")
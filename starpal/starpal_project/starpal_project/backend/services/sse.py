@@ -0,0 +1,165 @@
+"""
+SSE输出模块
+负责Server-Sent Events帧的编码，以及将模型的细粒度输出块合并为较少的帧
+"""
+import json
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_event(payload):
+    """
+    将数据编码为一条SSE帧，安装了orjson时使用orjson
+
+    Args:
+        payload: 可JSON序列化的字典，如 {'reply': '...'} 或 {'error': '...'}
+
+    Returns:
+        str: 形如 "data: {...}\\n\\n" 的SSE帧
+    """
+    if orjson is not None:
+        return f"data: {orjson.dumps(payload).decode('utf-8')}\n\n"
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class SSECoalescer:
+    """
+    SSE输出合并器
+
+    模型每次输出的文本块先放入缓冲区，满足以下任一条件时合并成一帧输出：
+    - 第一个文本块（保证首字延迟不受影响）
+    - 缓冲文本达到 flush_bytes 字节
+    - 距离上一次输出超过 flush_interval_ms 毫秒
+    流结束时调用 flush() 输出剩余内容。完整回复以列表累积，结束时一次性拼接。
+    flush_bytes 与 flush_interval_ms 均为0时每个文本块单独成帧（与不合并时一致）。
+    """
+
+    def __init__(self, flush_bytes=0, flush_interval_ms=0, clock=time.monotonic):
+        """
+        初始化合并器
+
+        Args:
+            flush_bytes: 触发输出的缓冲字节数
+            flush_interval_ms: 触发输出的时间窗口（毫秒）
+            clock: 时钟函数（便于测试替换）
+        """
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval_ms / 1000
+        self.clock = clock
+
+        self._parts = []
+        self._pending = []
+        self._pending_bytes = 0
+        self._last_flush = None
+
+        self.chunks = 0
+        self.frames = 0
+
+    @property
+    def enabled(self):
+        return self.flush_bytes > 0 or self.flush_interval > 0
+
+    @property
+    def has_pending(self):
+        return bool(self._pending)
+
+    def push(self, text):
+        """
+        放入一个文本块
+
+        Args:
+            text: 模型输出的文本块
+
+        Returns:
+            str: 需要立即发送的SSE帧，暂不发送时返回None
+        """
+        self.chunks += 1
+        self._parts.append(text)
+        self._pending.append(text)
+        self._pending_bytes += len(text.encode('utf-8'))
+
+        if (self._last_flush is None
+                or not self.enabled
+                or (self.flush_bytes and self._pending_bytes >= self.flush_bytes)
+                or (self.flush_interval and self.clock() - self._last_flush >= self.flush_interval)):
+            return self.flush()
+        return None
+
+    def flush(self):
+        """
+        输出缓冲区中的全部内容
+
+        Returns:
+            str: SSE帧，缓冲区为空时返回None
+        """
+        if not self._pending:
+            return None
+        text = ''.join(self._pending)
+        self._pending = []
+        self._pending_bytes = 0
+        self._last_flush = self.clock()
+        self.frames += 1
+        return encode_event({'reply': text})
+
+    def time_until_flush(self):
+        """
+        距离时间窗口到期还剩的秒数，供异步流在等待下一个文本块时按时输出缓冲内容
+
+        Returns:
+            float: 秒数；缓冲区为空或未设置时间窗口时返回None
+        """
+        if not self._pending or not self.flush_interval:
+            return None
+        return max(0.0, self._last_flush + self.flush_interval - self.clock())
+
+    def reply(self):
+        """
+        获取完整回复
+
+        Returns:
+            str: 所有文本块拼接后的回复
+        """
+        return ''.join(self._parts)
+
+
+class SSEStats:
+    """SSE输出统计：累计的流数量、文本块数量与实际发送的帧数量"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.chunks = 0
+        self.frames = 0
+
+    def record(self, coalescer):
+        """
+        记录一次流式响应的输出统计
+
+        Args:
+            coalescer: 该次响应使用的SSECoalescer
+        """
+        with self._lock:
+            self.streams += 1
+            self.chunks += coalescer.chunks
+            self.frames += coalescer.frames
+
+    def snapshot(self):
+        """
+        获取统计快照
+
+        Returns:
+            dict: 累计计数与平均每帧合并的文本块数
+        """
+        with self._lock:
+            return {
+                'encoder': 'orjson' if orjson is not None else 'json',
+                'streams': self.streams,
+                'chunks': self.chunks,
+                'frames': self.frames,
+                'chunks_per_frame': round(self.chunks / self.frames, 2) if self.frames else 0.0
+            }
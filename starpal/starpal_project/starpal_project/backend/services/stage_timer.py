@@ -0,0 +1,110 @@
+"""
+阶段计时模块
+记录单次聊天请求中各处理阶段的耗时，并汇总为统计信息
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """
+    单次请求的阶段计时器
+
+    stage() 记录某一阶段的持续时间，mark() 记录某一事件距请求开始的时间（如首个token）。
+    阶段内抛出异常时，failed_stage 记录该阶段的名称。
+    传入追踪记录（Trace）时，每个阶段与事件同时记录为一个span。
+    """
+
+    def __init__(self, trace=None):
+        """
+        Args:
+            trace: 请求的追踪记录，未被采样时为None
+        """
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.failed_stage = None
+        self.trace = trace
+
+    @contextmanager
+    def stage(self, name):
+        """
+        计时上下文管理器
+
+        Args:
+            name: 阶段名称
+        """
+        begin = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            if self.failed_stage is None:
+                self.failed_stage = name
+            raise
+        finally:
+            self.record(name, time.perf_counter() - begin)
+
+    def record(self, name, seconds):
+        """
+        累加某一阶段的耗时
+
+        Args:
+            name: 阶段名称
+            seconds: 耗时秒数
+        """
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if self.trace is not None:
+            self.trace.add_span(name, time.perf_counter() - seconds, seconds)
+
+    def mark(self, name):
+        """
+        记录事件距请求开始的时间
+
+        Args:
+            name: 事件名称
+        """
+        self.stages[name] = time.perf_counter() - self.start
+        if self.trace is not None:
+            self.trace.add_event(name)
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: {阶段名称: 毫秒数}
+        """
+        return {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+
+
+class StageStats:
+    """各阶段耗时的累计统计（次数、平均值、最大值）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, timer):
+        """
+        汇总一次请求的计时结果
+
+        Args:
+            timer: StageTimer对象
+        """
+        with self._lock:
+            for name, seconds in timer.stages.items():
+                count, total, peak = self._stages.get(name, (0, 0.0, 0.0))
+                self._stages[name] = (count + 1, total + seconds, max(peak, seconds))
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {阶段名称: {'count', 'avg_ms', 'max_ms'}}
+        """
+        with self._lock:
+            return {
+                name: {
+                    'count': count,
+                    'avg_ms': round(total / count * 1000, 2),
+                    'max_ms': round(peak * 1000, 2)
+                }
+                for name, (count, total, peak) in self._stages.items()
+            }
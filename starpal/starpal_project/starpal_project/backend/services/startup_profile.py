@@ -0,0 +1,137 @@
+"""
+启动耗时分析模块
+在全新的子进程中测量应用导入与初始化各阶段的耗时，以及每个模块的导入耗时（python -X importtime），
+用于检查worker启动时间是否在目标范围内。
+"""
+import json
+import os
+import subprocess
+import sys
+
+# 子进程输出结果所用的行前缀，与应用自身的输出区分
+_RESULT_PREFIX = '__STARTUP_PROFILE__ '
+
+# 在子进程中执行的测量脚本
+_PROBE = r'''
+import json, sys, time
+
+stages = []
+
+def stage(name, fn, boot=True):
+    start = time.perf_counter()
+    error = None
+    result = None
+    try:
+        result = fn()
+    except Exception as e:
+        error = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+    stages.append({"name": name, "ms": round((time.perf_counter() - start) * 1000, 2),
+                   "boot": boot, "error": error})
+    return result
+
+app_module = stage("import app", lambda: __import__("app"))
+if app_module is not None:
+    stage("create_app()", app_module.create_app)
+    from backend.services.ai_service import ai_service
+    stage("ai_service.llm (首次使用)", lambda: ai_service.llm, boot=False)
+    if ai_service.mem0_enabled:
+        stage("ai_service.memory_backend (首次使用)", lambda: ai_service.memory_backend, boot=False)
+print("%s" + json.dumps(stages, ensure_ascii=False))
+''' % _RESULT_PREFIX
+
+
+def parse_importtime(lines):
+    """
+    解析 python -X importtime 的输出
+
+    Args:
+        lines: stderr的文本行
+
+    Returns:
+        list: [{'module', 'self_ms', 'cumulative_ms', 'depth'}]，按导入完成顺序排列
+    """
+    modules = []
+    for line in lines:
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            # 表头行
+            continue
+        name = parts[2].rstrip()
+        stripped = name.lstrip()
+        modules.append({
+            'module': stripped,
+            'self_ms': round(self_us / 1000, 2),
+            'cumulative_ms': round(cumulative_us / 1000, 2),
+            'depth': (len(name) - len(stripped) - 1) // 2
+        })
+    return modules
+
+
+def run_probe(project_dir, python=None, env=None):
+    """
+    启动子进程执行测量脚本
+
+    Args:
+        project_dir: 项目目录（app.py所在目录）
+        python: Python解释器路径，默认使用当前解释器
+        env: 子进程环境变量，默认继承当前进程
+
+    Returns:
+        tuple: (阶段耗时列表, 模块导入耗时列表)
+    """
+    proc = subprocess.run(
+        [python or sys.executable, '-X', 'importtime', '-c', _PROBE],
+        cwd=project_dir,
+        env=env if env is not None else os.environ.copy(),
+        capture_output=True,
+        text=True
+    )
+    stages = []
+    for line in proc.stdout.splitlines():
+        if line.startswith(_RESULT_PREFIX):
+            stages = json.loads(line[len(_RESULT_PREFIX):])
+    if not stages:
+        raise RuntimeError(f"启动测量子进程失败: {proc.stderr.strip().splitlines()[-1:]}")
+    return stages, parse_importtime(proc.stderr.splitlines())
+
+
+def profile_startup(project_dir, target_ms, top=15):
+    """
+    测量并打印启动耗时报告
+
+    Args:
+        project_dir: 项目目录
+        target_ms: 启动耗时目标（毫秒），导入与create_app之和超过目标时返回1
+        top: 报告中列出的模块数量
+
+    Returns:
+        int: 进程退出码，0表示在目标范围内
+    """
+    stages, modules = run_probe(project_dir)
+
+    print("启动阶段耗时:")
+    for item in stages:
+        note = '' if item['boot'] else '  (不计入启动耗时)'
+        if item['error']:
+            note += f"  失败: {item['error']}"
+        print(f"  {item['name']:<40} {item['ms']:>10.1f} ms{note}")
+    boot_ms = sum(item['ms'] for item in stages if item['boot'])
+
+    print(f"\n顶层导入耗时（含依赖）前 {top} 名:")
+    roots = sorted((m for m in modules if m['depth'] == 0), key=lambda m: m['cumulative_ms'], reverse=True)
+    for m in roots[:top]:
+        print(f"  {m['module']:<50} {m['cumulative_ms']:>10.1f} ms")
+
+    print(f"\n模块自身导入耗时前 {top} 名:")
+    for m in sorted(modules, key=lambda m: m['self_ms'], reverse=True)[:top]:
+        print(f"  {m['module']:<50} {m['self_ms']:>10.1f} ms")
+
+    within = boot_ms <= target_ms
+    print(f"\n启动耗时: {boot_ms:.1f} ms / 目标 {target_ms} ms  {'达标' if within else '超出目标'}")
+    return 0 if within else 1
@@ -0,0 +1,174 @@
+"""
+身份令牌模块
+签发与校验HMAC-SHA256签名的无状态令牌，校验时不需要查询数据库
+"""
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import timezone
+
+from backend.config.config import Config
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TokenService:
+    """
+    无状态身份令牌服务
+
+    令牌格式为 base64url(载荷JSON).base64url(HMAC-SHA256签名)，载荷包含
+    用户名 u、显示名称 n、签发时间 iat（毫秒）和过期时间 exp（秒）。
+    可选的撤销检查按用户缓存 (用户是否存在, 最近一次资料更新时间)，修改密码后
+    早于更新时间签发的令牌失效；缓存过期前每个用户最多查询一次数据库。
+    数据库的更新时间只精确到秒，撤销检查按秒比较，与改密码同一秒内签发的令牌仍然有效。
+    """
+
+    def __init__(self, secret, ttl=7 * 24 * 3600, revocation_ttl=60, clock=time.time):
+        """
+        初始化令牌服务
+
+        Args:
+            secret: 签名密钥
+            ttl: 令牌有效期（秒）
+            revocation_ttl: 撤销检查缓存的有效期（秒），0表示不做撤销检查
+            clock: 时钟函数（便于测试替换）
+        """
+        self._key = secret.encode('utf-8')
+        self.ttl = ttl
+        self.revocation_ttl = revocation_ttl
+        self.clock = clock
+
+        # {username: (是否存在, 资料更新时间戳, 缓存过期时间)}
+        self._revocation_cache = {}
+        self._lock = threading.Lock()
+
+        self.verified = 0
+        self.rejected = 0
+        self.revocation_lookups = 0
+
+    def issue(self, username, name):
+        """
+        签发令牌
+
+        Args:
+            username: 用户名
+            name: 显示名称
+
+        Returns:
+            str: 令牌
+        """
+        now = self.clock()
+        payload = {'u': username, 'n': name, 'iat': int(now * 1000), 'exp': int(now + self.ttl)}
+        body = _b64encode(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return f"{body}.{self._sign(body)}"
+
+    def verify(self, token):
+        """
+        校验令牌签名与有效期
+
+        Args:
+            token: 令牌
+
+        Returns:
+            dict: 令牌载荷，无效或过期时返回None
+        """
+        payload = self._decode(token)
+        with self._lock:
+            if payload is None:
+                self.rejected += 1
+            else:
+                self.verified += 1
+        return payload
+
+    def is_revoked(self, payload, lookup):
+        """
+        检查令牌是否已被撤销（用户被删除或在签发后修改过密码）
+
+        Args:
+            payload: verify() 返回的令牌载荷
+            lookup: 按用户名查询用户的函数，返回带 updated_at 属性的对象或None
+
+        Returns:
+            bool: 是否已撤销
+        """
+        if not self.revocation_ttl:
+            return False
+
+        username = payload['u']
+        now = self.clock()
+        with self._lock:
+            cached = self._revocation_cache.get(username)
+        if cached is None or cached[2] <= now:
+            user = lookup(username)
+            updated = 0.0
+            if user is not None and user.updated_at is not None:
+                updated = user.updated_at.replace(tzinfo=timezone.utc).timestamp()
+            cached = (user is not None, updated, now + self.revocation_ttl)
+            with self._lock:
+                self.revocation_lookups += 1
+                self._revocation_cache[username] = cached
+
+        exists, updated, _ = cached
+        return not exists or payload['iat'] // 1000 < int(updated)
+
+    def forget(self, username):
+        """
+        清除用户的撤销检查缓存，修改密码或删除用户后调用，使本进程立即生效
+
+        Args:
+            username: 用户名
+        """
+        with self._lock:
+            self._revocation_cache.pop(username, None)
+
+    def stats(self):
+        """
+        获取令牌校验统计信息
+
+        Returns:
+            dict: 校验通过/拒绝次数及撤销检查的数据库查询次数
+        """
+        with self._lock:
+            return {
+                'verified': self.verified,
+                'rejected': self.rejected,
+                'revocation_lookups': self.revocation_lookups,
+                'revocation_cache_entries': len(self._revocation_cache)
+            }
+
+    def _sign(self, body):
+        return _b64encode(hmac.new(self._key, body.encode('ascii'), hashlib.sha256).digest())
+
+    def _decode(self, token):
+        """校验签名与过期时间并解析载荷"""
+        if not token or token.count('.') != 1:
+            return None
+        body, signature = token.split('.')
+        try:
+            if not hmac.compare_digest(self._sign(body), signature):
+                return None
+            payload = json.loads(_b64decode(body))
+        except (ValueError, UnicodeError):
+            return None
+        if not isinstance(payload, dict) or not {'u', 'n', 'iat', 'exp'} <= payload.keys():
+            return None
+        if payload['exp'] <= self.clock():
+            return None
+        return payload
+
+
+# 全局令牌服务实例
+token_service = TokenService(
+    secret=Config.SECRET_KEY,
+    ttl=Config.TOKEN_TTL_SECONDS,
+    revocation_ttl=Config.TOKEN_REVOCATION_CACHE_TTL
+)
@@ -0,0 +1,234 @@
+"""
+请求追踪模块
+按采样率记录单次聊天请求内各阶段的时间线（span），以JSON Lines格式写入文件，
+通过请求ID（X-Request-ID）与客户端、日志关联；未被采样的请求只多一次判空。
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from backend.config.config import Config
+
+# 客户端传入的请求ID只接受安全字符，避免写入响应头与日志时被注入
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:\-]{1,128}$')
+
+
+def normalize_request_id(value):
+    """
+    校验客户端传入的请求ID，缺失或不合法时生成新的ID
+
+    Args:
+        value: X-Request-ID 请求头的值
+
+    Returns:
+        str: 请求ID
+    """
+    if value and _REQUEST_ID_PATTERN.match(value):
+        return value
+    return uuid.uuid4().hex
+
+
+class Trace:
+    """
+    单次请求的追踪记录
+
+    span 的开始时间以相对请求开始的毫秒数记录。请求结束（finish）时一次性写出全部span；
+    结束后才完成的span（如后台写入Mem0）单独写出一行，通过 request_id 关联。
+    """
+
+    def __init__(self, tracer, request_id, name, attrs):
+        self.tracer = tracer
+        self.request_id = request_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self._spans = []
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, seconds, **attrs):
+        """
+        记录一个已完成的span
+
+        Args:
+            name: span名称
+            start: 开始时刻（time.perf_counter()）
+            seconds: 持续秒数，事件为0
+            **attrs: 附加属性
+        """
+        record = {
+            'request_id': self.request_id,
+            'span': name,
+            'start_ms': round((start - self.start) * 1000, 2),
+            'duration_ms': round(seconds * 1000, 2)
+        }
+        if attrs:
+            record.update(attrs)
+        with self._lock:
+            if not self._finished:
+                self._spans.append(record)
+                return
+        self.tracer.write([record])
+
+    def add_event(self, name, **attrs):
+        """
+        记录一个时间点事件（如首个token）
+
+        Args:
+            name: 事件名称
+            **attrs: 附加属性
+        """
+        self.add_span(name, time.perf_counter(), 0.0, **attrs)
+
+    def span(self, name, **attrs):
+        """
+        span上下文管理器，异常时记录 error 属性
+
+        Args:
+            name: span名称
+            **attrs: 附加属性
+
+        Returns:
+            上下文管理器
+        """
+        return _SpanContext(self, name, attrs)
+
+    def finish(self, status='ok', **attrs):
+        """
+        结束追踪并写出请求的根span与全部子span，重复调用无副作用
+
+        Args:
+            status: 请求结果 ok / error / busy / cancelled
+            **attrs: 附加到根span的属性
+        """
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+            spans = self._spans
+            self._spans = []
+        root = {
+            'request_id': self.request_id,
+            'span': self.name,
+            'ts': round(self.wall_start, 3),
+            'duration_ms': round((time.perf_counter() - self.start) * 1000, 2),
+            'status': status,
+            **self.attrs,
+            **attrs
+        }
+        self.tracer.write([root] + spans)
+
+
+class _SpanContext:
+    """Trace.span() 返回的上下文管理器"""
+
+    __slots__ = ('trace', 'name', 'attrs', 'begin')
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = f"{exc_type.__name__}: {exc}"
+        self.trace.add_span(self.name, self.begin, time.perf_counter() - self.begin, **self.attrs)
+        return False
+
+
+class Tracer:
+    """
+    追踪记录器
+
+    按 sample_rate 决定是否追踪一个请求，被采样请求的span以JSON Lines格式追加写入 path
+    （'-' 表示标准输出）。
+    """
+
+    def __init__(self, sample_rate=0.0, path='-'):
+        """
+        初始化追踪记录器
+
+        Args:
+            sample_rate: 采样率 0~1，0表示关闭追踪
+            path: 输出文件路径，'-' 表示标准输出
+        """
+        self.sample_rate = sample_rate
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+        self.sampled = 0
+        self.written = 0
+
+    def start(self, request_id, name, **attrs):
+        """
+        开始追踪一个请求
+
+        Args:
+            request_id: 请求ID，为None时生成新的ID
+            name: 根span名称
+            **attrs: 附加到根span的属性
+
+        Returns:
+            Trace: 追踪记录，未被采样时返回None
+        """
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        with self._lock:
+            self.sampled += 1
+        return Trace(self, request_id or uuid.uuid4().hex, name, attrs)
+
+    def write(self, records):
+        """
+        写出span记录
+
+        Args:
+            records: span字典列表
+        """
+        lines = ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records)
+        with self._lock:
+            try:
+                self._get_file().write(lines)
+                self._file.flush()
+                self.written += len(records)
+            except OSError as e:
+                print(f"写入追踪记录失败: {e}")
+
+    def stats(self):
+        """
+        获取追踪统计信息
+
+        Returns:
+            dict: 采样率、被采样的请求数与写出的span数
+        """
+        with self._lock:
+            return {
+                'sample_rate': self.sample_rate,
+                'path': self.path,
+                'sampled': self.sampled,
+                'spans_written': self.written
+            }
+
+    def _get_file(self):
+        """打开输出文件，需在持锁状态下调用"""
+        if self._file is None:
+            if self.path == '-':
+                self._file = sys.stdout
+            else:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+
+# 全局追踪记录器实例
+tracer = Tracer(sample_rate=Config.TRACE_SAMPLE_RATE, path=Config.TRACE_PATH)
@@ -2,8 +2,10 @@
 验证工具模块
 """
 import functools
-from flask import request, jsonify
+from flask import request, jsonify, g
 from backend.models.user import User
+from backend.models.conversation import Message
+from backend.services.token_service import token_service
 
 def validate_request_data(data, required_fields):
     """
@@ -25,6 +27,28 @@ def validate_request_data(data, required_fields):
     
     return True, None
 
+def validate_chat_identity(username, chat_id):
+    """
+    验证用户名与对话ID的长度不超过对话历史表的字段长度
+    超长的值无法写入数据库，需要在消息进入写入缓冲区之前拒绝
+    
+    Args:
+        username: 用户名
+        chat_id: 对话ID
+        
+    Returns:
+        tuple: (是否有效, 错误信息)
+    """
+    max_username = Message.user_id.type.length
+    if len(username) > max_username:
+        return False, f'用户名长度不能超过{max_username}个字符'
+    
+    max_chat_id = Message.chat_id.type.length
+    if len(chat_id) > max_chat_id:
+        return False, f'对话ID长度不能超过{max_chat_id}个字符'
+    
+    return True, None
+
 def validate_email(email):
     """
     验证邮箱格式
@@ -80,16 +104,12 @@ def validate_token(f):
                 'message': '请提供有效的认证令牌'
             }), 401
         
-        # 提取令牌（这里只是简单示例，实际应使用JWT等更安全的方式）
-        token = auth_header.split(' ')[1]
-        
-        # 从令牌中提取用户名（简单示例）
-        # 实际项目中应该使用JWT或其他方式解析令牌获取用户信息
-        username = token  # 这里假设token就是用户名，实际项目中需要更安全的验证方式
+        # 提取令牌并校验签名与有效期，不需要查询数据库
+        token = auth_header.split(' ', 1)[1]
+        payload = token_service.verify(token)
         
-        # 验证用户是否存在
-        user = User.find_by_username(username)
-        if not user:
+        # 撤销检查（用户已删除或修改过密码）结果按用户缓存，缓存过期前不再查询数据库
+        if payload is None or token_service.is_revoked(payload, User.find_by_username):
             return jsonify({
                 'success': False,
                 'message': '无效的用户令牌'
@@ -97,9 +117,10 @@ def validate_token(f):
         
         # 将用户信息传递给被装饰的函数
         current_user = {
-            'username': user.username,
-            'name': user.name
+            'username': payload['u'],
+            'name': payload['n']
         }
+        g.current_user = current_user
         
         return f(current_user=current_user, *args, **kwargs)
     
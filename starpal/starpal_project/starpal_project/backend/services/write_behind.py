@@ -0,0 +1,192 @@
+"""
+后台写入队列模块
+将耗时的外部写操作（如Mem0 add）移出请求线程，由后台线程异步执行
+"""
+import itertools
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+
+# 通知工作线程退出的哨兵对象
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    有界的后台写入队列
+
+    提交的任务由固定数量的工作线程执行，失败时按指数退避重试；
+    队列已满时任务被丢弃并计数，保证请求线程永远不会被写操作阻塞。
+    """
+
+    def __init__(self, name, maxsize=1000, workers=2, max_retries=3,
+                 backoff_base=0.5, backoff_max=30.0):
+        """
+        初始化写入队列
+
+        Args:
+            name: 队列名称，用于日志和线程命名
+            maxsize: 队列最大长度
+            workers: 工作线程数量
+            max_retries: 单个任务失败后的最大重试次数
+            backoff_base: 首次重试等待秒数，之后按2的幂次递增
+            backoff_max: 单次重试等待的最大秒数
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._ids = itertools.count()
+        # {job_id: 入队时间}，用于计算最老任务的积压时长
+        self._pending = OrderedDict()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def submit(self, fn, *args, on_success=None, **kwargs):
+        """
+        提交后台任务
+
+        Args:
+            fn: 要执行的函数
+            *args: 位置参数
+            on_success: 任务成功后的回调，参数为fn的返回值
+            **kwargs: 关键字参数
+
+        Returns:
+            bool: 是否成功入队
+        """
+        with self._lock:
+            if self._closed:
+                self.dropped += 1
+                return False
+            self._ensure_started()
+            job_id = next(self._ids)
+            enqueued_at = time.monotonic()
+            try:
+                self._queue.put_nowait((job_id, enqueued_at, fn, args, kwargs, on_success))
+            except queue.Full:
+                self.dropped += 1
+                print(f"[{self.name}] 写入队列已满，丢弃任务")
+                return False
+            self._pending[job_id] = enqueued_at
+            self.submitted += 1
+            return True
+
+    def shutdown(self, timeout=10.0):
+        """
+        停止接收新任务，并在超时前尽量执行完队列中的剩余任务
+
+        Args:
+            timeout: 最长等待秒数
+
+        Returns:
+            bool: 队列是否已全部排空
+        """
+        with self._lock:
+            if self._closed:
+                return not self._pending
+            self._closed = True
+            threads = list(self._threads)
+
+        deadline = time.monotonic() + timeout
+        for _ in threads:
+            try:
+                self._queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+        with self._lock:
+            remaining = len(self._pending)
+        if remaining:
+            print(f"[{self.name}] 关闭时仍有 {remaining} 个任务未完成")
+        return remaining == 0
+
+    def stats(self):
+        """
+        获取队列统计信息
+
+        Returns:
+            dict: 队列深度、积压时长及累计计数
+        """
+        with self._lock:
+            oldest = next(iter(self._pending.values()), None)
+            return {
+                'depth': self._queue.qsize(),
+                'pending': len(self._pending),
+                'maxsize': self.maxsize,
+                'workers': self.workers,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'retries': self.retries,
+                'oldest_pending_seconds': round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+                'last_lag_seconds': round(self.last_lag, 3),
+                'max_lag_seconds': round(self.max_lag, 3),
+            }
+
+    def _ensure_started(self):
+        """首次提交任务时启动工作线程，需在持锁状态下调用"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            job_id, enqueued_at, fn, args, kwargs, on_success = item
+            ok, result = self._run_with_retry(fn, args, kwargs)
+
+            lag = time.monotonic() - enqueued_at
+            with self._lock:
+                self._pending.pop(job_id, None)
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+
+            if ok and on_success:
+                try:
+                    on_success(result)
+                except Exception as e:
+                    print(f"[{self.name}] 任务完成回调执行失败: {e}")
+
+    def _run_with_retry(self, fn, args, kwargs):
+        """执行任务，失败时按指数退避（带随机抖动）重试"""
+        attempt = 0
+        while True:
+            try:
+                return True, fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    print(f"[{self.name}] 任务重试 {attempt} 次后仍失败: {e}")
+                    return False, None
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
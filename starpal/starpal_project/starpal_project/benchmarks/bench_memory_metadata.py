@@ -0,0 +1,145 @@
+"""
+长期记忆元数据基准测试
+测量每轮对话写入长期记忆前评估重要性与提取关键词的耗时，对比原先的逐词子串扫描/按空格分词实现
+与 memory_metadata.py 中预编译的信号词匹配和中文二元组关键词提取。
+原先按空格分词的实现对中文几乎只能得到整句，耗时虽低但结果不可用；关键词另与纯Python的
+Counter二元组统计对比。
+
+运行方式（在项目目录下）:
+    python benchmarks/bench_memory_metadata.py
+    python benchmarks/bench_memory_metadata.py --reply-tokens 8000 --repeat 50 --scan-chars 4000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+from collections import Counter
+from operator import add
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.memory_metadata import DEFAULT_STOP_WORDS, KeywordExtractor, SignalMatcher
+
+_CJK_RUN = re.compile(r'[\u4e00-\u9fff]{2,}')
+
+# 生成回复文本用的词表（中文为主，夹杂英文与标点）
+_VOCABULARY = (
+    '今天 天气 咖啡 旅行 计划 北京 上海 学习 编程 Python 项目 建议 方法 时间 安排 健康 运动 饮食 '
+    '音乐 电影 推荐 问题 解决 步骤 首先 其次 最后 总结 注意 细节 例如 比如 the model and API 数据 '
+    '分析 结果 目标 习惯 工作 生活 家人 朋友 周末 早餐 睡眠 阅读 书籍 作者'
+).split()
+_PUNCTUATION = ['，', '。', '、', '！', '？', '；', ' ', '\n']
+# 估算回复长度时每个token对应的字符数
+_CHARS_PER_TOKEN = 1.5
+
+_LEGACY_SIGNALS = [
+    '记住', '不要忘记', '重要', '必须', '请记住',
+    '我的信息', '我的地址', '我的喜好', '我的偏好',
+    '电话', '邮箱', '地址', '生日', '重要日期'
+]
+_LEGACY_STOP_WORDS = ['的', '了', '和', '是', '在', '我', '有', '你', '我们', '他', '她', '它', '这', '那', '都']
+
+
+def legacy_importance(user_message, ai_reply):
+    """原实现：拼接并转小写后对每个信号词做一次子串扫描"""
+    combined_text = (user_message + ' ' + ai_reply).lower()
+    for signal in _LEGACY_SIGNALS:
+        if signal in combined_text:
+            return 'high'
+    if len(user_message) > 100 or len(ai_reply) > 300:
+        return 'medium'
+    return 'low'
+
+
+def legacy_keywords(user_message, ai_reply):
+    """原实现：按空格与英文标点分词"""
+    combined_text = (user_message + ' ' + ai_reply).lower()
+    words = []
+    for word in combined_text.replace(',', ' ').replace('.', ' ').replace('?', ' ').replace('!', ' ').split():
+        if len(word) > 1 and word not in _LEGACY_STOP_WORDS:
+            words.append(word)
+    return words[:10]
+
+
+def counter_keywords(user_message, ai_reply, stop_words=frozenset(DEFAULT_STOP_WORDS)):
+    """参照实现：逐个中文连续字符段用 Counter 统计字二元组（不含用户消息加权与首尾相接过滤）"""
+    counts = Counter()
+    for text in (user_message, ai_reply):
+        for run in _CJK_RUN.findall(text):
+            counts.update(map(add, run, run[1:]))
+    return [token for token, _ in counts.most_common()
+            if token not in stop_words and token[0] not in stop_words and token[1] not in stop_words][:10]
+
+
+def make_reply(tokens, seed=0):
+    """
+    生成约 tokens 个token长度的回复文本
+
+    Args:
+        tokens: token数
+        seed: 随机种子
+
+    Returns:
+        str: 回复文本
+    """
+    rng = random.Random(seed)
+    target = int(tokens * _CHARS_PER_TOKEN)
+    parts, length = [], 0
+    while length < target:
+        word = rng.choice(_VOCABULARY)
+        parts.append(word)
+        length += len(word)
+        if rng.random() < 0.3:
+            parts.append(rng.choice(_PUNCTUATION))
+            length += 1
+    return ''.join(parts)
+
+
+def measure(function, args, repeat):
+    """
+    测量函数的单次调用耗时
+
+    Returns:
+        tuple: (最快一次的微秒数, 中位数微秒数)
+    """
+    times = timeit.repeat(lambda: function(*args), number=1, repeat=repeat)
+    times.sort()
+    return times[0] * 1e6, times[len(times) // 2] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='长期记忆元数据（重要性与关键词）基准测试')
+    parser.add_argument('--reply-tokens', type=int, nargs='+', default=[500, 2000, 8000], help='AI回复的token数')
+    parser.add_argument('--repeat', type=int, default=30, help='每项测量的重复次数')
+    parser.add_argument('--scan-chars', type=int, default=0, help='关键词提取只扫描回复的前N个字符（0表示全文）')
+    args = parser.parse_args()
+
+    matcher = SignalMatcher()
+    extractor = KeywordExtractor(scan_chars=args.scan_chars)
+    message = '帮我规划一下这个周末在北京的行程，我想喝咖啡，也想去看展览'
+
+    print(f"{'回复token':>10} {'字符数':>8}  {'项目':<26} {'对比实现(us)':>12} {'新实现(us)':>12} {'加速':>8}")
+    for tokens in args.reply_tokens:
+        reply = make_reply(tokens)
+        # 无信号词时需要扫描全文，是重要性评估的最坏情况
+        cases = [
+            ('重要性(无信号词)', legacy_importance, matcher.search, (message, reply)),
+            ('重要性(信号词在末尾)', legacy_importance, matcher.search, (message, reply + '请记住我的生日')),
+            ('关键词', legacy_keywords, extractor.extract, (message, reply)),
+            ('关键词(对比Counter二元组)', counter_keywords, extractor.extract, (message, reply)),
+        ]
+        for name, legacy, current, call_args in cases:
+            legacy_best, _ = measure(legacy, call_args, args.repeat)
+            current_best, _ = measure(current, call_args, args.repeat)
+            print(f"{tokens:>10} {len(reply):>8}  {name:<26} {legacy_best:>12.1f} {current_best:>12.1f} "
+                  f"{legacy_best / current_best:>7.1f}x")
+
+    reply = make_reply(args.reply_tokens[-1])
+    print(f"\n原实现关键词: {legacy_keywords(message, reply)}")
+    print(f"新实现关键词: {extractor.extract(message, reply)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+密码哈希基准测试
+测量不同 scrypt 开销参数下单核每秒可完成的登录校验次数，以及使用进程池时的总吞吐量，
+用于选择 PASSWORD_HASH_N / PASSWORD_HASH_WORKERS 配置。
+
+运行方式（在项目目录下）:
+    python benchmarks/bench_password_hash.py
+    python benchmarks/bench_password_hash.py --costs 14 15 16 --seconds 3 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.scrypt_hash import hash_password, check_password
+
+
+def measure_single(stored, seconds):
+    """
+    在当前进程中连续校验密码
+
+    Args:
+        stored: 哈希字符串
+        seconds: 测量时长
+
+    Returns:
+        tuple: (每秒校验次数, 平均单次耗时毫秒)
+    """
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        check_password('correct horse battery', stored)
+        count += 1
+    elapsed = time.perf_counter() - start
+    return count / elapsed, elapsed / count * 1000
+
+
+def measure_pool(stored, seconds, workers):
+    """
+    使用进程池并发校验密码
+
+    Args:
+        stored: 哈希字符串
+        seconds: 测量时长
+        workers: 进程数
+
+    Returns:
+        float: 每秒校验次数
+    """
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        # 预热，排除进程启动耗时
+        list(pool.map(check_password, ['x'] * workers, [stored] * workers))
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            batch = workers * 4
+            list(pool.map(check_password, ['correct horse battery'] * batch, [stored] * batch))
+            count += batch
+        return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='scrypt 密码哈希基准测试')
+    parser.add_argument('--costs', type=int, nargs='+', default=[12, 13, 14, 15, 16],
+                        help='n 取值的以2为底的指数，默认 12 13 14 15 16')
+    parser.add_argument('--r', type=int, default=8, help='scrypt 块大小')
+    parser.add_argument('--p', type=int, default=1, help='scrypt 并行度')
+    parser.add_argument('--seconds', type=float, default=2.0, help='每项测量时长（秒）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='进程池大小，0表示跳过')
+    args = parser.parse_args()
+
+    print(f"CPU核数: {os.cpu_count()}  r={args.r} p={args.p}  进程池: {args.workers}")
+    header = f"{'n':>8} {'内存/次':>10} {'单次耗时':>12} {'单核 登录/秒':>14}"
+    if args.workers:
+        header += f" {'进程池 登录/秒':>16} {'折合每核':>10}"
+    print(header)
+
+    for exponent in args.costs:
+        n = 2 ** exponent
+        stored = hash_password('correct horse battery', n, args.r, args.p)
+        per_second, latency_ms = measure_single(stored, args.seconds)
+        memory_mb = 128 * n * args.r / 1024 / 1024
+        line = f"{n:>8} {memory_mb:>8.1f}MB {latency_ms:>10.2f}ms {per_second:>14.1f}"
+        if args.workers:
+            pool_per_second = measure_pool(stored, args.seconds, args.workers)
+            line += f" {pool_per_second:>16.1f} {pool_per_second / args.workers:>10.1f}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
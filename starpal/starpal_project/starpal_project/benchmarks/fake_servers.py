@@ -0,0 +1,292 @@
+"""
+压测用的本地替身服务
+- FakeLLMServer：OpenAI兼容的 /v1/chat/completions 流式接口（ChatOpenAI 通过 AI_API_BASE 指向它）
+- FakeMem0Server：Mem0 云服务的 HTTP 接口（Mem0 客户端通过 MEM0_HOST 指向它）
+
+两者都可配置响应延迟与错误率，FakeLLMServer 还可配置输出速度（token/秒）与回复长度。
+可单独运行，供手动测试使用:
+    python benchmarks/fake_servers.py --llm-port 18001 --mem0-port 18002 --tokens-per-second 30
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 回复文本循环使用的词块，每个词块作为一个token输出
+_REPLY_TOKENS = ['你好', '，', '我', '是', '星伴', 'AI', '助手', '。', '很高兴', '为你', '解答', '问题', '！']
+
+
+class _FakeServer:
+    """在后台线程中运行的HTTP服务，请求计数线程安全"""
+
+    handler_class = None
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0, error_rate=0.0):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机分配
+            latency_ms: 每个请求开始响应前的延迟（毫秒）
+            error_rate: 返回500错误的概率 0~1
+        """
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self.handler_class)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """启动服务，返回自身"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def begin_request(self):
+        """
+        记录一次请求并模拟延迟
+
+        Returns:
+            bool: 本次请求是否应返回错误
+        """
+        with self._lock:
+            self.requests += 1
+            failed = random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return failed
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'errors': self.errors}
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(body) if body else {}
+        except ValueError:
+            return {}
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        # 连接预热请求
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class _LLMHandler(_JSONHandler):
+    def do_POST(self):
+        request = self.read_json()
+        if self.fake.begin_request():
+            self.send_json({'error': {'message': 'fake upstream error', 'type': 'server_error'}}, 500)
+            return
+        if not request.get('stream'):
+            self.send_json(self.fake.completion(request))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for chunk in self.fake.stream_chunks(request):
+                data = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8')
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+            done = b'data: [DONE]\n\n'
+            self.wfile.write(b'%x\r\n%s\r\n0\r\n\r\n' % (len(done), done))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeLLMServer(_FakeServer):
+    """
+    OpenAI兼容的流式补全服务
+
+    首个token在 latency_ms 之后输出，之后按 tokens_per_second 的速度逐个输出，共 reply_tokens 个。
+    """
+
+    handler_class = _LLMHandler
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=300, tokens_per_second=40.0, reply_tokens=120,
+                 error_rate=0.0):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机分配
+            latency_ms: 首个token前的延迟（毫秒）
+            tokens_per_second: 输出速度，0表示不限速
+            reply_tokens: 每次回复的token数
+            error_rate: 返回500错误的概率
+        """
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.tokens_sent = 0
+        super().__init__(host, port, latency_ms, error_rate)
+
+    def stream_chunks(self, request):
+        """生成流式响应的各个chunk"""
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = request.get('model', 'fake')
+        interval = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        next_at = time.perf_counter()
+        for i in range(self.reply_tokens):
+            if interval:
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_at += interval
+            with self._lock:
+                self.tokens_sent += 1
+            yield {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'delta': {'content': _REPLY_TOKENS[i % len(_REPLY_TOKENS)]},
+                             'finish_reason': None}]
+            }
+        yield {
+            'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]
+        }
+
+    def completion(self, request):
+        """非流式响应"""
+        text = ''.join(_REPLY_TOKENS[i % len(_REPLY_TOKENS)] for i in range(self.reply_tokens))
+        return {
+            'id': f"chatcmpl-{uuid.uuid4().hex[:12]}", 'object': 'chat.completion', 'created': int(time.time()),
+            'model': request.get('model', 'fake'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': self.reply_tokens, 'total_tokens': self.reply_tokens}
+        }
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats['tokens_sent'] = self.tokens_sent
+        return stats
+
+
+class _Mem0Handler(_JSONHandler):
+    def do_GET(self):
+        if self.path.startswith('/v1/ping'):
+            self.send_json({'status': 'ok', 'user_email': 'bench@example.com',
+                            'org_id': 'bench-org', 'project_id': 'bench-project'})
+            return
+        if self.fake.begin_request():
+            self.send_json({'detail': 'fake upstream error'}, 500)
+            return
+        self.send_json({'id': self.path.rstrip('/').rsplit('/', 1)[-1], 'memory': '', 'metadata': {}})
+
+    def do_POST(self):
+        request = self.read_json()
+        if self.fake.begin_request():
+            self.send_json({'detail': 'fake upstream error'}, 500)
+            return
+        if '/search' in self.path:
+            self.send_json({'results': self.fake.search_results(request)})
+        elif '/add' in self.path or self.path.rstrip('/').endswith('/v1/memories'):
+            self.send_json({'results': [{'id': uuid.uuid4().hex, 'event': 'ADD', 'status': 'PENDING'}]})
+        else:
+            self.send_json({'results': [], 'items': [], 'count': 0})
+
+    def do_PUT(self):
+        self.read_json()
+        self.fake.begin_request()
+        self.send_json({'message': 'ok'})
+
+    def do_DELETE(self):
+        self.fake.begin_request()
+        self.send_json({'message': 'ok'})
+
+
+class FakeMem0Server(_FakeServer):
+    """Mem0云服务替身，检索固定返回 results 条记忆，写入只计数"""
+
+    handler_class = _Mem0Handler
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=80, results=3, error_rate=0.0):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机分配
+            latency_ms: 每个请求的延迟（毫秒）
+            results: 每次检索返回的记忆条数
+            error_rate: 返回500错误的概率
+        """
+        self.results = results
+        super().__init__(host, port, latency_ms, error_rate)
+
+    def search_results(self, request):
+        now = time.strftime('%Y-%m-%dT%H:%M:%S')
+        return [
+            {'id': uuid.uuid4().hex, 'memory': f"用户之前提到过的第{i + 1}件事", 'score': 0.9 - i * 0.1,
+             'metadata': {'importance': 'medium', 'timestamp': int(time.time())}, 'created_at': now}
+            for i in range(self.results)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动本地LLM与Mem0替身服务')
+    parser.add_argument('--llm-port', type=int, default=18001)
+    parser.add_argument('--mem0-port', type=int, default=18002)
+    parser.add_argument('--llm-latency-ms', type=float, default=300)
+    parser.add_argument('--tokens-per-second', type=float, default=40)
+    parser.add_argument('--reply-tokens', type=int, default=120)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--mem0-latency-ms', type=float, default=80)
+    parser.add_argument('--mem0-error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    llm = FakeLLMServer(port=args.llm_port, latency_ms=args.llm_latency_ms, tokens_per_second=args.tokens_per_second,
+                        reply_tokens=args.reply_tokens, error_rate=args.llm_error_rate).start()
+    mem0 = FakeMem0Server(port=args.mem0_port, latency_ms=args.mem0_latency_ms,
+                          error_rate=args.mem0_error_rate).start()
+    print(f"AI_API_BASE={llm.url}/v1")
+    print(f"MEM0_HOST={mem0.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        llm.stop()
+        mem0.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+"""
+/api/chat 并发压测
+在本进程中启动LLM与Mem0替身服务（见 fake_servers.py），用 create_app() 创建应用并以多线程HTTP服务运行，
+再由N个并发SSE客户端各发送若干轮对话，统计吞吐量、首字延迟（TTFT）分位数与每个会话的内存占用。
+结果保存为JSON文件，指定 --baseline 时与之前的结果对比。
+
+运行方式（在项目目录下）:
+    python benchmarks/load_test.py --clients 50 --turns 3
+    python benchmarks/load_test.py --clients 50 --baseline benchmarks/results/load_test-20240101-120000.json
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from benchmarks.fake_servers import FakeLLMServer, FakeMem0Server
+
+# 与基线对比的指标：(名称, 数值越大越好)
+_COMPARED = [
+    ('turns_per_second', True),
+    ('tokens_per_second', True),
+    ('ttft_ms.p50', False),
+    ('ttft_ms.p95', False),
+    ('ttft_ms.p99', False),
+    ('turn_ms.p95', False),
+    ('error_rate', False),
+    ('memory.rss_bytes_per_session', False),
+]
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """
+    计算分位数（最近秩法）
+
+    Args:
+        values: 数值列表
+        points: 百分位
+
+    Returns:
+        dict: {'p50': ..., 'p95': ..., 'p99': ..., 'max': ...}，保留两位小数
+    """
+    if not values:
+        return {f"p{p}": None for p in points} | {'max': None}
+    ordered = sorted(values)
+    result = {}
+    for p in points:
+        index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+        result[f"p{p}"] = round(ordered[index], 2)
+    result['max'] = round(ordered[-1], 2)
+    return result
+
+
+def current_rss():
+    """
+    读取当前进程的常驻内存
+
+    Returns:
+        int: 字节数
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # 非Linux系统退回到峰值内存（macOS单位为字节，其余为KB）
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def add_stub_arguments(parser):
+    """
+    添加替身服务相关的命令行参数
+
+    Args:
+        parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--llm-latency-ms', type=float, default=300, help='替身模型首个token前的延迟')
+    parser.add_argument('--tokens-per-second', type=float, default=40, help='替身模型每个流的输出速度')
+    parser.add_argument('--reply-tokens', type=int, default=120, help='替身模型每次回复的token数')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='替身模型返回错误的概率')
+    parser.add_argument('--mem0-latency-ms', type=float, default=80, help='替身Mem0每个请求的延迟')
+    parser.add_argument('--mem0-error-rate', type=float, default=0.0, help='替身Mem0返回错误的概率')
+    parser.add_argument('--no-mem0', action='store_true', help='关闭长期记忆')
+
+
+def start_stub_servers(args):
+    """
+    按命令行参数启动LLM与Mem0替身服务
+
+    Args:
+        args: 包含 add_stub_arguments() 所添加参数的命令行参数
+
+    Returns:
+        tuple: (FakeLLMServer, FakeMem0Server)
+    """
+    llm = FakeLLMServer(latency_ms=args.llm_latency_ms, tokens_per_second=args.tokens_per_second,
+                        reply_tokens=args.reply_tokens, error_rate=args.llm_error_rate).start()
+    mem0 = FakeMem0Server(latency_ms=args.mem0_latency_ms, error_rate=args.mem0_error_rate).start()
+    return llm, mem0
+
+
+def configure_environment(llm, mem0, workdir, mem0_enabled=True, max_concurrent=64):
+    """
+    在导入应用之前设置环境变量，使应用连接替身服务与临时数据库
+
+    Args:
+        llm: FakeLLMServer
+        mem0: FakeMem0Server
+        workdir: 临时目录
+        mem0_enabled: 是否启用长期记忆
+        max_concurrent: 准入控制的并发上限
+    """
+    os.environ.update({
+        'AI_API_BASE': f"{llm.url}/v1",
+        'DASHSCOPE_API_KEY': 'sk-bench',
+        'SECRET_KEY': 'bench-secret',
+        'MEM0_HOST': mem0.url,
+        'MEM0_API_KEY': 'bench',
+        'MEM0_ENABLED': 'True' if mem0_enabled else 'False',
+        'MEMORY_BACKEND': 'mem0',
+        'MEM0_TELEMETRY': 'False',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'STATE_BACKEND': 'memory',
+        'CHAT_MAX_CONCURRENT': str(max(max_concurrent, 1)),
+        'CHAT_QUEUE_SIZE': str(max(max_concurrent, 1)),
+        'TRACE_SAMPLE_RATE': '0',
+        'CAPTURE_ENABLED': 'False',
+    })
+
+
+def start_app():
+    """
+    用 create_app() 创建应用并在后台线程中以多线程HTTP服务运行（需先调用 configure_environment）
+
+    Returns:
+        tuple: (werkzeug服务对象, 应用地址)
+    """
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from app import create_app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    app = create_app('production')
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='bench-app', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run_client(base_url, index, turns, start_barrier, results):
+    """
+    单个SSE客户端：使用独立的用户与对话，依次发送 turns 轮消息
+
+    Args:
+        base_url: 应用地址
+        index: 客户端编号
+        turns: 对话轮数
+        start_barrier: 所有客户端同时开始的栅栏
+        results: 结果列表，追加 (ttft_ms, turn_ms, 回复字符数, 错误信息)
+    """
+    username = f"bench{index}@example.com"
+    with httpx.Client(base_url=base_url, timeout=300) as client:
+        start_barrier.wait()
+        for turn in range(turns):
+            payload = {'message': f"第{turn + 1}个问题：请介绍一下你自己", 'username': username,
+                       'chat_id': f"bench-{index}"}
+            start = time.perf_counter()
+            ttft = None
+            chars = 0
+            error = None
+            try:
+                with client.stream('POST', '/api/chat', json=payload) as response:
+                    if response.status_code != 200:
+                        error = f"HTTP {response.status_code}"
+                    for line in response.iter_lines():
+                        if not line.startswith('data:'):
+                            continue
+                        try:
+                            event = json.loads(line[5:])
+                        except ValueError:
+                            error = error or line[:80]
+                            continue
+                        if 'error' in event:
+                            error = event['error']
+                        elif event.get('reply'):
+                            if ttft is None:
+                                ttft = (time.perf_counter() - start) * 1000
+                            chars += len(event['reply'])
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+            results.append((ttft, (time.perf_counter() - start) * 1000, chars, error))
+
+
+def run_load_test(args):
+    """
+    执行压测
+
+    Args:
+        args: 命令行参数
+
+    Returns:
+        dict: 压测结果
+    """
+    llm, mem0 = start_stub_servers(args)
+    workdir = tempfile.mkdtemp(prefix='starpal-bench-')
+    configure_environment(llm, mem0, workdir, mem0_enabled=not args.no_mem0, max_concurrent=args.clients)
+    server, base_url = start_app()
+    from backend.services.ai_service import ai_service
+
+    # 预热一轮，排除首次请求时创建模型客户端等一次性开销
+    warmup_results = []
+    run_client(base_url, 'warmup', 1, threading.Barrier(1), warmup_results)
+    rss_before = current_rss()
+    sessions_before = ai_service.get_memory_count()
+    tokens_before = llm.stats()['tokens_sent']
+
+    results = []
+    barrier = threading.Barrier(args.clients)
+    clients = [
+        threading.Thread(target=run_client, args=(base_url, i, args.turns, barrier, results))
+        for i in range(args.clients)
+    ]
+    started = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    rss_after = current_rss()
+    sessions = ai_service.get_memory_count() - sessions_before
+    session_stats = ai_service.get_session_stats()['memories']
+    tokens = llm.stats()['tokens_sent'] - tokens_before
+    if not args.no_mem0:
+        ai_service.mem0_write_queue.shutdown(timeout=10)
+    server.shutdown()
+    llm.stop()
+    mem0.stop()
+
+    succeeded = [r for r in results if r[3] is None]
+    errors = {}
+    for r in results:
+        if r[3] is not None:
+            errors[r[3]] = errors.get(r[3], 0) + 1
+    return {
+        'clients': args.clients,
+        'turns_per_client': args.turns,
+        'turns': len(results),
+        'succeeded': len(succeeded),
+        'error_rate': round(1 - len(succeeded) / len(results), 4) if results else 0.0,
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 2),
+        'turns_per_second': round(len(succeeded) / elapsed, 2),
+        'tokens_per_second': round(tokens / elapsed, 1),
+        'ttft_ms': percentiles([r[0] for r in succeeded if r[0] is not None]),
+        'turn_ms': percentiles([r[1] for r in succeeded]),
+        'memory': {
+            'sessions': sessions,
+            'rss_before_bytes': rss_before,
+            'rss_after_bytes': rss_after,
+            'rss_bytes_per_session': (rss_after - rss_before) // sessions if sessions > 0 else None,
+            # 会话存储按消息内容估算的字节数（共享状态后端没有该项）
+            'session_store_bytes_per_session': session_stats['bytes'] // max(session_stats['entries'], 1)
+            if 'bytes' in session_stats else None,
+        },
+        'upstream': {'llm': llm.stats(), 'mem0': mem0.stats()},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def lookup(result, dotted):
+    value = result
+    for part in dotted.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def print_report(result, baseline=None):
+    """
+    打印压测报告，提供基线时显示变化百分比
+
+    Args:
+        result: 本次结果
+        baseline: 基线结果
+    """
+    print(f"\n客户端: {result['clients']}  每客户端轮数: {result['turns_per_client']}  "
+          f"耗时: {result['elapsed_seconds']} s")
+    print(f"成功: {result['succeeded']}/{result['turns']}  错误率: {result['error_rate']:.2%}")
+    for message, count in result['errors'].items():
+        print(f"  {count} x {message}")
+    print(f"吞吐量: {result['turns_per_second']} 轮/秒, {result['tokens_per_second']} token/秒")
+    print(f"TTFT(ms): {result['ttft_ms']}")
+    print(f"单轮耗时(ms): {result['turn_ms']}")
+    print(f"内存: {result['memory']}")
+
+    if baseline:
+        print(f"\n与基线对比 ({baseline.get('timestamp')}, {baseline.get('git_revision')}):")
+        for name, higher_is_better in _COMPARED:
+            current, previous = lookup(result, name), lookup(baseline, name)
+            if current is None or previous is None:
+                continue
+            if previous:
+                change = (current - previous) / previous * 100
+            else:
+                change = math.inf if current > 0 else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            mark = '' if abs(change) < 1 else ('  改善' if better else '  退化')
+            print(f"  {name:<32} {previous:>12} -> {current:<12} {change:+.1f}%{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/api/chat 并发压测')
+    parser.add_argument('--clients', type=int, default=20, help='并发SSE客户端数')
+    parser.add_argument('--turns', type=int, default=3, help='每个客户端发送的对话轮数')
+    add_stub_arguments(parser)
+    parser.add_argument('--output-dir', default=os.path.join(PROJECT_DIR, 'benchmarks', 'results'),
+                        help='结果保存目录')
+    parser.add_argument('--baseline', help='用于对比的历史结果文件')
+    parser.add_argument('--label', default='', help='写入结果文件的说明')
+    args = parser.parse_args()
+
+    result = run_load_test(args)
+    result.update({
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'git_revision': git_revision(),
+        'label': args.label,
+        'args': {k: v for k, v in vars(args).items() if k not in ('output_dir', 'baseline')},
+    })
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"load_test-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+"""
+录制请求回放（性能回归测试）
+读取 CAPTURE_ENABLED 录制的请求序列（见 backend/services/request_capture.py），在本进程中启动LLM与Mem0替身服务
+和应用，为每个用户假名注册一个回放用户，按录制的到达时间（可用 --speed 加速）与每个用户的请求顺序回放，
+统计各接口的延迟分布（/api/chat 另统计首字延迟TTFT）。
+结果保存为JSON文件；指定 --baseline 时与基线逐接口对比，任一指标的退化超过 --threshold 时以退出码1结束。
+
+运行方式（在项目目录下）:
+    python benchmarks/replay.py data/capture/capture-20240101-120000-1234.jsonl.gz --speed 4
+    python benchmarks/replay.py data/capture/ --baseline benchmarks/results/replay-20240101-130000.json --threshold 15
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from benchmarks.load_test import (add_stub_arguments, configure_environment, git_revision, lookup, percentiles,
+                                  start_app, start_stub_servers)
+
+# 回放用户的密码（注册与登录使用）
+_REPLAY_PASSWORD = 'replay-pass'
+# 与基线对比的延迟指标
+_COMPARED = ['latency_ms.p50', 'latency_ms.p95', 'ttft_ms.p50', 'ttft_ms.p95']
+
+
+def load_captures(paths):
+    """
+    读取录制文件（或目录下的全部录制文件），按各文件的录制开始时间对齐到同一时间轴
+
+    Args:
+        paths: 文件或目录路径列表
+
+    Returns:
+        tuple: (按到达时间排序的记录列表, 录制文件名列表)
+    """
+    # 应用配置在导入时读取环境变量，需在 configure_environment() 之后导入
+    from backend.services.request_capture import read_capture
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith('.jsonl.gz'))
+        else:
+            files.append(path)
+
+    loaded = [read_capture(path) for path in files]
+    origin = min((header.get('started', 0) for header, _ in loaded), default=0)
+    records = []
+    for header, items in loaded:
+        offset = header.get('started', origin) - origin
+        for item in items:
+            item['t'] = item['t'] + offset
+            records.append(item)
+    records.sort(key=lambda item: item['t'])
+    return records, [os.path.basename(path) for path in files]
+
+
+def replay_username(user):
+    """用户假名对应的回放账号"""
+    return f"{user}@replay.test"
+
+
+def create_user(client, user):
+    """
+    注册并登录回放用户
+
+    Args:
+        client: 指向应用的httpx.Client
+        user: 用户假名
+
+    Returns:
+        str: 登录令牌
+    """
+    username = replay_username(user)
+    client.post('/api/register', json={'username': username, 'password': _REPLAY_PASSWORD, 'name': 'replay'})
+    response = client.post('/api/login', json={'username': username, 'password': _REPLAY_PASSWORD})
+    response.raise_for_status()
+    return response.json()['token']
+
+
+def send(client, record, token):
+    """
+    回放单个请求
+
+    Args:
+        client: 指向应用的httpx.Client
+        record: 录制记录
+        token: 回放用户的登录令牌
+
+    Returns:
+        tuple: (状态码, ttft毫秒, 总耗时毫秒, 错误信息)
+    """
+    body = record.get('b')
+    if isinstance(body, dict) and 'username' in body:
+        body = dict(body, username=replay_username(record['u']))
+    headers = {'Authorization': f"Bearer {token}"} if record.get('a') else {}
+    kwargs = {'params': record.get('q'), 'headers': headers}
+    if body is not None:
+        kwargs['json'] = body
+
+    start = time.perf_counter()
+    status, ttft, error = None, None, None
+    try:
+        with client.stream(record['m'], record['p'], **kwargs) as response:
+            status = response.status_code
+            if response.headers.get('content-type', '').startswith('text/event-stream'):
+                for line in response.iter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    try:
+                        event = json.loads(line[5:])
+                    except ValueError:
+                        continue
+                    if 'error' in event:
+                        error = event['error']
+                    elif event.get('reply') and ttft is None:
+                        ttft = (time.perf_counter() - start) * 1000
+            else:
+                response.read()
+    except httpx.HTTPError as e:
+        error = f"{type(e).__name__}: {e}"
+    if error is None and status is not None and status >= 500:
+        error = f"HTTP {status}"
+    return status, ttft, (time.perf_counter() - start) * 1000, error
+
+
+def replay_user(client, records, token, started, speed, results):
+    """
+    按录制顺序回放单个用户的请求
+
+    Args:
+        client: 指向应用的httpx.Client
+        records: 该用户的录制记录（按时间排序）
+        token: 回放用户的登录令牌
+        started: 回放开始时刻（time.perf_counter()）
+        speed: 时间轴加速倍数，0表示不等待、连续发送
+        results: 结果列表，追加 (记录, 状态码, ttft, 总耗时, 错误信息, 调度延迟毫秒)
+    """
+    for record in records:
+        lag = 0.0
+        if speed > 0:
+            due = started + record['t'] / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # 前一个请求尚未完成导致晚于录制时间发出
+                lag = -delay * 1000
+        results.append((record, *send(client, record, token), lag))
+
+
+def summarize(results, elapsed):
+    """
+    按接口汇总回放结果
+
+    Args:
+        results: replay_user() 追加的结果列表
+        elapsed: 回放耗时（秒）
+
+    Returns:
+        dict: 总体与各接口的统计
+    """
+    endpoints = {}
+    for record, status, ttft, total, error, lag in results:
+        key = f"{record['m']} {record['r']}"
+        item = endpoints.setdefault(key, {'latency': [], 'ttft': [], 'captured': [], 'errors': 0,
+                                          'status_mismatch': 0, 'count': 0})
+        item['count'] += 1
+        if error is not None:
+            item['errors'] += 1
+            continue
+        if status != record.get('s'):
+            item['status_mismatch'] += 1
+        item['latency'].append(total)
+        if ttft is not None:
+            item['ttft'].append(ttft)
+        if record.get('d') is not None:
+            item['captured'].append(record['d'])
+
+    errors = sum(item['errors'] for item in endpoints.values())
+    return {
+        'requests': len(results),
+        'errors': errors,
+        'error_rate': round(errors / len(results), 4) if results else 0.0,
+        'elapsed_seconds': round(elapsed, 2),
+        'schedule_lag_ms': percentiles([r[5] for r in results]),
+        'endpoints': {
+            key: {
+                'count': item['count'],
+                'errors': item['errors'],
+                'error_rate': round(item['errors'] / item['count'], 4),
+                'status_mismatch': item['status_mismatch'],
+                'latency_ms': percentiles(item['latency']),
+                'ttft_ms': percentiles(item['ttft']) if item['ttft'] else None,
+                # 录制环境中的实际耗时，仅供参考（依赖真实上游服务，不参与对比）
+                'captured_ms': percentiles(item['captured']),
+            }
+            for key, item in sorted(endpoints.items())
+        }
+    }
+
+
+def run_replay(args):
+    """
+    执行回放
+
+    Args:
+        args: 命令行参数
+
+    Returns:
+        dict: 回放结果
+    """
+    llm, mem0 = start_stub_servers(args)
+    workdir = tempfile.mkdtemp(prefix='starpal-replay-')
+    configure_environment(llm, mem0, workdir, mem0_enabled=not args.no_mem0, max_concurrent=args.max_concurrent)
+
+    records, files = load_captures(args.captures)
+    if not records:
+        raise SystemExit('录制文件中没有可回放的请求')
+    users = {}
+    for record in records:
+        users.setdefault(record['u'], []).append(record)
+    if args.max_users:
+        users = dict(list(users.items())[:args.max_users])
+        records = [record for items in users.values() for record in items]
+    t0 = min(record['t'] for record in records)
+    for record in records:
+        record['t'] -= t0
+
+    server, base_url = start_app()
+    from backend.services.ai_service import ai_service
+
+    limits = httpx.Limits(max_connections=len(users) + 8, max_keepalive_connections=len(users) + 8)
+    with httpx.Client(base_url=base_url, timeout=300, limits=limits) as client:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            tokens = dict(zip(users, executor.map(lambda user: create_user(client, user), users)))
+        # 预热一轮，排除首次请求时创建模型客户端等一次性开销
+        send(client, {'m': 'POST', 'p': '/api/chat', 'u': 'warmup',
+                      'b': {'username': '', 'chat_id': 'warmup', 'message': '你好'}}, None)
+
+        results = []
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=replay_user,
+                             args=(client, items, tokens[user], started, args.speed, results))
+            for user, items in users.items()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    if not args.no_mem0:
+        ai_service.mem0_write_queue.shutdown(timeout=10)
+    server.shutdown()
+    llm.stop()
+    mem0.stop()
+
+    result = summarize(results, elapsed)
+    result['capture'] = {
+        'files': files,
+        'users': len(users),
+        'requests': len(records),
+        'duration_seconds': round(max(record['t'] for record in records), 2),
+    }
+    result['upstream'] = {'llm': llm.stats(), 'mem0': mem0.stats()}
+    return result
+
+
+def compare(result, baseline, threshold, min_delta_ms, max_error_increase):
+    """
+    与基线逐接口对比
+
+    Args:
+        result: 本次结果
+        baseline: 基线结果
+        threshold: 延迟指标允许的最大增幅（百分比）
+        min_delta_ms: 增幅超过阈值但绝对增量小于该值时不视为退化（避免极短接口的噪声）
+        max_error_increase: 错误率允许的最大增量
+
+    Returns:
+        tuple: (对比行列表, 退化描述列表)
+    """
+    rows, regressions = [], []
+    for key, current in result['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(key)
+        if previous is None:
+            continue
+        for name in _COMPARED:
+            now, before = lookup(current, name), lookup(previous, name)
+            if now is None or before is None:
+                continue
+            change = (now - before) / before * 100 if before else 0.0
+            regressed = change > threshold and now - before >= min_delta_ms
+            rows.append((key, name, before, now, change, regressed))
+            if regressed:
+                regressions.append(f"{key} {name}: {before} -> {now} ms ({change:+.1f}%)")
+        increase = current['error_rate'] - previous.get('error_rate', 0)
+        if increase > max_error_increase:
+            regressions.append(f"{key} error_rate: {previous.get('error_rate', 0):.2%} -> {current['error_rate']:.2%}")
+    return rows, regressions
+
+
+def print_report(result):
+    """打印回放报告"""
+    capture = result['capture']
+    print(f"\n录制: {capture['requests']} 个请求, {capture['users']} 个用户, 时长 {capture['duration_seconds']} s")
+    print(f"回放耗时: {result['elapsed_seconds']} s  错误率: {result['error_rate']:.2%}  "
+          f"调度延迟(ms): {result['schedule_lag_ms']}")
+    for key, item in result['endpoints'].items():
+        print(f"\n{key}  (n={item['count']}, 错误 {item['errors']}, 状态码不一致 {item['status_mismatch']})")
+        print(f"  延迟(ms): {item['latency_ms']}")
+        if item['ttft_ms']:
+            print(f"  TTFT(ms): {item['ttft_ms']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回放录制的请求序列并与基线对比延迟分布')
+    parser.add_argument('captures', nargs='+', help='录制文件或录制目录')
+    parser.add_argument('--speed', type=float, default=1.0, help='时间轴加速倍数，0表示每个用户连续发送')
+    parser.add_argument('--max-users', type=int, default=0, help='只回放最先出现的N个用户，0表示全部')
+    parser.add_argument('--max-concurrent', type=int, default=64, help='应用的聊天并发上限（CHAT_MAX_CONCURRENT）')
+    add_stub_arguments(parser)
+    parser.add_argument('--output-dir', default=os.path.join(PROJECT_DIR, 'benchmarks', 'results'),
+                        help='结果保存目录')
+    parser.add_argument('--baseline', help='用于对比的历史回放结果文件')
+    parser.add_argument('--threshold', type=float, default=20.0, help='延迟分位数允许的最大增幅（百分比）')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='视为退化的最小绝对增量（毫秒）')
+    parser.add_argument('--max-error-increase', type=float, default=0.01, help='错误率允许的最大增量')
+    parser.add_argument('--label', default='', help='写入结果文件的说明')
+    args = parser.parse_args()
+
+    result = run_replay(args)
+    result.update({
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'git_revision': git_revision(),
+        'label': args.label,
+        'args': {k: v for k, v in vars(args).items() if k not in ('output_dir', 'baseline', 'captures')},
+    })
+    print_report(result)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"replay-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {path}")
+
+    if not args.baseline:
+        return
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('capture', {}).get('files') != result['capture']['files']:
+        print('\n注意: 基线使用的录制文件与本次不同，对比结果仅供参考')
+    rows, regressions = compare(result, baseline, args.threshold, args.min_delta_ms, args.max_error_increase)
+    print(f"\n与基线对比 ({baseline.get('timestamp')}, {baseline.get('git_revision')}), 阈值 +{args.threshold}%:")
+    for key, name, before, now, change, regressed in rows:
+        print(f"  {key:<40} {name:<16} {before:>10} -> {now:<10} {change:+.1f}%{'  退化' if regressed else ''}")
+    if regressions:
+        print(f"\n性能退化 {len(regressions)} 项:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print('\n未发现超过阈值的退化')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+gunicorn 多进程部署配置
+
+启动方式（在 app.py 所在目录执行）:
+    STATE_BACKEND=sqlite gunicorn -c gunicorn.conf.py wsgi:app
+
+多个worker之间不共享内存，必须将 STATE_BACKEND 设置为 sqlite（单机）或 redis（多机），
+否则同一对话的后续消息可能被分配到没有上下文的worker，长期记忆列表也不会返回ETag/304。
+本地长期记忆后端（MEMORY_BACKEND=local）只支持单进程，多worker时拒绝启动。
+"""
+import os
+import sys
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', 5000)}")
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# 流式响应会长时间占用连接，使用线程型worker
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+# 单次流式响应可能持续数十秒
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+# 每个worker各自创建应用：AIService的后台线程与网络连接不能跨fork共享
+preload_app = False
+
+
+def on_starting(server):
+    """启动前检查多worker部署是否配置了共享状态后端"""
+    # 命令行的 -w 会覆盖本文件的 workers；写入环境变量后由worker进程中的 Config.WEB_CONCURRENCY 读取，
+    # 必须在导入 Config 之前设置（worker由主进程fork，会继承已导入的模块）
+    count = server.cfg.workers
+    os.environ['WEB_CONCURRENCY'] = str(count)
+    from backend.config.config import Config
+
+    if count > 1 and Config.MEM0_ENABLED and Config.MEMORY_BACKEND.lower() == 'local':
+        server.log.error(
+            "WEB_CONCURRENCY=%s 但 MEMORY_BACKEND=local，本地长期记忆后端只支持单进程，"
+            "请使用 MEMORY_BACKEND=mem0 或将 WEB_CONCURRENCY 设置为1", count
+        )
+        sys.exit(1)
+
+    if count > 1 and Config.STATE_BACKEND.lower() in ('memory', 'local'):
+        server.log.warning(
+            "WEB_CONCURRENCY=%s 但 STATE_BACKEND=%s，各worker的会话状态与长期记忆版本号互不可见"
+            "（记忆列表不返回ETag），请设置 STATE_BACKEND=sqlite 或 redis", count, Config.STATE_BACKEND
+        )
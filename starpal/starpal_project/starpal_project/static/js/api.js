@@ -25,9 +25,9 @@ class ApiClient {
             };
             
             // 添加认证头（如果用户已登录）
-            const currentUser = localStorage.getItem('currentUser');
-            if (currentUser) {
-                config.headers['Authorization'] = `Bearer ${currentUser}`;
+            const token = localStorage.getItem('authToken');
+            if (token) {
+                config.headers['Authorization'] = `Bearer ${token}`;
             }
 
             if (data && method !== 'GET') {
@@ -110,8 +110,9 @@ class ApiClient {
         };
         
         // 添加认证头
-        if (username) {
-            config.headers['Authorization'] = `Bearer ${username}`;
+        const token = localStorage.getItem('authToken');
+        if (token) {
+            config.headers['Authorization'] = `Bearer ${token}`;
         }
 
         if (signal) {
@@ -168,12 +169,18 @@ class ApiClient {
     }
 
     /**
-     * 获取用户的长期记忆
-     * @param {number} limit - 返回记忆数量限制
-     * @returns {Promise} 长期记忆列表
+     * 获取用户的长期记忆（分页）
+     * 服务端返回ETag，浏览器缓存在记忆未变化时以304重新验证，不重复下载列表
+     * @param {number} limit - 每页记忆数量（服务端限制最大值）
+     * @param {string} cursor - 上一页返回的 next_cursor，为空时获取第一页
+     * @returns {Promise} 长期记忆列表，next_cursor 为下一页游标（没有更多时为null）
      */
-    async getLongTermMemories(limit = 10) {
-        return await this.request(`/api/memory/long-term?limit=${limit}`, null, 'GET');
+    async getLongTermMemories(limit = 10, cursor = null) {
+        let endpoint = `/api/memory/long-term?limit=${limit}`;
+        if (cursor) {
+            endpoint += `&cursor=${encodeURIComponent(cursor)}`;
+        }
+        return await this.request(endpoint, null, 'GET');
     }
 
     /**
@@ -200,6 +207,15 @@ class ApiClient {
         return await this.request(`/api/memory/long-term/${memoryId}`, null, 'DELETE');
     }
 
+    /**
+     * 批量更新/删除长期记忆
+     * @param {Array} operations - 操作列表，如 { op: 'delete', id } 或 { op: 'update', id, text, metadata }
+     * @returns {Promise} 批量结果，results 与 operations 顺序一致，包含每项的 success 与 message
+     */
+    async batchLongTermMemories(operations) {
+        return await this.request('/api/memory/long-term/batch', { operations }, 'POST');
+    }
+
     /**
      * 清除所有长期记忆
      * @returns {Promise} 清除结果
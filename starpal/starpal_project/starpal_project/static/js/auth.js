@@ -163,7 +163,7 @@ class AuthManager {
             
             // 登录成功
             if (data.username) {
-                storageManager.setCurrentUser(data.username, data.name);
+                storageManager.setCurrentUser(data.username, data.name, data.token);
                 // 登录后强制新建新对话并设为当前
                 if (typeof storageManager.createNewChat === 'function') {
                     const newChat = storageManager.createNewChat();
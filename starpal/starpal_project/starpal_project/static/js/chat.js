@@ -248,6 +248,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 const reader = response.body.getReader();
                 const decoder = new TextDecoder('utf-8');
                 let fullReply = '';
+                // 一帧可能被拆分到多次读取中，未以空行结尾的部分留到下次拼接
+                let pending = '';
                 function readStream() {
                     reader.read().then(({ done, value }) => {
                         if (done) {
@@ -255,8 +257,9 @@ document.addEventListener('DOMContentLoaded', function() {
                             delete aiStreamCache[currentChatId];
                             return;
                         }
-                        const chunk = decoder.decode(value, { stream: true });
-                        const lines = chunk.split('\n\n');
+                        pending += decoder.decode(value, { stream: true });
+                        const lines = pending.split('\n\n');
+                        pending = lines.pop();
                         lines.forEach(line => {
                             if (line.startsWith('data: ')) {
                                 try {
@@ -20,19 +20,30 @@ class StorageManager {
      * 设置当前登录用户
      * @param {string} username - 用户名
      * @param {string} name - 显示名称
+     * @param {string} token - 登录接口签发的身份令牌
      */
-    setCurrentUser(username, name) {
+    setCurrentUser(username, name, token) {
         localStorage.setItem('currentUser', username);
         localStorage.setItem('currentName', name);
+        localStorage.setItem('authToken', token);
         this.currentUser = username;
     }
 
+    /**
+     * 获取身份令牌
+     * @returns {string|null} 令牌
+     */
+    getAuthToken() {
+        return localStorage.getItem('authToken');
+    }
+
     /**
      * 清除当前用户信息
      */
     clearCurrentUser() {
         localStorage.removeItem('currentUser');
         localStorage.removeItem('currentName');
+        localStorage.removeItem('authToken');
         this.currentUser = null;
     }
 
@@ -264,7 +275,8 @@ class StorageManager {
      * @returns {boolean} 是否已登录
      */
     isLoggedIn() {
-        return !!this.currentUser;
+        // 旧版本登录时没有令牌，需要重新登录
+        return !!this.currentUser && !!this.getAuthToken();
     }
 
     /**
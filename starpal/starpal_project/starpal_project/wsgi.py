@@ -0,0 +1,7 @@
+"""
+WSGI入口
+供gunicorn等多进程服务器加载，启动方式见 gunicorn.conf.py
+"""
+from app import create_app
+
+app = create_app()